@@ -0,0 +1,156 @@
+"""
+I/O benchmark for this service's S3 download path, run without AWS.
+
+Seeds a LocalObjectStore (common/object_store.py) with synthetic documents and
+points the service's S3 client at it, then measures:
+  * single-file latency of the download path, cold (empty download cache) and warm
+  * directory download throughput
+  * download cache hit rate, where the service has the cache
+
+--latency-ms adds a fixed delay to every object store request to approximate
+network round trips; leave it at 0 to measure local overhead only.
+
+Run from the service root:
+    python -m benchmarks.io_benchmark
+    python -m benchmarks.io_benchmark --files 200 --size-kb 512 --latency-ms 20
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+BUCKET = 'benchmark-bucket'
+PREFIX = 'benchmark/'
+SINGLE_KEY = PREFIX + 'single/document.pdf'
+DIRECTORY_PREFIX = PREFIX + 'directory/'
+
+
+def configure(work_dir, latency_ms):
+    # Must run before common.* is imported: those modules read their settings at import time.
+    os.environ['object_store_backend'] = 'local'
+    os.environ['object_store_root'] = os.path.join(work_dir, 'store')
+    os.environ['object_store_latency_ms'] = str(latency_ms)
+    os.environ['s3_cache_dir'] = os.path.join(work_dir, 'cache')
+
+
+def seed(store, files, size_kb, single_size_kb):
+    os.makedirs(os.path.join(store.root, BUCKET), exist_ok=True)
+    store.put_object(Bucket=BUCKET, Key=SINGLE_KEY, Body=os.urandom(single_size_kb * 1024))
+    for index in range(files):
+        # Two levels so listing has prefixes to fan out over.
+        key = f'{DIRECTORY_PREFIX}part{index % 4}/document{index:04d}.pdf'
+        store.put_object(Bucket=BUCKET, Key=key, Body=os.urandom(size_kb * 1024))
+
+
+def download_paths(s3_operations):
+    '''
+    Returns (single_file, directory) callables for the service's download API:
+    S3Helper in most services, S3Operations in m5.
+    '''
+    if hasattr(s3_operations, 'S3Helper'):
+        helper = s3_operations.S3Helper(BUCKET)
+
+        def single_file(local_path):
+            helper.download_file_from_s3(SINGLE_KEY, local_path)
+
+        if hasattr(helper, 'download_directory_concurrent'):
+            def directory(local_dir):
+                helper.download_directory_concurrent(DIRECTORY_PREFIX, local_dir)
+        else:
+            def directory(local_dir):
+                helper.download_directory(DIRECTORY_PREFIX, local_dir)
+        return single_file, directory
+
+    operations = s3_operations.S3Operations(BUCKET)
+
+    def single_file(local_path):
+        asyncio.run(operations.download_file(f's3://{BUCKET}/{SINGLE_KEY}', local_path))
+
+    def directory(local_dir):
+        operations.download_directory(DIRECTORY_PREFIX, local_dir)
+    return single_file, directory
+
+
+def clear_cache(cache):
+    if cache is None:
+        return
+    for name in os.listdir(cache.cache_dir):
+        path = os.path.join(cache.cache_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    return statistics.mean(timings), statistics.median(timings), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20, help='Single-file downloads per mode')
+    parser.add_argument('--files', type=int, default=100, help='Objects in the benchmark directory')
+    parser.add_argument('--size-kb', type=int, default=256, help='Size of each directory object')
+    parser.add_argument('--single-size-kb', type=int, default=20 * 1024, help='Size of the single-file object')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every object store request')
+    parser.add_argument('--work-dir', default=None, help='Where to keep the store and cache (default: a temp dir)')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='nn_io_benchmark_')
+    configure(work_dir, args.latency_ms)
+
+    object_store = importlib.import_module('common.object_store')
+    s3_operations = importlib.import_module('common.s3_operations')
+    try:
+        cache = importlib.import_module('common.download_cache').get_download_cache()
+    except ImportError:
+        cache = None
+
+    store = object_store.get_local_object_store()
+    seed(store, args.files, args.size_kb, args.single_size_kb)
+    single_file, directory = download_paths(s3_operations)
+    out_dir = os.path.join(work_dir, 'out')
+
+    try:
+        print(f"{'single file':<14} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+        for mode in ('cold', 'warm'):
+            timings = []
+            for index in range(args.requests):
+                if mode == 'cold':
+                    clear_cache(cache)
+                local_path = os.path.join(out_dir, mode, f'{index}.pdf')
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                start = time.perf_counter()
+                single_file(local_path)
+                timings.append((time.perf_counter() - start) * 1000)
+            mean, p50, p95 = summarize(timings)
+            print(f"{mode:<14} {mean:>10.2f} {p50:>10.2f} {p95:>10.2f}")
+
+        total_mb = args.files * args.size_kb / 1024
+        print(f"\n{'directory':<14} {'files':>10} {'MB':>10} {'seconds':>10} {'MB/s':>10}")
+        for mode in ('cold', 'warm'):
+            if mode == 'cold':
+                clear_cache(cache)
+            local_dir = os.path.join(out_dir, f'directory_{mode}')
+            start = time.perf_counter()
+            directory(local_dir)
+            seconds = time.perf_counter() - start
+            print(f"{mode:<14} {args.files:>10} {total_mb:>10.1f} {seconds:>10.2f} {total_mb / seconds:>10.1f}")
+
+        if cache is None:
+            print("\ndownload cache: not used by this service's download path")
+        else:
+            stats = cache.get_stats()
+            print(f"\ndownload cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions, hit rate {stats['hit_rate']:.1%}")
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import io
+import mmap
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+mapped_files_enabled = os.getenv('mapped_files_enabled', 'true').lower() in ('1', 'true', 'yes')
+
+
+class MappedFile(io.RawIOBase):
+    '''
+    Read-only binary file over a memory map of a local file. Reads are served
+    from the OS page cache, which every process mapping the same file shares,
+    so concurrent workers reading one document (page shards, checks running
+    side by side) do not each keep a private copy of it. getbuffer() returns a
+    zero-copy view of the whole file for readers that take a buffer; the file
+    stays mapped for as long as such a view is alive, also after close().
+
+        with MappedFile(path) as file:
+            zipfile.ZipFile(file), fitz.open(stream=file.getbuffer(), filetype='pdf')
+    '''
+    def __init__(self, source) -> None:
+        '''
+        Maps a path, or the whole of a binary file opened on a local file (which
+        the caller may close). Raises ValueError for an empty file, which cannot
+        be mapped.
+        '''
+        super().__init__()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.name = os.fspath(source)
+        else:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            self.name = getattr(source, 'name', None)
+        self._view = memoryview(self._map)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def getbuffer(self) -> memoryview:
+        # A view of its own holds an export on the map, which stops close()
+        # from unmapping memory a reader still points into.
+        return memoryview(self._map)
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        data = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position:self._position + len(buffer)]
+        count = len(data)
+        buffer[:count] = data
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._view.release()
+                self._map.close()
+            except BufferError:
+                # A view from getbuffer() is still alive (a document opened on
+                # it); the map is unmapped once the last view is dropped.
+                pass
+        super().close()
+
+
+def open_mapped(path):
+    '''
+    Opens a local file for binary reading as a MappedFile, or as a regular file
+    when mapped_files_enabled is off or the file cannot be mapped (it is empty).
+    '''
+    file = _map(path)
+    return file if file is not None else open(path, 'rb')
+
+
+def open_pdf(source):
+    '''
+    Opens a PDF with PyMuPDF from a path or a seekable binary file. A local file
+    (a path, a file opened on one or a MappedFile) is opened over a read-only
+    map, so that every process opening the same PDF shares one copy of its
+    bytes; any other file is read into memory. Falls back to fitz.open(path)
+    when mapping is off or not possible, and on PyMuPDF before 1.24, which
+    takes only bytes as a stream.
+    '''
+    import fitz  # PyMuPDF
+    file = source if isinstance(source, MappedFile) else _map(source)
+    if file is not None:
+        try:
+            # The document keeps a reference to the view, and with it the map.
+            return fitz.open(stream=file.getbuffer(), filetype='pdf')
+        except TypeError:
+            pass
+        finally:
+            if file is not source:
+                file.close()
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    source.seek(0)
+    return fitz.open(stream=source.read(), filetype='pdf')
+
+
+def local_path(source):
+    '''
+    Returns the path of a file object opened on a local file (a MappedFile or a
+    file from open()), or None for any other file.
+    '''
+    name = getattr(source, 'name', None)
+    if isinstance(source, (MappedFile, io.BufferedReader, io.FileIO)) and isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def _map(source):
+    # A MappedFile of a path or of a file opened on disk, or None. Other file
+    # objects are not mapped: a SpooledTemporaryFile would be written to disk
+    # by fileno(), and S3RangeFile has no file behind it.
+    if not mapped_files_enabled or not isinstance(source, (str, os.PathLike, io.BufferedReader, io.FileIO)):
+        return None
+    try:
+        return MappedFile(source)
+    except (ValueError, OSError):
+        return None
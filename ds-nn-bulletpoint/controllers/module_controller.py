@@ -2,10 +2,14 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from scripts.bullet_points_check import DocumentFormatReviewer
+from common.office_backend import check_office_backend
 from common.logs import logger
 
 app = FastAPI()
 
+# Bullet labels are read from the office backend's layout, so the start fails without it.
+check_office_backend(layout=True)
+
 class DocFormatCheck(BaseModel):
     file_path: str
 
@@ -5,6 +5,7 @@ from docx.oxml import OxmlElement
 from docx.shared import Pt
 from typing import List, Dict, Tuple, Optional
 from common.logs import logger
+from common.office_backend import LIST_BULLET, get_office_backend
 from common.s3_operations import S3Helper
 import re, os
 import tempfile
@@ -16,7 +17,6 @@ from pdfminer.layout import LTTextContainer, LTChar, LTAnno, LTTextBox
 import fitz  # PyMuPDF
 import subprocess
 from lxml import etree
-import win32com.client as win32
 
 # Add the bullet configuration at the top level
 EXPECTED_BULLETS = {
@@ -79,41 +79,31 @@ class DocumentFormatReviewer:
     def check_bullet_points(self) -> List[Dict[str, Any]]:
             """Check bullet point hierarchy and formatting"""
             logger.info("Starting bullet point check")
-            word = None
-            doc = None
             try:
-                # Convert file path to absolute path with proper formatting
                 abs_path = os.path.abspath(self.file_path)
-                # Replace forward slashes with backslashes for Windows
-                formatted_path = abs_path.replace('/', '\\')
-                
-                logger.info(f"Opening document for bullet point check: {formatted_path}")
-                
-                # Start Word application
-                word = win32.Dispatch("Word.Application")
-                word.Visible = False
-                
+                logger.info(f"Opening document for bullet point check: {abs_path}")
+
                 # Verify file exists before opening
-                if not os.path.exists(formatted_path):
-                    raise FileNotFoundError(f"Document not found at path: {formatted_path}")
+                if not os.path.exists(abs_path):
+                    raise FileNotFoundError(f"Document not found at path: {abs_path}")
 
-                # Open the document
-                doc = word.Documents.Open(formatted_path)
+                # Bullets are read as the office backend lays the lists out
+                paragraphs = get_office_backend().paragraphs(abs_path)
                 bullet_points = []
 
                 # Loop through each paragraph in the document
-                for para in doc.Paragraphs:
+                for para in paragraphs:
                     # Check if the paragraph is part of a list (bullet point)
-                    if para.Range.ListFormat.ListType == 2:  # ListType 2 means bullet points
+                    if para.list_type == LIST_BULLET:
                         # Get the bullet symbol and text
-                        bullet_symbol = para.Range.ListFormat.ListString
-                        text = para.Range.Text.strip()
+                        bullet_symbol = para.list_string
+                        text = para.text.strip()
 
                         # Get the font of the bullet
-                        font_name = para.Range.Font.Name
+                        font_name = para.font_name
 
                         # Get the level of the bullet (list level)
-                        level = para.Range.ListFormat.ListLevelNumber
+                        level = para.level
 
                         # Get the ASCII value of the bullet symbol
                         try:
@@ -150,15 +140,6 @@ class DocumentFormatReviewer:
                 error_msg = f"Error in bullet point check: {str(e)}"
                 logger.error(error_msg)
                 return [{"error_type": "System Error", "details": str(e)}]
-            finally:
-                # Ensure proper cleanup of Word objects
-                try:
-                    if doc:
-                        doc.Close(SaveChanges=False)
-                    if word:
-                        word.Quit()
-                except Exception as e:
-                    logger.error(f"Error during Word cleanup: {str(e)}")
 
     def review_document(self) -> Dict[str, List[str]]:
         logger.info("Starting complete document review")
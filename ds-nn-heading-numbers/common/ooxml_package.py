@@ -0,0 +1,125 @@
+import os
+import posixpath
+import zipfile
+from lxml import etree
+from common.mapped_file import open_mapped
+
+PACKAGE_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+_RELATIONSHIP = '{%s}Relationship' % PACKAGE_RELS_NS
+
+
+class OoxmlPackage:
+    '''
+    Lazy reader of an OOXML package (DOCX, XLSX, ...). Opening it reads only the
+    zip's central directory, and a part is decompressed only when it is opened,
+    so embedded images and OLE objects that nobody asks for are never read.
+    Memory and time follow the parts a check reads, not the size of the file,
+    unlike docx.Document(), which loads every part of the package.
+
+        with OoxmlPackage(path_or_binary_file) as package:
+            document_part = package.main_part()
+            styles_part = package.related_part(document_part, STYLES_REL)
+            with package.open_part(document_part) as part:
+                for _, element in etree.iterparse(part):
+                    ...
+
+    Part names are zip member names, without the leading '/'. A package given
+    as a path is read through a memory map (see common/mapped_file.py).
+    '''
+    def __init__(self, source) -> None:
+        self._file = open_mapped(source) if isinstance(source, (str, os.PathLike)) else None
+        try:
+            self._zip = zipfile.ZipFile(self._file if self._file is not None else source)
+        except Exception:
+            if self._file is not None:
+                self._file.close()
+            raise
+        self._relationships = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def part_names(self) -> list:
+        return self._zip.namelist()
+
+    def has_part(self, part_name: str) -> bool:
+        return part_name in self._zip.NameToInfo
+
+    def part_size(self, part_name: str) -> int:
+        '''
+        Returns the uncompressed size of a part, read from the central directory.
+        '''
+        return self._zip.getinfo(part_name).file_size
+
+    def open_part(self, part_name: str):
+        '''
+        Returns a binary stream of a part, decompressed as it is read.
+        '''
+        return self._zip.open(part_name)
+
+    def read_part(self, part_name: str) -> bytes:
+        return self._zip.read(part_name)
+
+    def relationships(self, part_name: str = '') -> dict:
+        '''
+        Returns {rId: (type, target, external)} of a part, or of the package
+        itself for ''. Parts without a .rels part have none.
+        '''
+        if part_name not in self._relationships:
+            relationships = {}
+            rels_part = rels_part_name(part_name)
+            if self.has_part(rels_part):
+                with self.open_part(rels_part) as part:
+                    for _, element in etree.iterparse(part, tag=_RELATIONSHIP):
+                        relationships[element.get('Id')] = (element.get('Type'), element.get('Target'),
+                                                            element.get('TargetMode') == 'External')
+            self._relationships[part_name] = relationships
+        return self._relationships[part_name]
+
+    def related_part(self, part_name: str, rel_type: str):
+        '''
+        Returns the name of the first internal part that part_name relates to
+        with rel_type, or None if there is none in the package.
+        '''
+        for target_type, target, external in self.relationships(part_name).values():
+            if target_type == rel_type and not external:
+                related = resolve_part(part_name, target)
+                return related if self.has_part(related) else None
+        return None
+
+    def main_part(self):
+        '''
+        Returns the name of the package's main part (word/document.xml in a
+        DOCX), or None when the package relationships do not name one.
+        '''
+        for rel_type, target, external in self.relationships('').values():
+            if rel_type == OFFICE_DOCUMENT_REL and not external:
+                return resolve_part('', target)
+        return None
+
+
+def rels_part_name(part_name: str) -> str:
+    '''
+    Returns the name of the .rels part of a part ('' for the package).
+    '''
+    return posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+
+
+def resolve_part(source_part: str, target: str) -> str:
+    '''
+    Resolves a relationship target against the part it belongs to.
+    '''
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
@@ -2,10 +2,14 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from scripts.Heading_Check import DocumentFormatReviewer
+from common.office_backend import check_office_backend
 from common.logs import logger
 
 app = FastAPI()
 
+# Documents are converted to PDF with the office backend, so the start fails without it.
+check_office_backend()
+
 class DocFormatCheck(BaseModel):
     file_path: str
 
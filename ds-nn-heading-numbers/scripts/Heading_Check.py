@@ -1,10 +1,11 @@
-from docx import Document
 from docx.shared import Inches, Twips
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.oxml import OxmlElement
 from docx.shared import Pt
 from typing import List, Dict, Tuple, Optional
+from common.docx_model import DocxModel
 from common.logs import logger
+from common.office_backend import convert_to_pdf
 from common.s3_operations import S3Helper
 import re, os
 import tempfile
@@ -14,9 +15,7 @@ import re
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer, LTChar, LTAnno, LTTextBox
 import fitz  # PyMuPDF
-import subprocess
 from lxml import etree
-import win32com.client as win32
 
 TMP_DIR = tempfile.gettempdir()
 
@@ -27,7 +26,8 @@ class DocumentFormatReviewer:
             logger.info(f"Opening document: {doc_path}")
             if doc_path.startswith('s3://'):
                 doc_path = self.download_s3_file(doc_path)
-            self.document = Document(doc_path)
+            # Checks only read the document, so the compact model replaces python-docx.
+            self.document = DocxModel.load_cached(doc_path)
             self.file_path = doc_path
             self.heading_errors = []
             self.margin_errors = []
@@ -47,56 +47,8 @@ class DocumentFormatReviewer:
         return local_file_path
 
     def convert_to_pdf(self) -> str:
-        """Convert document to PDF using Microsoft Office COM automation"""
-        output_dir = os.path.dirname(self.file_path)
-        pdf_file = os.path.join(output_dir, os.path.splitext(os.path.basename(self.file_path))[0] + '.pdf')
-        
-        try:
-            # Try using win32com for Word to PDF conversion
-            try:
-                import win32com.client
-                word = win32com.client.Dispatch("Word.Application")
-                word.Visible = False
-                doc = word.Documents.Open(self.file_path)
-                doc.SaveAs(pdf_file, FileFormat=17)  # 17 represents PDF format
-                doc.Close()
-                word.Quit()
-                return pdf_file
-            except Exception as e:
-                logger.error(f"COM automation failed: {str(e)}")
-                
-                # Fallback to alternative conversion methods
-                try:
-                    # Try using docx2pdf if available
-                    from docx2pdf import convert
-                    convert(self.file_path, pdf_file)
-                    return pdf_file
-                except ImportError:
-                    # Last resort: Try using system installed Office
-                    soffice_paths = [
-                        r"C:\Program Files\Microsoft Office\root\Office16\WINWORD.EXE",
-                        r"C:\Program Files (x86)\Microsoft Office\root\Office16\WINWORD.EXE",
-                    ]
-                    
-                    for soffice_path in soffice_paths:
-                        if os.path.exists(soffice_path):
-                            command = [
-                                soffice_path,
-                                "/q",
-                                "/n",
-                                "/f",
-                                "/c",
-                                f"SaveAs.PDF({pdf_file})",
-                                self.file_path
-                            ]
-                            subprocess.run(command, check=True)
-                            return pdf_file
-                    
-                    raise Exception("No viable PDF conversion method found")
-                    
-        except Exception as e:
-            logger.error(f"PDF conversion failed: {str(e)}")
-            raise
+        """Convert document to PDF (cached by content) with the office backend, warm LibreOffice workers by default"""
+        return convert_to_pdf(self.file_path, os.path.dirname(self.file_path))
 
     def extract_word_headings(self) -> List:
         """Extract headings from Word document"""
@@ -1,6 +1,14 @@
 import os
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from common.logs import logger
+from common.object_store import local_backend_enabled, get_local_object_store
 from dotenv import load_dotenv
 from botocore.exceptions import ClientError
 
@@ -9,39 +17,150 @@ load_dotenv()
 aws_access_key_id = os.getenv('aws_access_key_id')
 aws_secret_access_key = os.getenv('aws_secret_access_key')
 aws_region_name = os.getenv('aws_region')
+s3_max_pool_connections = int(os.getenv('s3_max_pool_connections', 32))
+s3_transfer_concurrency = int(os.getenv('s3_transfer_concurrency', 8))
+s3_multipart_chunksize = int(os.getenv('s3_multipart_chunksize', 8 * 1024 * 1024))
+s3_download_workers = int(os.getenv('s3_download_workers', 16))
+s3_list_workers = int(os.getenv('s3_list_workers', 8))
+s3_max_in_flight = int(os.getenv('s3_max_in_flight', 64))
+s3_upload_workers = int(os.getenv('s3_upload_workers', 4))
+s3_upload_concurrency = int(os.getenv('s3_upload_concurrency', 10))
+s3_upload_chunksize = int(os.getenv('s3_upload_chunksize', 16 * 1024 * 1024))
+
+# Shared transfer settings for download_file / upload_file. Small DOCX files stay
+# single-part; larger PDFs are split into parallel ranged parts.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=s3_multipart_chunksize,
+    multipart_chunksize=s3_multipart_chunksize,
+    max_concurrency=s3_transfer_concurrency,
+    use_threads=True
+)
+
+# Uploads are mostly annotated / converted PDFs of 10-200 MB: larger parts keep the
+# part count low while still sending each file over several connections.
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=s3_upload_chunksize,
+    multipart_chunksize=s3_upload_chunksize,
+    max_concurrency=s3_upload_concurrency,
+    use_threads=True
+)
+
+# User metadata key holding the SHA-256 of the uploaded content.
+CONTENT_HASH_METADATA_KEY = 'sha256'
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(region_name: str = None, access_key_id: str = None, secret_access_key: str = None):
+    '''
+    Returns the process-wide S3 client for a region and set of credentials.
+    The client is created lazily on first use and then shared, so credentials,
+    the botocore service model and the connection pool are only set up once.
+    boto3 clients are thread-safe once created.
+    With object_store_backend=local a directory-backed LocalObjectStore is
+    returned instead, so everything runs without AWS.
+    '''
+    if local_backend_enabled():
+        return get_local_object_store()
+
+    region_name = region_name or aws_region_name
+    access_key_id = access_key_id or aws_access_key_id
+    secret_access_key = secret_access_key or aws_secret_access_key
+    key = (region_name, access_key_id, secret_access_key)
+
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                # Sessions are not thread-safe, so each client gets its own.
+                session = boto3.session.Session(
+                    region_name=region_name,
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key
+                )
+                client = session.client(
+                    's3',
+                    config=Config(
+                        max_pool_connections=s3_max_pool_connections,
+                        retries={'max_attempts': 5, 'mode': 'standard'}
+                    )
+                )
+                _clients[key] = client
+                logger.info(f"Created shared S3 client for region '{region_name}' (pool size {s3_max_pool_connections})")
+    return client
+
+
+def file_sha256(file_name: str, chunk_size: int = 1024 * 1024) -> str:
+    '''
+    Returns the hex SHA-256 of a local file, read in chunks.
+    '''
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class S3Helper:
     def __init__(self, s3_bucket_name) -> None:
         '''
-        Initializes the S3Helper object.
+        Initializes the S3Helper object. This is a cheap handle on the shared
+        client returned by get_s3_client(), so it is fine to create one per request.
         '''
         self.bucket_name = s3_bucket_name
-        self.s3_client = boto3.client(
-            's3',
-            region_name=aws_region_name,
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
+        self.s3_client = get_s3_client()
         self.logger = logger
 
-    def upload_file_to_s3(self, file_name: str, object_name: str) -> None:
+    def upload_file_to_s3(self, file_name: str, object_name: str, skip_unchanged: bool = True) -> dict:
         '''
-        Uploads a file to S3 bucket.
+        Uploads a file to S3 bucket. The SHA-256 of the content is stored in the object
+        metadata; with skip_unchanged the upload is skipped when the object under
+        object_name already has the same hash.
+        Returns a report: {'file_name', 'object_name', 'bytes_sent', 'seconds', 'skipped'}.
         '''
+        report = {'file_name': file_name, 'object_name': object_name, 'bytes_sent': 0, 'seconds': 0.0, 'skipped': False}
+        started = time.perf_counter()
         try:
-            self.s3_client.upload_file(file_name, self.bucket_name, object_name)
-            self.logger.info(f"File '{file_name}' uploaded to S3 bucket '{self.bucket_name}' as '{object_name}'.")
+            content_hash = file_sha256(file_name)
+            if skip_unchanged and self.get_stored_sha256(object_name) == content_hash:
+                report['skipped'] = True
+                self.logger.info(f"File '{file_name}' unchanged in S3 bucket '{self.bucket_name}' as '{object_name}', upload skipped.")
+            else:
+                self.s3_client.upload_file(
+                    file_name, self.bucket_name, object_name,
+                    ExtraArgs={'Metadata': {CONTENT_HASH_METADATA_KEY: content_hash}},
+                    Config=UPLOAD_TRANSFER_CONFIG
+                )
+                report['bytes_sent'] = os.path.getsize(file_name)
+                self.logger.info(f"File '{file_name}' uploaded to S3 bucket '{self.bucket_name}' as '{object_name}'.")
+            report['seconds'] = time.perf_counter() - started
+            return report
         except Exception as e:
             self.logger.exception(f"Exception in upload_file_to_s3(): File - '{file_name}', S3 bucket - '{self.bucket_name}', object_name - '{object_name}'")
             raise e
 
+    def get_stored_sha256(self, object_name: str):
+        '''
+        Returns the content hash recorded in the object's metadata, or None if the
+        object does not exist or was uploaded without one.
+        '''
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise e
+        return head.get('Metadata', {}).get(CONTENT_HASH_METADATA_KEY)
+
     def download_file_from_s3(self, object_name: str, file_name: str) -> None:
         '''
         Downloads a file from S3 bucket.
         '''
         try:
             self.logger.info(f"Downloading file from S3: Bucket - '{self.bucket_name}', Object - '{object_name}', Local - '{file_name}'")
-            self.s3_client.download_file(self.bucket_name, object_name, file_name)
+            self.s3_client.download_file(self.bucket_name, object_name, file_name, Config=TRANSFER_CONFIG)
             self.logger.info(f"File '{object_name}' downloaded from S3 bucket '{self.bucket_name}' to '{file_name}'.")
         except ClientError as e:
             self.logger.exception(f"ClientError in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
@@ -50,21 +169,144 @@ class S3Helper:
             self.logger.exception(f"Exception in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
             raise e
 
-    def upload_directory(self, dir_name: str, prefix: str = "") -> None:
+    def upload_directory(self, dir_name: str, prefix: str = "", max_workers: int = None, skip_unchanged: bool = True) -> list:
         '''
-        Uploads a directory to S3 bucket.
+        Uploads a directory to S3 bucket, max_workers files at a time (default
+        s3_upload_workers). Each file is itself sent in parallel parts.
+        Returns the per-object reports from upload_file_to_s3().
         '''
         try:
+            uploads = []
             for root, dirs, files in os.walk(dir_name):
                 for file in files:
                     local_file_path = os.path.join(root, file)
                     relative_path = os.path.relpath(local_file_path, dir_name)
                     s3_object_name = os.path.join(prefix, relative_path)
-                    self.upload_file_to_s3(local_file_path, s3_object_name)
+                    uploads.append((local_file_path, s3_object_name))
+
+            reports = []
+            with ThreadPoolExecutor(max_workers=max_workers or s3_upload_workers) as executor:
+                futures = [executor.submit(self.upload_file_to_s3, local_file_path, s3_object_name, skip_unchanged)
+                           for local_file_path, s3_object_name in uploads]
+                for future in as_completed(futures):
+                    reports.append(future.result())
+
+            sent = sum(report['bytes_sent'] for report in reports)
+            skipped = sum(1 for report in reports if report['skipped'])
+            self.logger.info(f"upload_directory(): {len(reports)} files from '{dir_name}', {skipped} skipped, {sent} bytes sent")
+            return reports
         except Exception as e:
             self.logger.exception(f"Exception in upload_directory(): inp_dir_name - {dir_name}")
             raise e
 
+    def list_files(self, s3_prefix: str) -> list:
+        '''
+        Lists the objects directly under a prefix (one level, like a directory listing).
+        Returns:
+            list: The listing entries, each with 'Key', 'Size' and 'ETag'
+        '''
+        try:
+            if s3_prefix and not s3_prefix.endswith('/'):
+                s3_prefix += '/'
+            items = []
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=s3_prefix, Delimiter='/'):
+                for item in page.get('Contents', []):
+                    if not item['Key'].endswith('/'):  # Skip S3 "directory" objects
+                        items.append(item)
+            return items
+        except Exception as e:
+            self.logger.exception(f"Exception in list_files(): prefix - '{s3_prefix}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def iter_files(self, s3_prefix: str, errors: list = None):
+        '''
+        Yields the listing entries ('Key', 'Size', 'ETag') of every object under a
+        prefix, nested folders included. Listing fans out by common prefix
+        (Delimiter='/') over s3_list_workers threads and entries are yielded as each
+        page arrives, so callers can start on them while the rest is being listed.
+        At most s3_max_in_flight entries are listed ahead of the caller.
+        Args:
+            s3_prefix (str): The S3 prefix (folder path) to list
+            errors (list): If given, a prefix that cannot be listed is appended to it
+                as {'key', 'error'} and the others are still listed; otherwise its
+                error is raised once the rest has been listed
+        '''
+        if s3_prefix and not s3_prefix.endswith('/'):
+            s3_prefix += '/'
+        messages = queue.Queue(maxsize=max(s3_max_in_flight, 1))
+        closed = threading.Event()
+
+        def put(message: tuple) -> None:
+            # Gives up once the caller has stopped iterating.
+            while not closed.is_set():
+                try:
+                    messages.put(message, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def list_level(prefix: str) -> None:
+            # Lists one level under prefix, passing on entries and sub-prefixes page by page.
+            error = None
+            try:
+                paginator = self.s3_client.get_paginator('list_objects_v2')
+                for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+                    if closed.is_set():
+                        return
+                    for cp in page.get('CommonPrefixes', []):
+                        put(('prefix', cp['Prefix'], None))
+                    for item in page.get('Contents', []):
+                        if not item['Key'].endswith('/'):  # Skip S3 "directory" objects
+                            put(('item', item, None))
+            except Exception as e:
+                error = e
+            finally:
+                put(('done', prefix, error))
+
+        first_error = None
+        with ThreadPoolExecutor(max_workers=s3_list_workers) as list_pool:
+            try:
+                list_pool.submit(list_level, s3_prefix)
+                pending = 1
+                while pending:
+                    kind, value, error = messages.get()
+                    if kind == 'item':
+                        yield value
+                    elif kind == 'prefix':
+                        list_pool.submit(list_level, value)
+                        pending += 1
+                    else:
+                        pending -= 1
+                        if error is None:
+                            continue
+                        self.logger.error(f"Exception in iter_files(): prefix - '{value}', S3 bucket - '{self.bucket_name}': {error}")
+                        if errors is not None:
+                            errors.append({'key': value, 'error': str(error)})
+                        elif first_error is None:
+                            first_error = error
+            finally:
+                closed.set()
+        if first_error is not None:
+            raise first_error
+
+    def read_object_range(self, object_name: str, length: int, start: int = 0) -> bytes:
+        '''
+        Reads up to length bytes of an object starting at start with a ranged GET,
+        without downloading the rest of it.
+        '''
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=object_name,
+                                                 Range=f'bytes={start}-{start + length - 1}')
+            body = response['Body']
+            try:
+                return body.read()
+            finally:
+                body.close()
+        except Exception as e:
+            self.logger.exception(f"Exception in read_object_range(): File - '{object_name}', S3 bucket - '{self.bucket_name}', bytes {start}-{start + length - 1}")
+            raise e
+
     def download_directory(self, s3_prefix: str, local_dir: str) -> None:
         '''
         Downloads a directory from S3 bucket to local directory.
@@ -101,7 +343,7 @@ class S3Helper:
                         
                         # Download the file
                         self.logger.info(f"Downloading {key} to {local_file_path}")
-                        self.s3_client.download_file(self.bucket_name, key, local_file_path)
+                        self.s3_client.download_file(self.bucket_name, key, local_file_path, Config=TRANSFER_CONFIG)
             
             if not files_found:
                 self.logger.warning(f"No files found in S3 bucket '{self.bucket_name}' with prefix '{s3_prefix}'")
@@ -114,4 +356,74 @@ class S3Helper:
             raise e
         except Exception as e:
             self.logger.exception(f"Exception in download_directory(): {str(e)}")
-            raise e 
\ No newline at end of file
+            raise e
+
+    def download_object(self, key: str, local_file_path: str, size: int = 0) -> dict:
+        '''
+        Downloads one object to local_file_path, creating its directory. A failure is
+        logged and recorded in the result instead of raised, so a batch can go on.
+        Returns:
+            dict: {'key', 'local_path', 'bytes', 'seconds', 'error'}
+        '''
+        result = {'key': key, 'local_path': local_file_path, 'bytes': size, 'seconds': 0.0, 'error': None}
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            self.s3_client.download_file(self.bucket_name, key, local_file_path, Config=TRANSFER_CONFIG)
+        except Exception as e:
+            result['error'] = str(e)
+            self.logger.error(f"Failed to download {key} to {local_file_path}: {e}")
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def download_directory_concurrent(self, s3_prefix: str, local_dir: str, max_workers: int = None,
+                                      max_in_flight: int = None, progress_callback=None) -> dict:
+        '''
+        Downloads a directory from S3 bucket to local directory using a bounded thread pool.
+        The directory is listed with iter_files(), so nested folders are listed in
+        parallel and downloads start as soon as each listing page arrives.
+        A failed file is recorded in the report and does not abort the rest of the batch.
+        Args:
+            s3_prefix (str): The S3 prefix (folder path) to download from
+            local_dir (str): The local directory path to download to
+            max_workers (int): Number of download threads (default s3_download_workers)
+            max_in_flight (int): Maximum number of listed-but-unfinished downloads (default s3_max_in_flight)
+            progress_callback (callable): Called with each per-file result dict as it completes
+        Returns:
+            dict: {'downloaded': [...], 'failed': [...]} with one result dict per file
+        '''
+        max_workers = max_workers or s3_download_workers
+        in_flight = threading.BoundedSemaphore(max_in_flight or s3_max_in_flight)
+        report = {'downloaded': [], 'failed': []}
+        report_lock = threading.Lock()
+        os.makedirs(local_dir, exist_ok=True)
+
+        def download(key: str, size: int) -> None:
+            rel_path = key[len(s3_prefix):].lstrip('/')
+            try:
+                result = self.download_object(key, os.path.join(local_dir, rel_path), size)
+            finally:
+                in_flight.release()
+
+            with report_lock:
+                report['failed' if result['error'] else 'downloaded'].append(result)
+                done = len(report['downloaded']) + len(report['failed'])
+            self.logger.info(f"[{done}] {'Failed' if result['error'] else 'Downloaded'} {key} ({size} bytes, {result['seconds']:.2f}s)")
+            if progress_callback:
+                try:
+                    progress_callback(result)
+                except Exception:
+                    self.logger.exception(f"Exception in download_directory_concurrent() progress callback for {key}")
+
+        listing_errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as download_pool:
+            for item in self.iter_files(s3_prefix, errors=listing_errors):
+                in_flight.acquire()  # Backpressure: listing waits while too many downloads are queued
+                download_pool.submit(download, item['Key'], item.get('Size', 0))
+        for failure in listing_errors:
+            report['failed'].append({'key': failure['key'], 'local_path': None, 'bytes': 0, 'seconds': 0.0, 'error': failure['error']})
+
+        if not report['downloaded'] and not report['failed']:
+            self.logger.warning(f"No files found in S3 bucket '{self.bucket_name}' with prefix '{s3_prefix}'")
+        self.logger.info(f"Downloaded {len(report['downloaded'])} files from '{s3_prefix}', {len(report['failed'])} failed")
+        return report
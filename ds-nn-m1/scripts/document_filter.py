@@ -2,13 +2,56 @@ import magic
 from pathlib import Path
 from typing import Dict, List, Union
 import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from common.logs import logger
+from common.pipeline import Pipeline, Stage
 from common.s3_operations import S3Helper
 from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Sniff mode reads only the head of each S3 object. libmagic needs the first zip
+# entries to tell DOCX from a plain zip, which usually fit in 16 KB.
+sniff_bytes = int(os.getenv('sniff_bytes', 16 * 1024))
+sniff_max_bytes = int(os.getenv('sniff_max_bytes', 256 * 1024))
+sniff_workers = int(os.getenv('sniff_workers', 16))
+sniff_cache_max_entries = int(os.getenv('sniff_cache_max_entries', 100000))
+
+# Full scans (sniff=False) download and detect in a pipeline: filter_download_workers
+# objects are fetched at a time, at most filter_prefetch wait on disk for detection
+# and filter_detect_workers are inspected at a time.
+filter_download_workers = int(os.getenv('filter_download_workers', 8))
+filter_prefetch = int(os.getenv('filter_prefetch', 32))
+filter_detect_workers = int(os.getenv('filter_detect_workers', 2))
+
+# Results libmagic gives when the header alone is not enough to identify a container;
+# these are sniffed again with sniff_max_bytes before a file is filtered.
+AMBIGUOUS_MIMES = {
+    'application/zip',
+    'application/octet-stream',
+    'application/x-ole-storage',
+    'application/CDFV2'
+}
+
+# MIME type per (bucket, key, ETag), shared by every request in the process, so
+# re-scanning an unchanged prefix costs only the listing.
+_sniff_cache = OrderedDict()
+_sniff_cache_lock = threading.Lock()
+
+
+def _relative_name(key: str, prefix: str) -> str:
+    # Name of an object relative to the scanned prefix, e.g. 'appendix/scan.tiff'.
+    return key[len(prefix):].lstrip('/') if prefix and key.startswith(prefix) else os.path.basename(key)
+
 
 class DocumentFilter:
     def __init__(self):
-        self.mime = magic.Magic(mime=True)
+        self._local = threading.local()
         self.ALLOWED_MIMES = {
             'application/pdf',
             'application/msword',  # .doc
@@ -18,6 +61,15 @@ class DocumentFilter:
         if not os.path.exists(self.TMP_DIR):
             os.makedirs(self.TMP_DIR)
 
+    @property
+    def mime(self) -> magic.Magic:
+        # One libmagic handle per thread: python-magic serialises the calls on a
+        # handle with a lock, which would let only one sniff or detect run at a time.
+        handle = getattr(self._local, 'mime', None)
+        if handle is None:
+            handle = self._local.mime = magic.Magic(mime=True)
+        return handle
+
     # Define response structure as class attribute
     RESPONSE_FORMAT = {
         "success": {
@@ -65,18 +117,22 @@ class DocumentFilter:
                 "data": {}
             }
 
-    def filter_documents(self, file_path: str) -> Dict:
+    def filter_documents(self, file_path: str, sniff: bool = True) -> Dict:
         """
         Filter documents in a directory and return only filtered (non-allowed) files
         Args:
             file_path: Local path or S3 path (starting with 's3://')
+            sniff: For S3 paths, detect types from ranged reads of each object's
+                header instead of downloading the directory
         Returns:
             Dict with filtered files only
         """
         try:
             # Handle S3 paths
             if file_path.startswith('s3://'):
-                file_path = self.download_s3_directory(file_path)
+                if sniff:
+                    return self.create_response(True, self.sniff_s3_directory(file_path))
+                return self.create_response(True, self.scan_s3_directory(file_path))
             
             dir_path = Path(file_path)
             
@@ -130,28 +186,141 @@ class DocumentFilter:
                 "data": {}
             }
 
-    def download_s3_directory(self, s3_path: str) -> str:
+    def sniff_s3_directory(self, s3_path: str) -> Dict:
+        """
+        Detects the MIME type of each file in an S3 directory, nested folders
+        included, from the first sniff_bytes of the object, fetched with a ranged
+        GET. Nothing is written to disk. Results are cached by ETag, so unchanged
+        files are not read again.
+        Args:
+            s3_path: S3 path in format 's3://bucket-name/path/to/directory'
+        Returns:
+            Dict with the filtered (non-allowed) files
+        """
+        parts = s3_path.replace('s3://', '').split('/')
+        bucket_name = parts[0]
+        prefix = '/'.join(parts[1:])
+
+        s3_helper = S3Helper(bucket_name)
+        logger.info(f"Sniffing objects in {s3_path}")
+
+        def sniff(item: Dict) -> Dict:
+            key = item['Key']
+            file_info = {
+                'name': _relative_name(key, prefix),
+                'path': f"s3://{bucket_name}/{key}",
+                'mime_type': None
+            }
+            try:
+                file_info['mime_type'] = self.sniff_s3_object(s3_helper, item)
+            except Exception as e:
+                logger.error(f"Error processing {file_info['path']}: {str(e)}")
+            return file_info
+
+        results = {
+            'filtered': []
+        }
+        with ThreadPoolExecutor(max_workers=sniff_workers) as executor:
+            for file_info in executor.map(sniff, s3_helper.iter_files(prefix)):
+                if file_info['mime_type'] is not None and file_info['mime_type'] not in self.ALLOWED_MIMES:
+                    results['filtered'].append(file_info)
+                    logger.info(f"Filtered file found: {file_info['name']}")
+        # Listing order depends on which folder is listed first.
+        results['filtered'].sort(key=lambda file_info: file_info['path'])
+        return results
+
+    def scan_s3_directory(self, s3_path: str) -> Dict:
         """
-        Downloads a directory from S3 to local temp directory
+        Detects the MIME type of each file in an S3 directory, nested folders
+        included, from its full content. Files are downloaded and checked in a
+        pipeline fed by the fan-out listing of S3Helper.iter_files(): downloads start
+        while the rest of the directory is being listed, libmagic inspects one file
+        while the next ones download, and each file is deleted as soon as it has
+        been checked.
         Args:
             s3_path: S3 path in format 's3://bucket-name/path/to/directory'
         Returns:
-            Local directory path where files were downloaded
+            Dict with the filtered (non-allowed) files
         """
+        parts = s3_path.replace('s3://', '').split('/')
+        bucket_name = parts[0]
+        prefix = '/'.join(parts[1:])
+
+        s3_helper = S3Helper(bucket_name)
+        local_dir = tempfile.mkdtemp(prefix='scan-', dir=self.TMP_DIR)
+
+        def download(item: Dict) -> str:
+            # Keys are unique, base names need not be: keep each file in its own directory.
+            local_path = os.path.join(tempfile.mkdtemp(dir=local_dir), os.path.basename(item['Key']))
+            result = s3_helper.download_object(item['Key'], local_path, item.get('Size', 0))
+            if result['error'] is not None:
+                raise Exception(result['error'])
+            logger.info(f"Downloaded {item['Key']} ({result['bytes']} bytes, {result['seconds']:.2f}s)")
+            return local_path
+
+        def detect(local_path: str) -> str:
+            try:
+                return self.mime.from_file(local_path)
+            finally:
+                os.remove(local_path)
+
+        pipeline = Pipeline([
+            Stage('download', download, workers=filter_download_workers),
+            Stage('detect', detect, workers=filter_detect_workers, queue_size=filter_prefetch)
+        ], name='document-filter')
+
+        results = {
+            'filtered': []
+        }
         try:
-            parts = s3_path.replace('s3://', '').split('/')
-            bucket_name = parts[0]
-            prefix = '/'.join(parts[1:])
-            
-            local_dir = os.path.join(self.TMP_DIR, os.path.basename(prefix))
-            os.makedirs(local_dir, exist_ok=True)
-            
-            s3_helper = S3Helper(bucket_name)
-            s3_helper.download_directory(prefix, local_dir)
-            
-            logger.info(f"Successfully downloaded S3 directory to {local_dir}")
-            return local_dir
-            
-        except Exception as e:
-            logger.error(f"Error downloading S3 directory: {str(e)}")
-            raise
\ No newline at end of file
+            for outcome in pipeline.run(s3_helper.iter_files(prefix)):
+                if outcome['stage'] == 'input':
+                    raise outcome['error']
+                key = outcome['item']['Key']
+                if outcome['error'] is not None:
+                    logger.error(f"Error processing s3://{bucket_name}/{key}: {str(outcome['error'])}")
+                    continue
+                file_info = {
+                    'name': _relative_name(key, prefix),
+                    'path': f"s3://{bucket_name}/{key}",
+                    'mime_type': outcome['result']
+                }
+                if file_info['mime_type'] not in self.ALLOWED_MIMES:
+                    results['filtered'].append(file_info)
+                    logger.info(f"Filtered file found: {file_info['name']}")
+        finally:
+            shutil.rmtree(local_dir, ignore_errors=True)
+        # Listing order depends on which folder is listed first.
+        results['filtered'].sort(key=lambda file_info: file_info['path'])
+        return results
+
+    def sniff_s3_object(self, s3_helper: S3Helper, item: Dict) -> str:
+        """
+        Returns the MIME type of one listed S3 object, reading only its header.
+        Args:
+            s3_helper: S3Helper for the object's bucket
+            item: Listing entry with 'Key', 'Size' and 'ETag'
+        """
+        cache_key = (s3_helper.bucket_name, item['Key'], item.get('ETag'))
+        with _sniff_cache_lock:
+            file_mime = _sniff_cache.get(cache_key)
+            if file_mime is not None:
+                _sniff_cache.move_to_end(cache_key)
+                return file_mime
+
+        size = item.get('Size', 0)
+        if size == 0:
+            # A ranged GET on an empty object fails with InvalidRange.
+            file_mime = self.mime.from_buffer(b'')
+        else:
+            file_mime = self.mime.from_buffer(s3_helper.read_object_range(item['Key'], min(size, sniff_bytes)))
+            if file_mime in AMBIGUOUS_MIMES and size > sniff_bytes:
+                head = s3_helper.read_object_range(item['Key'], min(size, sniff_max_bytes))
+                file_mime = self.mime.from_buffer(head)
+
+        if item.get('ETag'):
+            with _sniff_cache_lock:
+                _sniff_cache[cache_key] = file_mime
+                while len(_sniff_cache) > sniff_cache_max_entries:
+                    _sniff_cache.popitem(last=False)
+        return file_mime
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Cold and warm load benchmark for common/artifact_cache.py.
+
+Generates a synthetic DOCX (see docx_model_benchmark) and PDF (see
+layout_rules_benchmark) of --pages pages, then loads each parse product through
+a fresh cache in a temporary directory:
+
+    cold    content hash, parse and store (the first check of a document)
+    warm    content hash and read back (every later check of the same bytes)
+    stored  compressed size of the cache entry next to the source file's size
+
+Warm times are the best of --repeat runs.
+
+Run from the service root:
+    python -m benchmarks.artifact_cache_benchmark
+    python -m benchmarks.artifact_cache_benchmark --pages 2000 --repeat 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from benchmarks import docx_model_benchmark, layout_rules_benchmark
+from common.artifact_cache import ArtifactCache, content_hash
+from common.docx_model import DocxModel
+from common.pdf_layout import PdfLayout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=500, help='Pages in each generated document')
+    parser.add_argument('--repeat', type=int, default=3, help='Warm runs per artifact; the best time is reported')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_artifact_benchmark_')
+    try:
+        docx_path = os.path.join(work_dir, 'benchmark.docx')
+        pdf_path = os.path.join(work_dir, 'benchmark.pdf')
+        docx_model_benchmark.generate(docx_path, args.pages)
+        layout_rules_benchmark.generate(pdf_path, args.pages)
+        cache = ArtifactCache(os.path.join(work_dir, 'cache'))
+
+        artifacts = (
+            ('docx-model', DocxModel.ARTIFACT_VERSION, docx_path, lambda: DocxModel.load(docx_path)),
+            ('pdf-layout', PdfLayout.ARTIFACT_VERSION, pdf_path, lambda: PdfLayout.extract(fitz.open(pdf_path))),
+        )
+        print(f"documents: {args.pages} pages\n")
+        print(f"{'artifact':<12} {'cold ms':>10} {'warm ms':>10} {'speedup':>8} {'source KB':>10} {'stored KB':>10}")
+        for kind, version, path, build in artifacts:
+            start = time.perf_counter()
+            cache.load(kind, version, path, build)
+            cold = time.perf_counter() - start
+            warm = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                cache.load(kind, version, path, build)
+                seconds = time.perf_counter() - start
+                warm = seconds if warm is None else min(warm, seconds)
+            stored = os.path.getsize(cache.entry_path(kind, content_hash(path), version))
+            print(f"{kind:<12} {cold * 1000:>10.1f} {warm * 1000:>10.1f} {cold / warm:>7.1f}x "
+                  f"{os.path.getsize(path) / 1024:>10.0f} {stored / 1024:>10.0f}")
+        print(f"\n{cache.get_stats()}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Parse benchmark for common/docx_model.py against python-docx.
+
+Generates a synthetic DOCX of --pages pages (numbered headings, body paragraphs
+with sized runs, hyperlinks, bookmarks, REF fields and a table every few pages),
+then opens it with docx.Document() and with DocxModel.load() and reads what the
+checks read: every paragraph's text, style name and run sizes. A third run loads
+it with references_only=True and reads what m7 reads: bookmarks, REF fields and
+hyperlinks (the count column then counts those). --media-mb adds embedded images
+of that total size, which python-docx loads with the document and DocxModel
+never reads.
+
+Each parser runs in its own process so that peak memory is not shared; memory is
+the growth of the process's peak RSS over the parse, which includes lxml's own
+allocations. Times are the best of --repeat runs.
+
+Run from the service root:
+    python -m benchmarks.docx_model_benchmark
+    python -m benchmarks.docx_model_benchmark --pages 200 --repeat 5
+    python -m benchmarks.docx_model_benchmark --pages 200 --media-mb 150
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+PARAGRAPHS_PER_PAGE = 14
+WORDS = ('quality', 'procedure', 'document', 'control', 'review', 'record', 'process', 'audit',
+         'supplier', 'risk', 'change', 'training', 'design', 'verification', 'release', 'form')
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+MEDIA_PART_BYTES = 1024 * 1024
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def styles_xml():
+    styles = ['<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>']
+    for level in (1, 2, 3):
+        styles.append(f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+                      f'<w:basedOn w:val="Normal"/><w:pPr><w:numPr><w:ilvl w:val="{level - 1}"/><w:numId w:val="1"/>'
+                      f'</w:numPr></w:pPr></w:style>')
+    styles.append('<w:style w:type="paragraph" w:styleId="ListBullet"><w:name w:val="List Bullet"/></w:style>')
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:styles {W}>{"".join(styles)}</w:styles>'
+
+
+def sentence(index, words):
+    return ' '.join(WORDS[(index * 7 + offset) % len(WORDS)] for offset in range(words))
+
+
+def run(text, size=None):
+    properties = f'<w:rPr><w:rFonts w:ascii="Arial"/><w:sz w:val="{size}"/></w:rPr>' if size else ''
+    return f'<w:r>{properties}<w:t xml:space="preserve">{text}</w:t></w:r>'
+
+
+def paragraph(index, links):
+    '''
+    Returns one paragraph of the synthetic document and the hyperlink rIds it uses.
+    '''
+    position = index % PARAGRAPHS_PER_PAGE
+    if position == 0:
+        level = 1 + (index // PARAGRAPHS_PER_PAGE) % 3
+        return (f'<w:p><w:pPr><w:pStyle w:val="Heading{level}"/></w:pPr>'
+                f'<w:bookmarkStart w:id="{index}" w:name="_Ref{index:08d}"/>{run(sentence(index, 4).title(), 26 - 2 * level)}'
+                f'<w:bookmarkEnd w:id="{index}"/></w:p>')
+    if position in (3, 9):
+        return (f'<w:p><w:pPr><w:pStyle w:val="ListBullet"/><w:numPr><w:ilvl w:val="0"/><w:numId w:val="2"/></w:numPr></w:pPr>'
+                f'{run(sentence(index, 12), 20)}</w:p>')
+    heading = index - position
+    body = [run(sentence(index, 20), 20), run(' see section ')]
+    body.append(f'<w:r><w:fldChar w:fldCharType="begin"/></w:r><w:r><w:instrText xml:space="preserve"> REF _Ref{heading:08d} \\h </w:instrText></w:r>'
+                f'<w:r><w:fldChar w:fldCharType="separate"/></w:r>{run(sentence(heading, 4).title())}<w:r><w:fldChar w:fldCharType="end"/></w:r>')
+    if position == 5:
+        r_id = f'rId{100 + len(links)}'
+        links.append(r_id)
+        body.append(f'<w:hyperlink r:id="{r_id}">{run("external reference")}</w:hyperlink>')
+    body.append(run(sentence(index + 1, 30), 20))
+    return f'<w:p>{"".join(body)}</w:p>'
+
+
+def table(index):
+    cells = ''.join(f'<w:tc><w:p>{run(sentence(index + cell, 3))}</w:p></w:tc>' for cell in range(4))
+    return f'<w:tbl>{"".join(f"<w:tr>{cells}</w:tr>" for _ in range(6))}</w:tbl>'
+
+
+def generate(path, pages, media_mb=0):
+    links = []
+    media = [f'media/image{index}.png' for index in range(media_mb)]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES)
+        package.writestr('_rels/.rels', PACKAGE_RELS)
+        package.writestr('word/styles.xml', styles_xml())
+        with package.open('word/document.xml', 'w', force_zip64=True) as part:
+            part.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {W} {R}><w:body>'.encode())
+            for page in range(pages):
+                chunk = [paragraph(page * PARAGRAPHS_PER_PAGE + position, links) for position in range(PARAGRAPHS_PER_PAGE)]
+                if page % 5 == 4:
+                    chunk.append(table(page))
+                part.write(''.join(chunk).encode())
+            part.write(b'<w:sectPr/></w:body></w:document>')
+        for name in media:
+            # Random bytes do not compress, like real image data.
+            package.writestr(zipfile.ZipInfo('word/' + name), os.urandom(MEDIA_PART_BYTES), zipfile.ZIP_STORED)
+        relationships = [f'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>']
+        relationships += [f'<Relationship Id="{r_id}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink" '
+                          f'Target="https://example.com/{r_id}" TargetMode="External"/>' for r_id in links]
+        relationships += [f'<Relationship Id="rIdMedia{index}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+                          f'Target="{name}"/>' for index, name in enumerate(media)]
+        package.writestr('word/_rels/document.xml.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{"".join(relationships)}</Relationships>')
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(parser, path):
+    '''
+    Runs in the worker process: parses path once and prints seconds, peak RSS
+    growth in MB and the number of paragraphs read.
+    '''
+    if parser == 'python-docx':
+        from docx import Document
+
+        def parse():
+            document = Document(path)
+            count = 0
+            for para in document.paragraphs:
+                para.text, para.style.name
+                [run.font.size for run in para.runs]
+                count += 1
+            return count
+    elif parser == 'references':
+        from common.docx_model import DocxModel
+
+        def parse():
+            model = DocxModel.load(path, references_only=True)
+            count = 0
+            for bookmark in model.bookmarks:
+                bookmark.name, bookmark.text, bookmark.paragraph.text
+                count += 1
+            for field in model.fields:
+                field.instruction, field.result
+                count += 1
+            for hyperlink in model.hyperlinks:
+                hyperlink.anchor, hyperlink.text, hyperlink.paragraph.text
+                count += 1
+            return count
+    else:
+        from common.docx_model import DocxModel
+
+        def parse():
+            model = DocxModel.load(path)
+            count = 0
+            for para in model.paragraphs:
+                para.text, para.style.name
+                [run.size for run in para.runs]
+                count += 1
+            return count
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    count = parse()
+    seconds = time.perf_counter() - start
+    print(f'{seconds} {peak_rss_mb() - baseline} {count}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=1000, help='Pages in the generated document')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per parser; the best time is reported')
+    parser.add_argument('--media-mb', type=int, default=0, help='Megabytes of embedded images to add')
+    parser.add_argument('--worker', choices=('python-docx', 'docx-model', 'references'), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        measure(args.worker, args.path)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='nn_docx_benchmark_')
+    try:
+        path = os.path.join(work_dir, 'benchmark.docx')
+        generate(path, args.pages, args.media_mb)
+        print(f"document: {args.pages} pages, {args.pages * PARAGRAPHS_PER_PAGE} body paragraphs, "
+              f"{os.path.getsize(path) / (1024 * 1024):.1f} MB zipped\n")
+        print(f"{'parser':<14} {'best s':>10} {'peak MB':>10} {'records':>12}")
+        for name in ('python-docx', 'docx-model', 'references'):
+            results = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, '-m', 'benchmarks.docx_model_benchmark', '--worker', name, '--path', path],
+                                        capture_output=True, text=True)
+                if output.returncode != 0:
+                    break
+                seconds, megabytes, count = output.stdout.split()
+                results.append((float(seconds), float(megabytes), int(count)))
+            if not results:
+                print(f"{name:<14} failed: {output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'no output'}")
+                continue
+            seconds = min(result[0] for result in results)
+            megabytes = max(result[1] for result in results)
+            print(f"{name:<14} {seconds:>10.2f} {megabytes:>10.1f} {results[0][2]:>12}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Rule evaluation benchmark for common/layout_rules.py.
+
+Generates a synthetic PDF of --pages pages (a bold heading, body lines in a few
+sizes and bullet items at three indentations per page), extracts it once, then
+times the three span rules the checks run, the way the loops did it and with
+the array rules:
+
+    size       font size against the expected size of its style, +-0.2pt
+    margins    x0/y0/x1/y1 extent of the blocks on each page
+    bullets    bullet symbol and indentation level of list items
+
+Both sides read already extracted data (the get_text('dict') pages for the
+loops, the PdfLayout for the rules), so only rule evaluation is timed.
+Times are the best of --repeat runs.
+
+Run from the service root:
+    python -m benchmarks.layout_rules_benchmark
+    python -m benchmarks.layout_rules_benchmark --pages 500 --repeat 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from common.layout_rules import font_flags, indentation_levels, leading_symbols, page_extents, size_tolerance
+from common.pdf_layout import PdfLayout
+
+EXPECTED = {'Heading 1': 13, 'Heading 2': 12, 'Heading 3': 11, 'Normal': 10}
+STYLES = ('Heading 1', 'Heading 2', 'Heading 3', 'Normal')
+TOLERANCE = 0.2
+BULLETS = {1: ['•', '●'], 2: ['○', '◦', 'o'], 3: ['■']}
+SYMBOLS = ['•', '-', '*', '●', '○', '◦', '■', 'o']
+
+
+def generate(path, pages):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f'{number + 1} Section heading', fontname='hebo', fontsize=(13, 12, 11.5)[number % 3])
+        y = 100
+        for line in range(40):
+            if line % 8 in (3, 4, 5):
+                level = line % 8 - 3
+                symbol = (BULLETS[level + 1][0] if (number + line) % 5 else '-')
+                page.insert_text((72 + 18 * level, y), f'{symbol} list item {line}', fontname='helv', fontsize=10)
+            else:
+                page.insert_text((72, y), f'body text of line {line} on page {number + 1}',
+                                 fontname='helv', fontsize=(10, 10, 10.1, 9.5)[(number + line) % 4])
+            y += 16
+    doc.save(path)
+    doc.close()
+
+
+def loop_rules(pages):
+    '''
+    The nested loops: one Python iteration per span for every rule.
+    '''
+    issues, margins, bullet_errors = 0, [], 0
+    level, previous = 0, 0
+    for page in pages:
+        left, top, right, bottom = page['width'], page['height'], 0, 0
+        for block in page['blocks']:
+            x0, y0, x1, y1 = block['bbox']
+            left, top, right, bottom = min(left, x0), min(top, y0), max(right, x1), max(bottom, y1)
+            for line in block.get('lines', ()):
+                for span in line['spans']:
+                    text = span['text'].strip()
+                    if not text:
+                        continue
+                    size = round(span['size'], 1)
+                    font = span['font'].lower()
+                    style = 'Normal'
+                    if 'bold' in font or 'heavy' in font:
+                        for name in STYLES[:3]:
+                            if size >= EXPECTED[name] - TOLERANCE:
+                                style = name
+                                break
+                    if abs(size - EXPECTED[style]) > TOLERANCE:
+                        issues += 1
+                    if text[0] in SYMBOLS and (len(text) == 1 or text[1] == ' '):
+                        indent = int(x0)
+                        if indent > previous:
+                            level = min(level + 1, 3)
+                        elif indent < previous:
+                            level = 1
+                        previous = indent
+                        if text[0] not in BULLETS[max(level, 1)]:
+                            bullet_errors += 1
+        margins.append((left, top, right, bottom))
+    return issues, len(margins), bullet_errors
+
+
+def array_rules(layout):
+    '''
+    The same rules as array expressions over the layout's columns.
+    '''
+    sizes = np.round(layout.span_size, 1)
+    bold = font_flags(layout, 'bold', 'heavy')
+    styles = np.select([bold & (sizes >= EXPECTED[name] - TOLERANCE) for name in STYLES[:3]], [0, 1, 2], default=3)
+    expected = np.array([EXPECTED[name] for name in STYLES])[styles]
+    start, end = layout.stripped_bounds()
+    issues = size_tolerance(sizes, expected, TOLERANCE, rows=end > start)
+
+    extents = page_extents(layout)
+
+    bullets = leading_symbols(layout, SYMBOLS)
+    levels = np.maximum(indentation_levels(layout.block_bbox[layout.span_block[bullets], 0].astype(int)), 1)
+    first = layout.codes[start[bullets]]
+    correct = np.zeros(len(bullets), dtype=bool)
+    for level, symbols in BULLETS.items():
+        correct |= (levels == level) & np.isin(first, [ord(symbol) for symbol in symbols])
+    return len(issues), len(extents), int((~correct).sum())
+
+
+def best_of(repeat, func, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=2000, help='Pages in the generated PDF')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method; the best time is reported')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_rules_benchmark_')
+    try:
+        path = os.path.join(work_dir, 'benchmark.pdf')
+        generate(path, args.pages)
+        doc = fitz.open(path)
+        pages = []
+        for page in doc:
+            pages.append(dict(page.get_text('dict'), width=page.rect.width, height=page.rect.height))
+        layout = PdfLayout.extract(doc)
+        doc.close()
+        # The strip offsets are built once per layout and shared by the checks;
+        # time them on their own.
+        strip_seconds, _ = best_of(1, layout.stripped_bounds)
+        print(f"document: {args.pages} pages, {layout.span_count} spans "
+              f"(strip offsets built once in {strip_seconds * 1000:.1f} ms)\n")
+
+        print(f"{'method':<8} {'best ms':>10} {'size issues':>12} {'pages':>8} {'bullet errors':>14}")
+        for name, func, data in (('loops', loop_rules, pages), ('arrays', array_rules, layout)):
+            seconds, (issues, page_count, bullet_errors) = best_of(args.repeat, func, data)
+            print(f"{name:<8} {seconds * 1000:>10.1f} {issues:>12} {page_count:>8} {bullet_errors:>14}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+DOCX to PDF conversion benchmark for common/office_pool.py and
+common/conversion_cache.py. Needs LibreOffice
+(libreoffice_path); the warm workers also need the uno module, without which
+the pool runs a cold conversion per job.
+
+Generates a synthetic DOCX of --pages pages (see docx_model_benchmark) and
+converts --jobs copies of it, --concurrency at a time:
+
+    cold    `libreoffice --headless --convert-to pdf` per job, as
+            DocumentFormatReviewer.convert_to_pdf did (one shared profile, so
+            concurrent jobs contend for it)
+    pool    OfficePool.convert() on --workers warm workers, started before the
+            timing begins
+    cached  the pool behind convert_cached() with an empty cache: the copies
+            have the same bytes, so the first job converts, jobs arriving
+            meanwhile wait for it and later ones copy the cached PDF
+
+and reports wall time, the mean and worst time per job, and failed jobs.
+
+Run from the service root:
+    python -m benchmarks.office_pool_benchmark
+    python -m benchmarks.office_pool_benchmark --pages 50 --jobs 16 --concurrency 4 --workers 4
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import docx_model_benchmark
+from common.artifact_cache import ArtifactCache
+from common import conversion_cache
+from common.office_pool import OfficePool, converter_name, libreoffice_path
+
+
+def convert_cold(docx_path, output_dir):
+    command = [libreoffice_path, '--headless', '--convert-to', 'pdf', '--outdir', output_dir, docx_path]
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def run_jobs(convert, paths, work_dir, concurrency):
+    def job(path):
+        began = time.perf_counter()
+        output_dir = tempfile.mkdtemp(dir=work_dir)
+        try:
+            convert(path, output_dir)
+            if not os.path.exists(os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + '.pdf')):
+                return None
+        except Exception:
+            return None
+        return time.perf_counter() - began
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        times = list(executor.map(job, paths))
+    return time.perf_counter() - began, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=20, help='Pages in the generated document')
+    parser.add_argument('--jobs', type=int, default=8, help='Conversions per mode')
+    parser.add_argument('--concurrency', type=int, default=2, help='Conversions requested at once')
+    parser.add_argument('--workers', type=int, default=2, help='Workers in the pool')
+    args = parser.parse_args()
+
+    if not shutil.which(libreoffice_path):
+        parser.error(f"LibreOffice not found: '{libreoffice_path}' (set libreoffice_path)")
+
+    work_dir = tempfile.mkdtemp(prefix='nn_office_pool_benchmark_')
+    try:
+        source = os.path.join(work_dir, 'document.docx')
+        docx_model_benchmark.generate(source, args.pages)
+        paths = []
+        for index in range(args.jobs):
+            path = os.path.join(work_dir, f'document{index}.docx')
+            shutil.copyfile(source, path)
+            paths.append(path)
+        print(f"{args.jobs} conversions of a {args.pages}-page DOCX, {args.concurrency} at a time\n")
+
+        print(f"{'mode':<6} {'wall s':>8} {'mean s':>8} {'worst s':>8} {'failed':>7}")
+        pool = OfficePool(args.workers, root=tempfile.mkdtemp(dir=work_dir))
+        try:
+            # Started outside the timing, as the service starts them at first use.
+            pool.warm(wait=True)
+            conversion_cache._cache = ArtifactCache(os.path.join(work_dir, 'conversion_cache'))
+
+            def convert_pooled_cached(docx_path, output_dir):
+                return conversion_cache.convert_cached(docx_path, output_dir, lambda: pool.convert(docx_path, output_dir), converter_name())
+
+            for mode, convert in (('cold', convert_cold), ('pool', pool.convert), ('cached', convert_pooled_cached)):
+                wall, times = run_jobs(convert, paths, work_dir, args.concurrency)
+                done = [seconds for seconds in times if seconds is not None]
+                mean = sum(done) / len(done) if done else 0.0
+                print(f"{mode:<6} {wall:>8.2f} {mean:>8.2f} {max(done, default=0.0):>8.2f} {len(times) - len(done):>7}")
+        finally:
+            pool.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
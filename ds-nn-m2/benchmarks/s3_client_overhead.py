@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for the per-request cost of getting an S3 client.
+
+"cold" builds a brand-new boto3 client for every request, which is what
+S3Helper used to do. "warm" creates an S3Helper handle on the shared client
+from common.s3_operations.get_s3_client().
+
+Run from the service root:
+    python -m benchmarks.s3_client_overhead --requests 50
+    python -m benchmarks.s3_client_overhead --bucket my-bucket --key path/to/file.docx
+"""
+import argparse
+import statistics
+import time
+
+import boto3
+
+from common.s3_operations import S3Helper, aws_access_key_id, aws_secret_access_key, aws_region_name
+
+
+def cold_request(bucket, key):
+    client = boto3.client(
+        's3',
+        region_name=aws_region_name,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key
+    )
+    if key:
+        client.head_object(Bucket=bucket, Key=key)
+
+
+def warm_request(bucket, key):
+    helper = S3Helper(bucket)
+    if key:
+        helper.s3_client.head_object(Bucket=bucket, Key=key)
+
+
+def measure(fn, bucket, key, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn(bucket, key)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--bucket', default='benchmark-bucket')
+    parser.add_argument('--key', default=None, help='Object to HEAD on every request (network round trip included)')
+    args = parser.parse_args()
+
+    # The first warm request pays for creating the shared client.
+    warm_request(args.bucket, args.key)
+
+    print(f"{'mode':<6} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, fn in (('cold', cold_request), ('warm', warm_request)):
+        timings = sorted(measure(fn, args.bucket, args.key, args.requests))
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{name:<6} {statistics.mean(timings):>10.2f} {statistics.median(timings):>10.2f} {p95:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
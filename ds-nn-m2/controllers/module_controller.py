@@ -3,6 +3,7 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from scripts.format_checker import DocumentFormatReviewer, PDFFormatReviewer
 from common.logs import logger
+from common.workspace import ScratchWorkspace
 
 app = FastAPI()
 
@@ -18,9 +19,11 @@ async def check_document_format(request: DocFormatCheck):
 
 
         if document.endswith('.docx'):
-            reviewer = DocumentFormatReviewer(document)
+            # Downloaded DOCX and converted PDF are removed when the workspace closes
+            async with ScratchWorkspace('m2-format') as workspace:
+                reviewer = DocumentFormatReviewer(document, workspace)
 
-            results = reviewer.review_document()
+                results = reviewer.review_document()
 
         elif document.endswith('.pdf'):
             reviewer = PDFFormatReviewer(document)
@@ -1,19 +1,23 @@
-from docx import Document
 from docx.shared import Inches, Twips
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.oxml import OxmlElement
 from docx.shared import Pt
 from typing import List, Dict, Tuple, Optional
+from common.conversion_cache import convert_cached
+from common.docx_model import DocxModel
+from common.layout_rules import indentation_levels, leading_symbols, page_extents
 from common.logs import logger
+from common.office_pool import converter_name, convert_with_office_pool
+from common.pdf_layout import PdfLayout
 from common.s3_operations import S3Helper
+from common.workspace import ScratchWorkspace
 import re, os
-from PyPDF2 import PdfReader
 from typing import List, Dict, Optional, Any
 import re
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer, LTChar, LTAnno, LTTextBox
 import fitz  # PyMuPDF
-import subprocess
+import numpy as np
 from lxml import etree
 
 TMP_DIR = '/tmp'
@@ -21,13 +25,18 @@ if not os.path.exists(TMP_DIR):
     os.makedirs(TMP_DIR)
 
 class DocumentFormatReviewer:
-    def __init__(self, doc_path: str):
-        """Initialize with path to Word document and logger"""
+    def __init__(self, doc_path: str, workspace: ScratchWorkspace = None):
+        """
+        Initialize with path to Word document and logger. S3 downloads and the
+        converted PDF go into workspace when one is given, otherwise into TMP_DIR.
+        """
         try:
             logger.info(f"Opening document: {doc_path}")
+            self.workspace = workspace
             if doc_path.startswith('s3://'):
                 doc_path = self.download_s3_file(doc_path)
-            self.document = Document(doc_path)
+            # Checks only read the document, so the compact model replaces python-docx.
+            self.document = DocxModel.load_cached(doc_path)
             self.file_path = doc_path
             self.heading_errors = []
             self.margin_errors = []
@@ -41,7 +50,10 @@ class DocumentFormatReviewer:
         s3_bucket = word_path.split('/')[2]
         s3_helper = S3Helper(s3_bucket)
         s3_key = '/'.join(word_path.split('/')[3:])
-        local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
+        if self.workspace is not None:
+            local_file_path = self.workspace.file(s3_key)
+        else:
+            local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
                 # Download the file from S3
         s3_helper.download_file_from_s3(s3_key, local_file_path)
         return local_file_path
@@ -69,21 +81,11 @@ class DocumentFormatReviewer:
     #         raise
 
     def convert_to_pdf(self) -> str:
-        """Convert document to PDF using LibreOffice"""
-        output_dir = os.path.dirname(self.file_path)
-        pdf_file = os.path.join(output_dir, os.path.splitext(os.path.basename(self.file_path))[0] + '.pdf')
-        
+        """Convert document to PDF using the pool of warm LibreOffice workers, reusing a cached PDF of the same bytes"""
+        output_dir = self.workspace.path if self.workspace is not None else os.path.dirname(self.file_path)
         try:
-            command = [
-                "libreoffice",
-                "--headless",
-                "--convert-to", "pdf",
-                "--outdir", output_dir,
-                self.file_path
-            ]
-            subprocess.run(command, check=True)
-            return pdf_file
-        except subprocess.CalledProcessError as e:
+            return convert_cached(self.file_path, output_dir, lambda: convert_with_office_pool(self.file_path, output_dir), converter_name())
+        except Exception as e:
             logger.error(f"PDF conversion failed: {str(e)}")
             raise
 
@@ -654,23 +656,35 @@ class PDFFormatReviewer:
         try:
             logger.info(f"Opening PDF: {pdf_path}")
             if pdf_path.startswith('s3://'):
-                pdf_path = self.download_s3_file(pdf_path)
-            self.pdf_reader = PdfReader(pdf_path)
-            self.doc = fitz.open(pdf_path)  # PyMuPDF document
-            logger.info(f"PDF loaded successfully. Total pages: {len(self.pdf_reader.pages)}")
+                # Read S3 PDFs into memory instead of writing them to TMP_DIR
+                pdf_bytes = self.read_s3_file(pdf_path)
+                self.doc = fitz.open(stream=pdf_bytes, filetype='pdf')  # PyMuPDF document
+                # PyMuPDF keeps the bytes alive anyway; large PDFs hand them to shard workers
+                self.source = pdf_bytes
+            else:
+                self.doc = fitz.open(pdf_path)  # PyMuPDF document
+                self.source = pdf_path
+            self._layout = None
+            logger.info(f"PDF loaded successfully. Total pages: {self.doc.page_count}")
         except Exception as e:
             logger.error(f"Failed to open PDF: {str(e)}")
             raise
     
-    def download_s3_file(self, word_path):
-        s3_bucket = word_path.split('/')[2]
+    def read_s3_file(self, pdf_path) -> bytes:
+        s3_bucket = pdf_path.split('/')[2]
         s3_helper = S3Helper(s3_bucket)
-        s3_key = '/'.join(word_path.split('/')[3:])
-        local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-                # Download the file from S3
-        s3_helper.download_file_from_s3(s3_key, local_file_path)
-        return local_file_path
+        s3_key = '/'.join(pdf_path.split('/')[3:])
+        with s3_helper.get_object_stream(s3_key) as stream:
+            return stream.read()
     
+    @property
+    def layout(self) -> PdfLayout:
+        """Span, block and page tables of the PDF, extracted once and shared by all checks"""
+        if self._layout is None:
+            self._layout = PdfLayout.extract_file(self.source, self.doc)
+            logger.info(f"Extracted layout: {self._layout.page_count} pages, {self._layout.span_count} spans")
+        return self._layout
+
     def get_heading_level(self, text: str, font_size: float) -> Optional[int]:
         """Determine heading level based on font size and formatting"""
         try:
@@ -695,38 +709,37 @@ class PDFFormatReviewer:
         current_levels = [0] * 9  # Track numbering for up to 9 levels
         
         try:
-            for page_num, page in enumerate(self.doc, 1):
-                blocks = page.get_text("dict")["blocks"]
-                for block in blocks:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                text = span["text"].strip()
-                                font_size = span["size"]
-                                
-                                level = self.get_heading_level(text, font_size)
-                                if level is not None:
-                                    logger.info(f"Checking heading on page {page_num}: {text}")
-                                    level -= 1  # Convert to 0-based index
-                                    
-                                    # Check if higher level headings exist
-                                    for i in range(level):
-                                        if current_levels[i] == 0:
-                                            error_msg = f"Page {page_num}: Heading level {level + 1} found before level {i + 1}"
-                                            logger.error(error_msg)
-                                            errors.append(error_msg)
-                                    
-                                    # Update numbering
-                                    current_levels[level] += 1
-                                    for i in range(level + 1, 9):
-                                        current_levels[i] = 0
-                                    
-                                    # Check numbering format
-                                    expected_number = '.'.join(str(n) for n in current_levels[:level + 1] if n > 0)
-                                    if not text.startswith(expected_number):
-                                        error_msg = f"Page {page_num}: Incorrect heading numbering: '{text}' should start with '{expected_number}'"
-                                        logger.error(error_msg)
-                                        errors.append(error_msg)
+            layout = self.layout
+            span_pages = layout.span_page.tolist()
+            span_sizes = layout.span_size.tolist()
+            for index, text in enumerate(layout.span_texts()):
+                text = text.strip()
+                font_size = span_sizes[index]
+                page_num = span_pages[index] + 1
+                
+                level = self.get_heading_level(text, font_size)
+                if level is not None:
+                    logger.info(f"Checking heading on page {page_num}: {text}")
+                    level -= 1  # Convert to 0-based index
+                    
+                    # Check if higher level headings exist
+                    for i in range(level):
+                        if current_levels[i] == 0:
+                            error_msg = f"Page {page_num}: Heading level {level + 1} found before level {i + 1}"
+                            logger.error(error_msg)
+                            errors.append(error_msg)
+                    
+                    # Update numbering
+                    current_levels[level] += 1
+                    for i in range(level + 1, 9):
+                        current_levels[i] = 0
+                    
+                    # Check numbering format
+                    expected_number = '.'.join(str(n) for n in current_levels[:level + 1] if n > 0)
+                    if not text.startswith(expected_number):
+                        error_msg = f"Page {page_num}: Incorrect heading numbering: '{text}' should start with '{expected_number}'"
+                        logger.error(error_msg)
+                        errors.append(error_msg)
                                     
         except Exception as e:
             error_msg = f"Error in heading numbering check: {str(e)}"
@@ -742,41 +755,16 @@ class PDFFormatReviewer:
         distinct_margins = {}
         
         try:
-            for i in range(self.doc.page_count):
-                page = self.doc.load_page(i)
-                
-                # Get page dimensions (in points, 1 inch = 72 points)
-                page_rect = page.rect
-                page_width = page_rect.width
-                page_height = page_rect.height
-                
-                # Define the margins based on page content (or assume default margins)
-                # Assuming the page content starts at a fixed position and doesn't have a header/footer
-                blocks = page.get_text("dict")["blocks"]
-                        
-                        # Track content boundaries
-                left_margin = page_width
-                right_margin = 0
-                top_margin = page_height
-                bottom_margin = 0
-                        
-                        # Check each block's position
-                for block in blocks:
-                    if "bbox" in block:
-                        x0, y0, x1, y1 = block["bbox"]
-                                
-                                # Update content boundaries
-                        left_margin = min(left_margin, x0)
-                        right_margin = max(right_margin, x1)
-                        top_margin = min(top_margin, y0)
-                        bottom_margin = max(bottom_margin, y1)
-                
-                
-                # Convert to inches (1 point = 1/72 inch)
+            layout = self.layout
+            # Content boundaries of every page at once; a page without blocks
+            # keeps its full size as left/top and 0 as right/bottom.
+            extents = page_extents(layout).tolist()
+            for i in range(layout.page_count):
+                left_margin, top_margin, right_margin, bottom_margin = extents[i]
 
                 # Convert to inches (1 point = 1/72 inch)
                 margins = {
-                    'top': round(top_margin / 72, 2),  # Convert points to inches
+                    'top': round(top_margin / 72, 2),
                     'bottom': round(bottom_margin / 72, 2),
                     'left': round(left_margin / 72, 2),
                     'right': round(right_margin / 72, 2)
@@ -831,71 +819,39 @@ class PDFFormatReviewer:
             '■', '□', '▪️', '▣', '▤', '⬧', '➔', '⬛', 'o', '✓', '✔', '❖'  # Common Level 3 bullets
         ]
 
-        current_level = 0  # Default starting level for top-level bullets
-        previous_text = ""  # Variable to track the previous bullet point text
-        previous_indentation = 0  # To track the indentation level of the previous bullet point
-
         try:
-            for page_num, page in enumerate(self.doc, 1):
-                blocks = page.get_text("dict")["blocks"]
-
-                for block in blocks:
-                    # print(f'Block: {block}')
-                    x0 = block['bbox'][0]
-                    # print(x0)
-                    indentation_level = int(x0)
-                    # print(x0)
-                    if "lines" in block:
-                        for i, line in enumerate(block["lines"]):
-                            for span in line["spans"]:
-                                # text = span["text"]
-                                text = span["text"].strip()
-                                # print(text)
-                                # Check if line starts with a recognized bullet point
-                                if text and text[0] in set(recognized_bullet_symbols):
-                                    logger.info(f"Found bullet point on page {page_num}: {text}")
-                                    
-                                    # Skip if the bullet point is not properly formatted (needs space after symbol)
-                                    if len(text) > 1 and text[1] != ' ':
-                                        continue
-                                    
-                                    # print(text)
-                                    # Count leading spaces (indentation) to determine bullet depth
-                                    # indentation_level = len(text) - len(text.lstrip())
-
-                                    # Determine if the current bullet is a child of the previous one
-                                    if indentation_level > previous_indentation:
-                                        # Indentation level increased, meaning it's a child of the previous bullet point
-                                        current_level = min(current_level + 1, 3)  # Max level is 3
-                                        logger.info(f"Bullet point is a child of the previous bullet: {text}")
-                                    elif indentation_level < previous_indentation:
-                                        # Indentation level decreased, meaning it's at the same level as a previous bullet
-                                        current_level = 1  # Reset to level 1 for a new root bullet
-                                        logger.info(f"Bullet point is not at the same level as a previous bullet: {text}")
-                                    else:
-                                        # Same indentation level as the previous bullet, so it stays at the same level
-                                        current_level = current_level
-                                        logger.info(f"Bullet point is at the same level as the previous bullet: {text}")
-                                        
-                                    # Validate the bullet point's format
-                                    if text[0] not in bullet_patterns[current_level]:
-                                        error_msg = {
-                                            "page": page_num,
-                                            "text": text,
-                                            "incorrect_symbol": text[0],
-                                            "level": current_level,
-                                            "expected_symbol": bullet_patterns[current_level]
-                                        }
-                                        logger.error(f"Formatting error: {error_msg}")
-                                        errors.append(error_msg)
-                                    else:
-                                        logger.info(f"Correct bullet format found for level {current_level}: {text[0]}")
-                                        
-                                    # Update previous bullet point for next iteration
-                                    print(text, indentation_level)
-                                    previous_text = text
-                                    previous_indentation = indentation_level
-                            
+            layout = self.layout
+            # Spans that start with a recognized bullet point followed by a space
+            bullets = leading_symbols(layout, recognized_bullet_symbols)
+            # A bullet's indentation is the left edge of its block; its level
+            # follows from how that changes from one bullet to the next.
+            indentation = layout.block_bbox[layout.span_block[bullets], 0].astype(int)
+            levels = indentation_levels(indentation, max_level=3)
+            # Bullets at x0 = 0 before any indented one come out as level 0; treat them as level 1
+            levels = np.maximum(levels, 1)
+            logger.info(f"Found {len(bullets)} bullet points")
+
+            # Validate the bullet points' format, level by level
+            start, end = layout.stripped_bounds()
+            first_codes = layout.codes[start[bullets]]
+            correct = np.zeros(len(bullets), dtype=bool)
+            for level, symbols in bullet_patterns.items():
+                correct |= (levels == level) & np.isin(first_codes, [ord(symbol) for symbol in symbols if len(symbol) == 1])
+
+            for index in np.flatnonzero(~correct).tolist():
+                span = bullets[index]
+                text = layout.text[start[span]:end[span]]
+                level = int(levels[index])
+                error_msg = {
+                    "page": int(layout.span_page[span]) + 1,
+                    "text": text,
+                    "incorrect_symbol": text[0],
+                    "level": level,
+                    "expected_symbol": bullet_patterns[level]
+                }
+                logger.error(f"Formatting error: {error_msg}")
+                errors.append(error_msg)
+
         except Exception as e:
             error_msg = f"Error in bullet points check: {str(e)}"
             logger.error(error_msg)
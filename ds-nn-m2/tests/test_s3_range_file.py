@@ -0,0 +1,74 @@
+import io
+import unittest
+import zipfile
+from botocore.exceptions import ClientError
+from common.s3_operations import S3RangeFile
+
+ETAG = '"v1"'
+
+
+class FakeS3Client:
+    '''
+    Serves one object. Ranged GETs fail with range_error when it is set, and a
+    GET whose IfMatch differs from the object's ETag fails like S3 does.
+    '''
+    def __init__(self, data: bytes, range_error: Exception = None) -> None:
+        self.data = data
+        self.etag = ETAG
+        self.range_error = range_error
+        self.calls = []
+
+    def get_object(self, Bucket, Key, IfMatch=None, Range=None):
+        self.calls.append({'IfMatch': IfMatch, 'Range': Range})
+        if Range is not None and self.range_error is not None:
+            raise self.range_error
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'GetObject')
+        if Range is None:
+            return {'Body': io.BytesIO(self.data)}
+        start, end = (int(n) for n in Range[len('bytes='):].split('-'))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+
+def docx_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as package:
+        package.writestr('[Content_Types].xml', '<Types/>')
+        package.writestr('word/document.xml', '<w:document>' + 'x' * 100000 + '</w:document>')
+    return buffer.getvalue()
+
+
+def range_file(client: FakeS3Client) -> S3RangeFile:
+    head = {'ContentLength': len(client.data), 'ETag': ETAG}
+    return S3RangeFile(client, 'bucket', 'doc.docx', head, tail_bytes=1024, read_bytes=4096, max_read_bytes=16384)
+
+
+class S3RangeFileFallbackTest(unittest.TestCase):
+    def test_failed_ranged_read_downloads_the_object_whole(self):
+        data = docx_bytes()
+        client = FakeS3Client(data, range_error=ClientError({'Error': {'Code': 'InvalidRange'}}, 'GetObject'))
+        with range_file(client) as raw, zipfile.ZipFile(io.BufferedReader(raw)) as package:
+            self.assertEqual(package.read('word/document.xml'), zipfile.ZipFile(io.BytesIO(data)).read('word/document.xml'))
+            self.assertTrue(raw.stats['fallback'])
+        whole = [call for call in client.calls if call['Range'] is None]
+        self.assertEqual(len(whole), 1)
+        self.assertEqual(whole[0]['IfMatch'], ETAG)
+
+    def test_overwrite_during_fallback_fails(self):
+        client = FakeS3Client(docx_bytes(), range_error=IOError('connection reset'))
+        client.etag = '"v2"'
+        with range_file(client) as raw:
+            with self.assertRaises(ClientError):
+                raw.read(16)
+
+    def test_overwrite_during_ranged_read_does_not_fall_back(self):
+        client = FakeS3Client(docx_bytes())
+        client.etag = '"v2"'
+        with range_file(client) as raw:
+            with self.assertRaises(ClientError):
+                raw.read(16)
+            self.assertFalse(raw.stats['fallback'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Benchmark of reading a DOCX's text from S3 whole versus with ranged reads, run
+without AWS.
+
+Seeds a LocalObjectStore (common/object_store.py) with a DOCX of --pages pages
+of text plus --media-mb of embedded images, then builds the DocxModel (as the
+DOCX reader does) from:
+
+    full      S3Helper.get_object_stream(): the whole object is downloaded
+    ranged    S3Helper.open_package(): ranged GETs of the zip's central
+              directory and of the parts DocxModel reads
+
+and reports requests, bytes transferred and wall time. --latency-ms adds a
+fixed delay to every request. The local store has no bandwidth limit, so a
+transfer time on a --link-mbps link is also given, modelled as
+requests x latency + bytes / bandwidth. The download and artifact caches are
+disabled so that every run fetches.
+
+Run from the service root:
+    python -m benchmarks.package_read_benchmark
+    python -m benchmarks.package_read_benchmark --pages 500 --media-mb 100 --latency-ms 20
+"""
+import argparse
+import importlib
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+BUCKET = 'benchmark-bucket'
+KEY = 'benchmark/document.docx'
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+WORDS = ('quality', 'procedure', 'document', 'control', 'review', 'record', 'process', 'audit', 'ISO', 'GMP', 'FDA', 'SOP')
+
+
+def configure(work_dir, latency_ms):
+    # Must run before common.* is imported: those modules read their settings at import time.
+    os.environ['object_store_backend'] = 'local'
+    os.environ['object_store_root'] = os.path.join(work_dir, 'store')
+    os.environ['object_store_latency_ms'] = str(latency_ms)
+    os.environ['s3_cache_enabled'] = 'false'
+    os.environ['artifact_cache_enabled'] = 'false'
+
+
+def generate(path, pages, media_mb):
+    paragraphs = []
+    for index in range(pages * 14):
+        words = ' '.join(WORDS[(index * 5 + offset) % len(WORDS)] for offset in range(14))
+        paragraphs.append(f'<w:p><w:r><w:t xml:space="preserve">{index} {words}</w:t></w:r></w:p>')
+    relationships = ''.join(f'<Relationship Id="rIdMedia{index}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+                            f'Target="media/image{index}.png"/>' for index in range(media_mb))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Default Extension="png" ContentType="image/png"/></Types>')
+        package.writestr('_rels/.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                         'Target="word/document.xml"/></Relationships>')
+        package.writestr('word/document.xml',
+                         f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {W}><w:body>{"".join(paragraphs)}</w:body></w:document>')
+        package.writestr('word/_rels/document.xml.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{relationships}</Relationships>')
+        for index in range(media_mb):
+            # Random bytes do not compress, like real image data.
+            package.writestr(zipfile.ZipInfo(f'word/media/image{index}.png'), os.urandom(1024 * 1024), zipfile.ZIP_STORED)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='Pages of text in the document')
+    parser.add_argument('--media-mb', type=int, default=50, help='Megabytes of embedded images')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every object store request')
+    parser.add_argument('--link-mbps', type=float, default=100.0, help='Link speed for the modelled transfer time')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode; the best time is reported')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_package_benchmark_')
+    configure(work_dir, args.latency_ms)
+    object_store = importlib.import_module('common.object_store')
+    s3_operations = importlib.import_module('common.s3_operations')
+    DocxModel = importlib.import_module('common.docx_model').DocxModel
+    try:
+        path = os.path.join(work_dir, 'document.docx')
+        generate(path, args.pages, args.media_mb)
+        size = os.path.getsize(path)
+        store = object_store.get_local_object_store()
+        os.makedirs(os.path.join(store.root, BUCKET), exist_ok=True)
+        with open(path, 'rb') as body:
+            store.put_object(Bucket=BUCKET, Key=KEY, Body=body)
+        helper = s3_operations.S3Helper(BUCKET)
+        print(f"document: {args.pages} pages, {args.media_mb} MB of images, {size / (1024 * 1024):.1f} MB\n")
+
+        print(f"{'mode':<8} {'requests':>9} {'MB':>8} {'best s':>8} {'model s':>8} {'paragraphs':>11}")
+        for mode in ('full', 'ranged'):
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                if mode == 'full':
+                    # HEAD-less streaming download, then the parse.
+                    with helper.get_object_stream(KEY) as source:
+                        model = DocxModel.load(source)
+                    requests, fetched = 1, size
+                else:
+                    with helper.open_package(KEY) as source:
+                        model = DocxModel.load(source)
+                        stats = getattr(source, 'stats', {'requests': 1, 'bytes_fetched': size})
+                    # One HEAD plus the ranged GETs.
+                    requests, fetched = stats['requests'] + 1, stats['bytes_fetched']
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            modelled = requests * args.latency_ms / 1000 + fetched * 8 / (args.link_mbps * 1e6)
+            print(f"{mode:<8} {requests:>9} {fetched / (1024 * 1024):>8.2f} {best:>8.2f} {modelled:>8.2f} {len(model.paragraphs):>11}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+s3_cache_enabled = os.getenv('s3_cache_enabled', 'true').lower() in ('1', 'true', 'yes')
+s3_cache_dir = os.getenv('s3_cache_dir', os.path.join(tempfile.gettempdir(), 'nn_s3_cache'))
+s3_cache_max_bytes = int(os.getenv('s3_cache_max_bytes', 2 * 1024 * 1024 * 1024))
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    '''
+    Exclusive lock on a lock file, held across processes and threads.
+    Uses flock on POSIX and msvcrt.locking on Windows.
+    '''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if os.name == 'nt':
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting.
+                    continue
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class DownloadCache:
+    '''
+    Content-addressed on-disk cache of S3 objects shared by every service on the host.
+    Entries are keyed by bucket, key and ETag, so a hit costs a single HEAD request.
+    Writes are atomic (download to a .part file, then os.replace), concurrent
+    downloads of the same object are serialised with a per-entry file lock, and the
+    total size is kept under max_bytes by evicting the least recently used entries.
+    '''
+    LOCK_SUFFIX = '.lock'
+    PART_SUFFIX = '.part'
+    # .part files untouched for this long belong to a download that died.
+    STALE_PART_SECONDS = 3600
+
+    def __init__(self, cache_dir: str = s3_cache_dir, max_bytes: int = s3_cache_max_bytes) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def entry_path(self, bucket: str, key: str, etag: str) -> str:
+        '''
+        Returns the cache path for one version of an object. The key's extension is
+        kept because several readers pick a parser from the file suffix.
+        '''
+        digest = hashlib.sha256(f'{bucket}\0{key}\0{etag}'.encode('utf-8')).hexdigest()
+        extension = os.path.splitext(key)[1].lower()
+        return os.path.join(self.cache_dir, digest[:2], digest + extension)
+
+    def lookup(self, s3_client, bucket: str, key: str):
+        '''
+        Checks the cache for the current version of s3://bucket/key with one HEAD request.
+        Returns (path, head) where path is None on a miss; nothing is downloaded.
+        '''
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        path = self.entry_path(bucket, key, head['ETag'].strip('"'))
+        if os.path.exists(path):
+            self._hit(path)
+            return path, head
+        self._record('misses')
+        return None, head
+
+    def fetch(self, s3_client, bucket: str, key: str, transfer_config=None) -> str:
+        '''
+        Returns a local path holding the current version of s3://bucket/key,
+        downloading it only if that version is not cached yet.
+        Callers must treat the returned file as read-only.
+        '''
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        etag = head['ETag'].strip('"')
+        path = self.entry_path(bucket, key, etag)
+
+        if os.path.exists(path):
+            self._hit(path)
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with FileLock(path + self.LOCK_SUFFIX):
+            # Another thread or process may have finished the download while we waited.
+            if os.path.exists(path):
+                self._hit(path)
+                return path
+
+            part_path = f'{path}.{os.getpid()}.{threading.get_ident()}{self.PART_SUFFIX}'
+            try:
+                # The download must be the version the HEAD saw, or newer bytes would be
+                # cached under its ETag. download_file takes a VersionId but no IfMatch,
+                # so unversioned objects are read with one GET that fails (PreconditionFailed)
+                # if the object was overwritten in between.
+                if head.get('VersionId'):
+                    s3_client.download_file(bucket, key, part_path, ExtraArgs={'VersionId': head['VersionId']}, Config=transfer_config)
+                else:
+                    response = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=head['ETag'])
+                    with response['Body'] as body, open(part_path, 'wb') as file:
+                        shutil.copyfileobj(body, file, 1024 * 1024)
+                os.replace(part_path, path)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        self._record('misses')
+        logger.info(f"Download cache miss for s3://{bucket}/{key} (etag {etag}), cached at {path}")
+        self.evict(keep=path)
+        return path
+
+    def materialize(self, s3_client, bucket: str, key: str, file_name: str, transfer_config=None, read_only: bool = False) -> str:
+        '''
+        Places a copy of s3://bucket/key at file_name, going through the cache.
+        The caller owns the copy and may edit or delete it. With read_only set the
+        file is hard-linked to the cache entry when possible, so no bytes are
+        copied, and must then only be read or deleted: writing to it would
+        change the cached bytes.
+        '''
+        path = self.fetch(s3_client, bucket, key, transfer_config)
+        if os.path.dirname(file_name):
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        if read_only:
+            try:
+                os.link(path, file_name)
+                return file_name
+            except OSError:
+                # Different volume or no hard link support.
+                pass
+        shutil.copyfile(path, file_name)
+        return file_name
+
+    def evict(self, keep: str = None) -> None:
+        '''
+        Removes least recently used entries until the cache fits in max_bytes,
+        and .part files left behind by downloads that died. Lock files are never
+        removed: a process may still hold or wait on one, and a new file under
+        the same name would let two processes download the same entry at once.
+        '''
+        with FileLock(os.path.join(self.cache_dir, '.evict' + self.LOCK_SUFFIX)):
+            entries = []
+            total = 0
+            now = time.time()
+            for root, dirs, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(self.LOCK_SUFFIX):
+                        continue
+                    path = os.path.join(root, name)
+                    if name.endswith(self.PART_SUFFIX):
+                        self._remove_stale_part(path, now)
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still open on Windows, or already removed by another process.
+                    continue
+                total -= size
+                self._record('evictions')
+            logger.info(f"Download cache evicted entries, {total} bytes remain (limit {self.max_bytes})")
+
+    def _remove_stale_part(self, path: str, now: float) -> None:
+        # A .part file still growing belongs to a running download.
+        try:
+            if now - os.stat(path).st_mtime > self.STALE_PART_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _hit(self, path: str) -> None:
+        # The modification time doubles as the LRU timestamp.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._record('hits')
+        logger.info(f"Download cache hit: {path}")
+
+    def _record(self, counter: str) -> None:
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_download_cache = None
+_download_cache_lock = threading.Lock()
+
+
+def get_download_cache():
+    '''
+    Returns the process-wide DownloadCache, or None when s3_cache_enabled is off.
+    '''
+    global _download_cache
+    if not s3_cache_enabled:
+        return None
+    if _download_cache is None:
+        with _download_cache_lock:
+            if _download_cache is None:
+                _download_cache = DownloadCache()
+    return _download_cache
@@ -0,0 +1,489 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 's3' talks to AWS; 'local' serves buckets from directories under object_store_root.
+object_store_backend = os.getenv('object_store_backend', 's3').lower()
+object_store_root = os.getenv('object_store_root', os.path.join(tempfile.gettempdir(), 'nn_object_store'))
+# Optional delay added to every request so local runs resemble network round trips.
+object_store_latency_ms = float(os.getenv('object_store_latency_ms', 0))
+
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _client_error(code: str, message: str, operation: str, status: int) -> ClientError:
+    return ClientError(
+        {'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+        operation
+    )
+
+
+def _parse_range(range_header: str, size: int):
+    '''
+    Parses a single HTTP byte range ('bytes=0-99', 'bytes=100-', 'bytes=-500')
+    into an inclusive (start, end) pair clamped to the object size.
+    '''
+    try:
+        unit, spec = range_header.split('=', 1)
+        first, last = spec.split('-', 1)
+        if unit.strip() != 'bytes':
+            raise ValueError(range_header)
+        if first == '':
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise _client_error('InvalidArgument', f'Invalid range: {range_header}', 'GetObject', 400)
+    if start >= size or start > end:
+        raise _client_error('InvalidRange', 'The requested range is not satisfiable', 'GetObject', 416)
+    return start, end
+
+
+class LocalStreamingBody:
+    '''
+    File-backed stand-in for botocore's StreamingBody, limited to a byte range.
+    '''
+    def __init__(self, path: str, start: int, length: int) -> None:
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, amt: int = None) -> bytes:
+        if amt is None or amt < 0 or amt > self._remaining:
+            amt = self._remaining
+        data = self._file.read(amt)
+        self._remaining -= len(data)
+        return data
+
+    def iter_chunks(self, chunk_size: int = COPY_CHUNK_SIZE):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class LocalPaginator:
+    '''
+    Paginator for LocalObjectStore.list_objects_v2 with the boto3 paginate() signature.
+    '''
+    def __init__(self, store) -> None:
+        self.store = store
+
+    def paginate(self, **kwargs):
+        config = kwargs.pop('PaginationConfig', {}) or {}
+        if config.get('PageSize'):
+            kwargs['MaxKeys'] = config['PageSize']
+        while True:
+            page = self.store.list_objects_v2(**kwargs)
+            yield page
+            if not page.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+class LocalObjectStore:
+    '''
+    Directory-backed object store exposing the subset of the boto3 S3 client used by
+    S3Helper and the download cache: HEAD, ranged GET, list with delimiter and
+    pagination, put, multipart upload and the managed download/upload transfers.
+    Each bucket is a directory under root and each key a file inside it; ETags and
+    user metadata live in a parallel .meta tree. Missing objects raise the same
+    botocore ClientError codes as S3, so callers need no special cases.
+    Writes go through a temporary file and os.replace, so readers never see
+    partial objects.
+    '''
+    META_DIR = '.meta'
+    UPLOADS_DIR = '.uploads'
+
+    def __init__(self, root: str = object_store_root, latency_ms: float = object_store_latency_ms) -> None:
+        self.root = root
+        self.latency = latency_ms / 1000.0
+        os.makedirs(os.path.join(self.root, self.UPLOADS_DIR), exist_ok=True)
+
+    # Paths
+
+    def _bucket_dir(self, bucket: str) -> str:
+        return os.path.join(self.root, bucket)
+
+    def _object_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self._bucket_dir(bucket), *key.split('/'))
+
+    def _meta_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, self.META_DIR, bucket, *key.split('/')) + '.json'
+
+    def _upload_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, self.UPLOADS_DIR, upload_id)
+
+    def _request(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Object metadata
+
+    def _read_meta(self, bucket: str, key: str, operation: str) -> dict:
+        path = self._object_path(bucket, key)
+        if not os.path.isfile(path):
+            if operation == 'HeadObject':
+                raise _client_error('404', 'Not Found', operation, 404)
+            raise _client_error('NoSuchKey', 'The specified key does not exist.', operation, 404)
+        stat = os.stat(path)
+        try:
+            with open(self._meta_path(bucket, key), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            # Files dropped into the root by hand have no sidecar yet.
+            meta = {'ETag': self._file_md5(path), 'Metadata': {}, 'ContentType': 'binary/octet-stream'}
+        meta['ContentLength'] = stat.st_size
+        meta['LastModified'] = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        return meta
+
+    def _write_object(self, bucket: str, key: str, source_path: str, etag: str, metadata: dict = None,
+                      content_type: str = None) -> str:
+        path = self._object_path(bucket, key)
+        meta_path = self._meta_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            'ETag': etag,
+            'Metadata': {name.lower(): value for name, value in (metadata or {}).items()},
+            'ContentType': content_type or 'binary/octet-stream'
+        }
+        meta_tmp = f'{meta_path}.{uuid.uuid4().hex}.tmp'
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(source_path, path)
+        os.replace(meta_tmp, meta_path)
+        return etag
+
+    def _spool_path(self, bucket: str) -> str:
+        # Temporary files live on the same volume as the bucket so os.replace is atomic.
+        spool_dir = os.path.join(self.root, self.UPLOADS_DIR)
+        os.makedirs(spool_dir, exist_ok=True)
+        return os.path.join(spool_dir, f'{bucket}.{uuid.uuid4().hex}.tmp')
+
+    @staticmethod
+    def _file_md5(path: str) -> str:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return '"' + digest.hexdigest() + '"'
+
+    @staticmethod
+    def _head_response(meta: dict) -> dict:
+        return {
+            'ETag': meta['ETag'],
+            'ContentLength': meta['ContentLength'],
+            'LastModified': meta['LastModified'],
+            'ContentType': meta.get('ContentType', 'binary/octet-stream'),
+            'Metadata': dict(meta.get('Metadata', {})),
+            'AcceptRanges': 'bytes'
+        }
+
+    # Client API
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self._request()
+        return self._head_response(self._read_meta(Bucket, Key, 'HeadObject'))
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None, IfMatch: str = None, **kwargs) -> dict:
+        self._request()
+        meta = self._read_meta(Bucket, Key, 'GetObject')
+        if IfMatch is not None and IfMatch.strip('"') != meta['ETag'].strip('"'):
+            raise _client_error('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold', 'GetObject', 412)
+        response = self._head_response(meta)
+        size = meta['ContentLength']
+        if Range:
+            start, end = _parse_range(Range, size)
+            response['ContentRange'] = f'bytes {start}-{end}/{size}'
+        else:
+            start, end = 0, size - 1
+        response['ContentLength'] = end - start + 1
+        response['Body'] = LocalStreamingBody(self._object_path(Bucket, Key), start, end - start + 1)
+        return response
+
+    def put_object(self, Bucket: str, Key: str, Body=b'', Metadata: dict = None, ContentType: str = None, **kwargs) -> dict:
+        self._request()
+        tmp_path = self._spool_path(Bucket)
+        digest = hashlib.md5()
+        with open(tmp_path, 'wb') as f:
+            if isinstance(Body, (bytes, bytearray)):
+                Body = io.BytesIO(Body)
+            elif isinstance(Body, str):
+                Body = io.BytesIO(Body.encode('utf-8'))
+            for chunk in iter(lambda: Body.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        etag = self._write_object(Bucket, Key, tmp_path, '"' + digest.hexdigest() + '"', Metadata, ContentType)
+        return {'ETag': etag}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self._request()
+        for path in (self._object_path(Bucket, Key), self._meta_path(Bucket, Key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', Delimiter: str = None, MaxKeys: int = 1000,
+                        ContinuationToken: str = None, StartAfter: str = None, **kwargs) -> dict:
+        self._request()
+        bucket_dir = self._bucket_dir(Bucket)
+        if not os.path.isdir(bucket_dir):
+            raise _client_error('NoSuchBucket', 'The specified bucket does not exist', 'ListObjectsV2', 404)
+
+        # Only walk the part of the tree that can match the prefix.
+        base = Prefix.rsplit('/', 1)[0] if '/' in Prefix else ''
+        walk_root = os.path.join(bucket_dir, *base.split('/')) if base else bucket_dir
+        keys = []
+        for root, dirs, files in os.walk(walk_root):
+            for name in files:
+                key = os.path.relpath(os.path.join(root, name), bucket_dir).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+
+        after = ContinuationToken or StartAfter
+        entries = []
+        seen_prefixes = set()
+        for key in keys:
+            if after and key <= after:
+                continue
+            if Delimiter:
+                rest = key[len(Prefix):]
+                if Delimiter in rest:
+                    common_prefix = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                    if common_prefix not in seen_prefixes:
+                        seen_prefixes.add(common_prefix)
+                        entries.append((common_prefix, None))
+                    continue
+            entries.append((key, key))
+
+        page, truncated = entries[:MaxKeys], len(entries) > MaxKeys
+        contents = []
+        common_prefixes = []
+        for name, key in page:
+            if key is None:
+                common_prefixes.append({'Prefix': name})
+                continue
+            meta = self._read_meta(Bucket, key, 'ListObjectsV2')
+            contents.append({'Key': key, 'Size': meta['ContentLength'], 'ETag': meta['ETag'],
+                             'LastModified': meta['LastModified'], 'StorageClass': 'STANDARD'})
+
+        response = {'Name': Bucket, 'Prefix': Prefix, 'MaxKeys': MaxKeys, 'KeyCount': len(page), 'IsTruncated': truncated}
+        if contents:
+            response['Contents'] = contents
+        if common_prefixes:
+            response['CommonPrefixes'] = common_prefixes
+        if Delimiter:
+            response['Delimiter'] = Delimiter
+        if truncated:
+            last = page[-1][0]
+            # Skip everything under the last common prefix on the next page.
+            response['NextContinuationToken'] = last + '\uffff' if page[-1][1] is None else last
+        return response
+
+    def get_paginator(self, operation_name: str) -> LocalPaginator:
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(f'LocalObjectStore has no paginator for {operation_name}')
+        return LocalPaginator(self)
+
+    # Multipart upload
+
+    def create_multipart_upload(self, Bucket: str, Key: str, Metadata: dict = None, ContentType: str = None, **kwargs) -> dict:
+        self._request()
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, 'upload.json'), 'w', encoding='utf-8') as f:
+            json.dump({'Bucket': Bucket, 'Key': Key, 'Metadata': Metadata or {}, 'ContentType': ContentType}, f)
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _load_upload(self, upload_id: str, operation: str) -> dict:
+        try:
+            with open(os.path.join(self._upload_dir(upload_id), 'upload.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except OSError:
+            raise _client_error('NoSuchUpload', 'The specified upload does not exist.', operation, 404)
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body=b'', **kwargs) -> dict:
+        self._request()
+        self._load_upload(UploadId, 'UploadPart')
+        if isinstance(Body, (bytes, bytearray)):
+            Body = io.BytesIO(Body)
+        digest = hashlib.md5()
+        part_path = os.path.join(self._upload_dir(UploadId), f'{int(PartNumber):05d}.part')
+        with open(part_path + '.tmp', 'wb') as f:
+            for chunk in iter(lambda: Body.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(part_path + '.tmp', part_path)
+        etag = '"' + digest.hexdigest() + '"'
+        with open(part_path + '.etag', 'w', encoding='utf-8') as f:
+            f.write(etag)
+        return {'ETag': etag}
+
+    def list_parts(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> dict:
+        self._request()
+        self._load_upload(UploadId, 'ListParts')
+        upload_dir = self._upload_dir(UploadId)
+        parts = []
+        for name in sorted(os.listdir(upload_dir)):
+            if name.endswith('.part'):
+                path = os.path.join(upload_dir, name)
+                with open(path + '.etag', 'r', encoding='utf-8') as f:
+                    etag = f.read()
+                parts.append({'PartNumber': int(name[:-5]), 'ETag': etag, 'Size': os.path.getsize(path)})
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': UploadId, 'Parts': parts}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict = None, **kwargs) -> dict:
+        self._request()
+        upload = self._load_upload(UploadId, 'CompleteMultipartUpload')
+        upload_dir = self._upload_dir(UploadId)
+        requested = sorted((MultipartUpload or {}).get('Parts', []), key=lambda part: part['PartNumber'])
+        if not requested:
+            raise _client_error('MalformedXML', 'The XML you provided was not well-formed.', 'CompleteMultipartUpload', 400)
+
+        tmp_path = self._spool_path(Bucket)
+        part_digests = b''
+        with open(tmp_path, 'wb') as out:
+            for part in requested:
+                part_path = os.path.join(upload_dir, f"{int(part['PartNumber']):05d}.part")
+                try:
+                    with open(part_path + '.etag', 'r', encoding='utf-8') as f:
+                        stored_etag = f.read()
+                except OSError:
+                    stored_etag = None
+                if stored_etag is None or stored_etag != part['ETag']:
+                    out.close()
+                    os.remove(tmp_path)
+                    raise _client_error('InvalidPart', 'One or more of the specified parts could not be found.',
+                                        'CompleteMultipartUpload', 400)
+                part_digests += bytes.fromhex(stored_etag.strip('"'))
+                with open(part_path, 'rb') as f:
+                    shutil.copyfileobj(f, out, COPY_CHUNK_SIZE)
+
+        # Same ETag format as S3: md5 of the concatenated part digests plus the part count.
+        etag = f'"{hashlib.md5(part_digests).hexdigest()}-{len(requested)}"'
+        self._write_object(Bucket, Key, tmp_path, etag, upload['Metadata'], upload['ContentType'])
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> dict:
+        self._request()
+        self._load_upload(UploadId, 'AbortMultipartUpload')
+        shutil.rmtree(self._upload_dir(UploadId), ignore_errors=True)
+        return {}
+
+    # Managed transfers
+
+    def download_fileobj(self, Bucket: str, Key: str, Fileobj, ExtraArgs: dict = None, Callback=None, Config=None) -> None:
+        response = self.get_object(Bucket, Key)
+        with response['Body'] as body:
+            for chunk in body.iter_chunks():
+                Fileobj.write(chunk)
+                if Callback:
+                    Callback(len(chunk))
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, ExtraArgs: dict = None, Callback=None, Config=None) -> None:
+        tmp_path = f'{Filename}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                self.download_fileobj(Bucket, Key, f, ExtraArgs, Callback, Config)
+            os.replace(tmp_path, Filename)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str, ExtraArgs: dict = None, Callback=None, Config=None) -> None:
+        extra_args = ExtraArgs or {}
+        threshold = getattr(Config, 'multipart_threshold', DEFAULT_MULTIPART_THRESHOLD)
+        chunksize = getattr(Config, 'multipart_chunksize', DEFAULT_MULTIPART_CHUNKSIZE)
+
+        first = Fileobj.read(threshold)
+        if len(first) < threshold:
+            self.put_object(Bucket=Bucket, Key=Key, Body=first, **extra_args)
+            if Callback:
+                Callback(len(first))
+            return
+
+        # Large objects go through the multipart calls, as boto3's transfer manager does.
+        upload_id = self.create_multipart_upload(Bucket=Bucket, Key=Key, **extra_args)['UploadId']
+        try:
+            parts = []
+            buffer = first
+            while True:
+                while len(buffer) < chunksize:
+                    data = Fileobj.read(chunksize - len(buffer))
+                    if not data:
+                        break
+                    buffer += data
+                if not buffer:
+                    break
+                chunk, buffer = buffer[:chunksize], buffer[chunksize:]
+                part_number = len(parts) + 1
+                etag = self.upload_part(Bucket=Bucket, Key=Key, UploadId=upload_id, PartNumber=part_number, Body=chunk)['ETag']
+                parts.append({'PartNumber': part_number, 'ETag': etag})
+                if Callback:
+                    Callback(len(chunk))
+            self.complete_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id)
+            raise
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: dict = None, Callback=None, Config=None) -> None:
+        with open(Filename, 'rb') as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs, Callback, Config)
+
+
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def local_backend_enabled() -> bool:
+    '''
+    True when object_store_backend=local, i.e. S3 calls are served from object_store_root.
+    '''
+    return object_store_backend == 'local'
+
+
+def get_local_object_store(root: str = None) -> LocalObjectStore:
+    '''
+    Returns the process-wide LocalObjectStore for a root directory (default object_store_root).
+    '''
+    root = os.path.abspath(root or object_store_root)
+    store = _local_stores.get(root)
+    if store is None:
+        with _local_stores_lock:
+            store = _local_stores.get(root)
+            if store is None:
+                store = LocalObjectStore(root)
+                _local_stores[root] = store
+                logger.info(f"Using local object store at '{root}'")
+    return store
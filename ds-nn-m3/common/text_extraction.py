@@ -0,0 +1,180 @@
+import io
+import os
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from importlib import metadata
+from typing import BinaryIO, Dict, Iterator, List, Union
+from common.mapped_file import local_path, open_mapped, open_pdf
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Engine used by get_extractor() when none is named.
+pdf_text_engine = os.getenv('pdf_text_engine', 'pymupdf')
+
+# A path, the PDF bytes, or a seekable binary file object.
+Source = Union[str, bytes, BinaryIO]
+
+
+class TextExtractor(ABC):
+    '''
+    Extracts the text of a PDF page by page. Engines wrap one PDF library each
+    and import it on first use, so a service only needs the library it uses.
+
+        extractor = get_extractor()
+        for page_number, text in enumerate(extractor.iter_pages(path), 1):
+            ...
+        text = extractor.extract(path)
+    '''
+    name = None
+    # Distribution of the PDF library; its version is part of the key of
+    # cached text, so that upgrading the library rebuilds it.
+    package = None
+    # Bump when the text an engine returns changes for the same library.
+    ARTIFACT_VERSION = 1
+
+    @abstractmethod
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        '''
+        Yields the text of each page in order, reading pages only as they are
+        asked for. The document is closed when the iteration ends.
+        '''
+
+    def extract_pages(self, source: Source, parallel: bool = True) -> List[str]:
+        '''
+        Returns the text of every page as a list. Engines that support it
+        extract large documents in page shards across processes when parallel
+        is set; the others ignore it.
+        '''
+        return list(self.iter_pages(source))
+
+    def extract(self, source: Source, separator: str = ' ', parallel: bool = True) -> str:
+        '''
+        Returns the text of all pages joined by separator.
+        '''
+        return separator.join(self.extract_pages(source, parallel))
+
+    def extract_cached(self, source: Source, separator: str = ' ', parallel: bool = True) -> str:
+        '''
+        Like extract(), but the pages are kept in the artifact cache (see
+        common/artifact_cache.py), so a document that was read before by the
+        same engine and library version is not read again.
+        '''
+        from common.artifact_cache import cached
+        pages = cached(f'text-{self.name}', self.artifact_version(), source, lambda: self.extract_pages(source, parallel))
+        return separator.join(pages)
+
+    def artifact_version(self) -> str:
+        try:
+            library = metadata.version(self.package)
+        except metadata.PackageNotFoundError:
+            library = 'unknown'
+        return f'{self.ARTIFACT_VERSION}-{library}'
+
+
+class PyMuPDFExtractor(TextExtractor):
+    '''
+    PyMuPDF (fitz), the default: by far the fastest of the engines.
+    '''
+    name = 'pymupdf'
+    package = 'PyMuPDF'
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        doc = _open_fitz(source)
+        try:
+            for page in doc:
+                yield page.get_text()
+        finally:
+            doc.close()
+
+    def extract_pages(self, source: Source, parallel: bool = True) -> List[str]:
+        if not parallel:
+            return super().extract_pages(source)
+        # Documents over pdf_shard_threshold pages are split across worker
+        # processes by common/pdf_sharding.py; smaller ones run here.
+        from common.pdf_sharding import run_sharded
+        if not isinstance(source, (str, os.PathLike, bytes, bytearray)):
+            # The workers open a file on disk by its path; any other file is read.
+            path = local_path(source)
+            if path is not None:
+                source = path
+            else:
+                source.seek(0)
+                source = source.read()
+        shards = run_sharded(source, _pymupdf_page_texts, name='text')
+        return [text for shard in shards for text in shard['result']]
+
+
+class PyPDF2Extractor(TextExtractor):
+    name = 'pypdf2'
+    package = 'PyPDF2'
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        import PyPDF2
+        with _open_binary(source) as file:
+            for page in PyPDF2.PdfReader(file).pages:
+                yield page.extract_text() or ''
+
+
+class PdfplumberExtractor(TextExtractor):
+    name = 'pdfplumber'
+    package = 'pdfplumber'
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        import pdfplumber
+        with _open_binary(source) as file, pdfplumber.open(file) as pdf:
+            for page in pdf.pages:
+                yield page.extract_text() or ''
+                # pdfplumber caches each page's objects; drop them once read.
+                page.close()
+
+
+class PdfminerExtractor(TextExtractor):
+    name = 'pdfminer'
+    package = 'pdfminer.six'
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        with _open_binary(source) as file:
+            for layout in extract_pages(file):
+                yield ''.join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+
+
+ENGINES: Dict[str, type] = {engine.name: engine for engine in
+                            (PyMuPDFExtractor, PyPDF2Extractor, PdfplumberExtractor, PdfminerExtractor)}
+
+
+def get_extractor(name: str = None) -> TextExtractor:
+    '''
+    Returns the engine called name, or pdf_text_engine (default 'pymupdf').
+    '''
+    name = (name or pdf_text_engine).lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown text extraction engine: {name}. Use one of {', '.join(ENGINES)}")
+    return ENGINES[name]()
+
+
+def _pymupdf_page_texts(doc, start: int, stop: int) -> List[str]:
+    # Runs in the shard workers (see common/pdf_sharding.py).
+    return [doc.load_page(page_number).get_text() for page_number in range(start, stop)]
+
+
+def _open_fitz(source: Source):
+    import fitz  # PyMuPDF
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype='pdf')
+    return open_pdf(source)
+
+
+@contextmanager
+def _open_binary(source: Source):
+    # A file object for the engines that read one; only a file opened here is closed.
+    if isinstance(source, (str, os.PathLike)):
+        with open_mapped(source) as file:
+            yield file
+    elif isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    else:
+        source.seek(0)
+        yield source
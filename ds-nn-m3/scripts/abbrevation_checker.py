@@ -1,48 +1,61 @@
 import pandas as pd
-import PyPDF2
 import re
 import csv
+import io
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Union, BinaryIO, Optional
 from collections import defaultdict
 from abc import ABC, abstractmethod
+from common.docx_model import DocxModel
 from common.logs import logger
+from common.pipeline import Pipeline, Stage
 from common.s3_operations import S3Helper
+from common.text_extraction import get_extractor
 import os
 TMP_DIR = '/tmp'
 if not os.path.exists(TMP_DIR):
     os.makedirs(TMP_DIR)
 # Set up logging
 
+# Readers and loaders accept either a local path or an open binary stream
+# (e.g. from S3Helper.get_object_stream), so S3 documents never touch disk.
+Source = Union[str, BinaryIO]
+
+
+@contextmanager
+def open_binary(source: Source):
+    """Yield a binary file object for a path or an already open stream"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            yield file
+    else:
+        source.seek(0)
+        yield source
+
 
 class DocumentReader(ABC):
     """Abstract base class for document readers"""
     @abstractmethod
-    def read_content(self, file_path: str) -> str:
+    def read_content(self, file_path: Source) -> str:
         """Read and return document content as string"""
         pass
 
 class PDFReader(DocumentReader):
     """Concrete class for reading PDF documents"""
-    def read_content(self, file_path: str) -> str:
+    def read_content(self, file_path: Source) -> str:
         try:
-            content = []
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    content.append(page.extract_text())
-            return ' '.join(content)
+            return get_extractor().extract_cached(file_path, separator=' ')
         except Exception as e:
             logger.error(f"Error reading PDF file: {e}")
             raise
 
 class DocxReader(DocumentReader):
     """Concrete class for reading DOCX documents"""
-    def read_content(self, file_path: str) -> str:
+    def read_content(self, file_path: Source) -> str:
         try:
-            from docx import Document
-            doc = Document(file_path)
-            return ' '.join([paragraph.text for paragraph in doc.paragraphs])
+            with open_binary(file_path) as file:
+                return DocxModel.load_cached(file).text()
         except Exception as e:
             logger.error(f"Error reading DOCX file: {e}")
             raise
@@ -50,15 +63,16 @@ class DocxReader(DocumentReader):
 class ReferenceLoader(ABC):
     """Abstract base class for loading reference data"""
     @abstractmethod
-    def load_references(self, file_path: str) -> Dict[str, str]:
+    def load_references(self, file_path: Source) -> Dict[str, str]:
         """Load and return reference data as dictionary"""
         pass
 
 class ExcelReferenceLoader(ReferenceLoader):
     """Concrete class for loading references from Excel"""
-    def load_references(self, file_path: str) -> Dict[str, str]:
+    def load_references(self, file_path: Source) -> Dict[str, str]:
         try:
-            df = pd.read_excel(file_path)
+            with open_binary(file_path) as file:
+                df = pd.read_excel(file)
             return dict(zip(df.iloc[:, 0], df.iloc[:, 1]))
         except Exception as e:
             logger.error(f"Error loading references from Excel: {e}")
@@ -66,21 +80,27 @@ class ExcelReferenceLoader(ReferenceLoader):
 
 class CSVReferenceLoader(ReferenceLoader):
     """Concrete class for loading references from CSV"""
-    def load_references(self, file_path: str) -> Dict[str, str]:
+    def load_references(self, file_path: Source) -> Dict[str, str]:
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                csv_reader = csv.reader(file)
-                return {rows[0].strip(): rows[1].strip() 
-                       for rows in csv_reader 
-                       if len(rows) >= 2 and rows[0].strip() and rows[1].strip()}
+            with open_binary(file_path) as binary_file:
+                file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+                try:
+                    csv_reader = csv.reader(file)
+                    return {rows[0].strip(): rows[1].strip() 
+                           for rows in csv_reader 
+                           if len(rows) >= 2 and rows[0].strip() and rows[1].strip()}
+                finally:
+                    # Leave the underlying stream open for the caller
+                    file.detach()
         except Exception as e:
             logger.error(f"Error loading references from CSV: {e}")
             raise
 
 class AbbreviationRepository:
     """Repository class for managing abbreviation data"""
-    def __init__(self, reference_path: str):
+    def __init__(self, reference_path: str, reference_source: Optional[Source] = None):
         self.reference_path = reference_path
+        self.reference_source = reference_source if reference_source is not None else reference_path
         self.loader = self._get_loader()
         self.abbreviations = self._load_abbreviations()
 
@@ -96,7 +116,7 @@ class AbbreviationRepository:
 
     def _load_abbreviations(self) -> Dict[str, str]:
         """Load abbreviations using appropriate loader"""
-        return self.loader.load_references(self.reference_path)
+        return self.loader.load_references(self.reference_source)
 
     def get_all_abbreviations(self) -> Dict[str, str]:
         return self.abbreviations
@@ -139,7 +159,7 @@ class AbbreviationAnalyzer:
 
 class DocumentProcessor:
     """Main processor class"""
-    def __init__(self, analyzer: AbbreviationAnalyzer):
+    def __init__(self, analyzer: Optional[AbbreviationAnalyzer] = None):
         self.analyzer = analyzer
         self.readers = {
             '.pdf': PDFReader(),
@@ -147,41 +167,67 @@ class DocumentProcessor:
             '.doc': DocxReader()
         }
 
-    def process_document(self, file_path: str) -> List[List[str]]:
-        """Process document and return abbreviation data as list of lists"""
+    def read_document(self, file_path: str, source: Optional[Source] = None) -> str:
+        """Read the text of a document. file_path selects the reader;
+        source, if given, is read instead of file_path"""
         file_path = Path(file_path)
         if file_path.suffix.lower() not in self.readers:
             raise ValueError(f"Unsupported file format: {file_path.suffix}. Please use PDF, DOCX, or DOC")
 
         reader = self.readers[file_path.suffix.lower()]
-        content = reader.read_content(str(file_path))
+        return reader.read_content(source if source is not None else str(file_path))
+
+    def process_document(self, file_path: str, source: Optional[Source] = None) -> List[List[str]]:
+        """Process document and return abbreviation data as list of lists.
+        file_path selects the reader; source, if given, is read instead of file_path"""
+        content = self.read_document(file_path, source)
         return self.analyzer.get_abbreviations_list(content)
 
+def open_source(file_path: str) -> Optional[BinaryIO]:
+    """Stream an S3 file into memory rather than writing it to TMP_DIR.
+    A DOCX is opened for ranged reads, so only its text parts are fetched.
+    Returns None for local paths, which the readers open themselves"""
+    if file_path.startswith('s3://'):
+        s3_bucket = file_path.split('/')[2]
+        s3_helper = S3Helper(s3_bucket)
+        s3_key = '/'.join(file_path.split('/')[3:])
+        if Path(s3_key).suffix.lower() == '.docx':
+            return s3_helper.open_package(s3_key)
+        return s3_helper.get_object_stream(s3_key)
+    return None
+
 def analyze_document_abbreviations(document_path: str, reference_path: str) -> List[List[str]]:
-    """Main function to analyze document abbreviations and return results as list of lists"""
+    """Main function to analyze document abbreviations and return results as list of lists.
+    The document and the reference file are fetched and parsed concurrently, so the
+    document is already being read while the reference is still downloading"""
+    processor = DocumentProcessor()
+
+    def fetch(item):
+        kind, file_path = item
+        return kind, file_path, open_source(file_path)
+
+    def load(fetched):
+        kind, file_path, source = fetched
+        try:
+            if kind == 'reference':
+                return AbbreviationRepository(file_path, source)
+            return processor.read_document(file_path, source)
+        finally:
+            if source is not None:
+                source.close()
+
     try:
-        if document_path.startswith('s3://'):
-            s3_bucket = document_path.split('/')[2]
-            s3_helper = S3Helper(s3_bucket)
-            s3_key = '/'.join(document_path.split('/')[3:])
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-                    # Download the file from S3
-            s3_helper.download_file_from_s3(s3_key, local_file_path)
-            document_path = local_file_path
-        
-        if reference_path.startswith('s3://'):
-            s3_bucket = reference_path.split('/')[2]
-            s3_helper = S3Helper(s3_bucket)
-            s3_key = '/'.join(reference_path.split('/')[3:])
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-                    # Download the file from S3
-            s3_helper.download_file_from_s3(s3_key, local_file_path)
-            reference_path = local_file_path
-
-        abbreviation_repo = AbbreviationRepository(reference_path)
-        analyzer = AbbreviationAnalyzer(abbreviation_repo)
-        processor = DocumentProcessor(analyzer)
-        return processor.process_document(document_path)
+        pipeline = Pipeline([
+            Stage('fetch', fetch, workers=2),
+            Stage('load', load, workers=2)
+        ], name='abbreviations')
+        document, reference = pipeline.run([('document', document_path), ('reference', reference_path)])
+        for outcome in (document, reference):
+            if outcome['error'] is not None:
+                raise outcome['error']
+
+        processor.analyzer = AbbreviationAnalyzer(reference['result'])
+        return processor.analyzer.get_abbreviations_list(document['result'])
     
     except Exception as e:
         logger.error(f"Error analyzing document: {e}")
@@ -0,0 +1,154 @@
+"""
+Per-worker memory benchmark for common/mapped_file.py (Linux only: it reads
+/proc/self/smaps_rollup).
+
+Generates a PDF of --pages pages, each with a line of text and an embedded
+image of --image-kb KB of incompressible data, and a DOCX with --media-mb MB
+of images (see package_read_benchmark in ds-nn-m3). Then --workers spawned
+processes open the same file at the same time and read it the way the services
+do, once per mode:
+
+    pdf   read      fitz.open(stream=file.read()): a private copy per worker
+    pdf   path      fitz.open(path): MuPDF reads the file through its own buffers
+    pdf   mapped    open_pdf(path): PyMuPDF over a shared read-only map
+
+(the text of every page is extracted, as the checks do)
+    docx  read      DocxModel.load(BytesIO(file.read()))
+    docx  path      DocxModel.load(open(path, 'rb'))
+    docx  mapped    DocxModel.load(open_mapped(path)), as for a path
+
+and reports, averaged over the workers, the private and shared resident memory
+once the document was read and before it is closed, and the proportional set
+size (PSS, shared pages divided between the processes that map them).
+
+Run from the service root:
+    python -m benchmarks.mapped_file_benchmark
+    python -m benchmarks.mapped_file_benchmark --pages 400 --image-kb 512 --workers 4
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def generate_pdf(path, pages, image_kb):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    side = int((image_kb * 1024 / 3) ** 0.5)
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f'Page {number + 1} of the memory benchmark', fontsize=11)
+        # Random pixels do not compress, like scanned pages.
+        pixmap = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), False)
+        page.insert_image(fitz.Rect(72, 100, 540, 568), pixmap=pixmap)
+    doc.save(path, deflate=False)
+    doc.close()
+
+
+def generate_docx(path, media_mb):
+    paragraphs = ''.join(f'<w:p><w:r><w:t>Paragraph {index} of the memory benchmark</w:t></w:r></w:p>' for index in range(2000))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>')
+        package.writestr('_rels/.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                         'Target="word/document.xml"/></Relationships>')
+        package.writestr('word/document.xml',
+                         f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {W}><w:body>{paragraphs}</w:body></w:document>')
+        for index in range(media_mb):
+            package.writestr(zipfile.ZipInfo(f'word/media/image{index}.png'), os.urandom(1024 * 1024), zipfile.ZIP_STORED)
+
+
+def memory():
+    # Resident memory in MB from the kernel's per-process totals
+    values = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+            'shared': values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+            'pss': values.get('Pss', 0)}
+
+
+def run(kind, mode, path, barrier):
+    import fitz  # PyMuPDF
+    from common.docx_model import DocxModel
+    from common.mapped_file import open_mapped, open_pdf
+    before = memory()
+    barrier.wait()
+    if kind == 'pdf':
+        if mode == 'read':
+            with open(path, 'rb') as file:
+                doc = fitz.open(stream=file.read(), filetype='pdf')
+        elif mode == 'path':
+            doc = fitz.open(path)
+        else:
+            doc = open_pdf(path)
+        for page in doc:
+            page.get_text()
+        after = memory()
+        doc.close()
+    else:
+        if mode == 'read':
+            with open(path, 'rb') as file:
+                source = io.BytesIO(file.read())
+        elif mode == 'path':
+            source = open(path, 'rb')
+        else:
+            source = open_mapped(path)
+        model = DocxModel.load(source)
+        # Read the images too, as a check of embedded media would.
+        with zipfile.ZipFile(source) as package:
+            for name in package.namelist():
+                if name.startswith('word/media/'):
+                    package.read(name)
+        after = memory()
+        del model
+        source.close()
+    barrier.wait()
+    return {key: after[key] - before[key] for key in after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='Pages in the generated PDF')
+    parser.add_argument('--image-kb', type=int, default=512, help='Size of the image on every page')
+    parser.add_argument('--media-mb', type=int, default=100, help='Megabytes of images in the generated DOCX')
+    parser.add_argument('--workers', type=int, default=4, help='Processes reading the same file at once')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_mapped_benchmark_')
+    try:
+        files = {'pdf': os.path.join(work_dir, 'document.pdf'), 'docx': os.path.join(work_dir, 'document.docx')}
+        generate_pdf(files['pdf'], args.pages, args.image_kb)
+        generate_docx(files['docx'], args.media_mb)
+        print(f"pdf: {os.path.getsize(files['pdf']) / (1024 * 1024):.0f} MB, docx: {os.path.getsize(files['docx']) / (1024 * 1024):.0f} MB, "
+              f"{args.workers} workers\n")
+
+        context = multiprocessing.get_context('spawn')
+        manager = context.Manager()
+        print(f"{'file':<6} {'mode':<8} {'private MB':>11} {'shared MB':>10} {'PSS MB':>8}")
+        for kind in ('pdf', 'docx'):
+            for mode in ('read', 'path', 'mapped'):
+                barrier = manager.Barrier(args.workers)
+                with context.Pool(args.workers) as pool:
+                    results = pool.starmap(run, [(kind, mode, files[kind], barrier)] * args.workers)
+                average = {key: sum(result[key] for result in results) / len(results) for key in results[0]}
+                print(f"{kind:<6} {mode:<8} {average['private']:>11.1f} {average['shared']:>10.1f} {average['pss']:>8.1f}")
+        manager.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Throughput and agreement benchmark for the engines in common/text_extraction.py.
+
+Generates a corpus of --docs PDFs of --pages pages each (numbered headings,
+body paragraphs in three fonts, a two-column page every few pages and a small
+table grid), extracts every document with each installed engine and reports:
+
+    pages/s     pages extracted per second over the corpus
+    chars       characters of text extracted
+    agreement   share of words that match the reference engine (PyMuPDF), as
+                a multiset overlap: 1.0 means the same words, in any order
+
+Engines whose library is not installed are skipped. The PyMuPDF engine is also
+run through extract(parallel=True), which shards documents of
+pdf_shard_threshold pages or more across processes (see common/pdf_sharding.py).
+
+Run from the service root:
+    python -m benchmarks.text_extraction_benchmark
+    python -m benchmarks.text_extraction_benchmark --docs 5 --pages 400 --engines pymupdf pdfminer
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from common.text_extraction import ENGINES, get_extractor
+
+WORDS = ('quality', 'procedure', 'document', 'control', 'review', 'record', 'process', 'audit',
+         'supplier', 'risk', 'change', 'training', 'design', 'verification', 'release', 'form',
+         'QMS', 'SOP', 'CAPA', 'GMP', 'ISO', 'FDA')
+FONTS = ('helv', 'tiro', 'cour')
+
+
+def sentence(index, words):
+    return ' '.join(WORDS[(index * 7 + offset * 3) % len(WORDS)] for offset in range(words))
+
+
+def generate(path, pages, seed):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        index = seed * 1000 + number
+        page.insert_text((72, 60), f'{number + 1}. {sentence(index, 4).title()}', fontname='hebo', fontsize=13)
+        if number % 6 == 5:
+            # Two columns of body text
+            for column, x in enumerate((72, 320)):
+                page.insert_textbox(fitz.Rect(x, 80, x + 220, 760), ' '.join(sentence(index + column * 50 + line, 12) for line in range(20)),
+                                    fontname='helv', fontsize=10)
+        else:
+            y = 90
+            for line in range(40):
+                page.insert_text((72, y), sentence(index + line, 11), fontname=FONTS[line % len(FONTS)], fontsize=10)
+                y += 15
+        if number % 4 == 3:
+            # A table grid with short cell texts
+            for row in range(4):
+                for cell in range(3):
+                    rect = fitz.Rect(72 + cell * 150, 700 + row * 18, 222 + cell * 150, 718 + row * 18)
+                    page.draw_rect(rect, width=0.5)
+                    page.insert_text((rect.x0 + 4, rect.y1 - 5), sentence(index + row * 3 + cell, 2), fontname='helv', fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def agreement(text, reference):
+    words, reference_words = Counter(text.split()), Counter(reference.split())
+    total = max(sum(words.values()), sum(reference_words.values()))
+    return sum((words & reference_words).values()) / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=3, help='Documents in the generated corpus')
+    parser.add_argument('--pages', type=int, default=200, help='Pages per document')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), help='Engines to compare')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_text_benchmark_')
+    try:
+        paths = []
+        for seed in range(args.docs):
+            path = os.path.join(work_dir, f'document_{seed}.pdf')
+            generate(path, args.pages, seed)
+            paths.append(path)
+        total_pages = args.docs * args.pages
+        print(f"corpus: {args.docs} documents x {args.pages} pages\n")
+
+        runs = [(name, False) for name in args.engines]
+        if 'pymupdf' in args.engines:
+            runs.append(('pymupdf', True))
+        reference = None
+        print(f"{'engine':<20} {'seconds':>9} {'pages/s':>9} {'chars':>11} {'agreement':>10}")
+        for name, parallel in runs:
+            label = f'{name} (parallel)' if parallel else name
+            extractor = get_extractor(name)
+            try:
+                start = time.perf_counter()
+                texts = [extractor.extract(path, separator='\n', parallel=parallel) for path in paths]
+                seconds = time.perf_counter() - start
+            except ImportError as e:
+                print(f"{label:<20} skipped: {e}")
+                continue
+            if reference is None and name == 'pymupdf':
+                reference = texts
+            score = (sum(agreement(text, ref) for text, ref in zip(texts, reference)) / len(texts)
+                     if reference is not None else float('nan'))
+            print(f"{label:<20} {seconds:>9.2f} {total_pages / seconds:>9.0f} {sum(map(len, texts)):>11} {score:>10.3f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Union
+
+from common.logs import logger
+from common.mapped_file import open_pdf
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Documents with at least this many pages are split into page ranges that
+# worker processes analyse in parallel; smaller ones run in the calling process.
+pdf_shard_threshold = int(os.getenv('pdf_shard_threshold', 300))
+pdf_shard_pages = int(os.getenv('pdf_shard_pages', 100))
+pdf_shard_workers = int(os.getenv('pdf_shard_workers', os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def should_shard(page_count: int) -> bool:
+    return pdf_shard_workers > 1 and page_count >= pdf_shard_threshold
+
+
+def shard_ranges(page_count: int, pages_per_shard: int = None) -> List[range]:
+    '''
+    Splits 0..page_count-1 into consecutive ranges of about pages_per_shard
+    pages, sized evenly so that the last shard is not a short remainder.
+    '''
+    pages_per_shard = pages_per_shard or pdf_shard_pages
+    count = max(1, -(-page_count // pages_per_shard))
+    bounds = [page_count * index // count for index in range(count + 1)]
+    return [range(bounds[index], bounds[index + 1]) for index in range(count)]
+
+
+def run_sharded(source: Union[str, bytes], func: Callable, *args, page_count: int = None, name: str = 'pdf') -> List[dict]:
+    '''
+    Runs func(doc, start, stop, *args) over page ranges of a PDF and returns
+    one dict per shard in page order:
+
+        {'start': first page, 'stop': page after the last, 'result': func's return, 'seconds': time in the shard}
+
+    Above pdf_shard_threshold pages each shard runs in a worker process that
+    opens source read-only through a memory map (see common/mapped_file.py),
+    so that the workers share one copy of the file; func and args must be picklable (a module-level
+    function) and should return compact results, not PyMuPDF objects. Below it
+    func runs once in this process over all pages. source is a path, or the PDF
+    bytes, which are written to a temporary file for the workers to open.
+    If a shard fails, the first failure in page order is raised once all
+    shards have finished.
+    '''
+    path, spilled = source, None
+    if isinstance(source, (bytes, bytearray)):
+        spilled = tempfile.NamedTemporaryFile(prefix='nn_shard_', suffix='.pdf', delete=False)
+        with spilled:
+            spilled.write(source)
+        path = spilled.name
+    try:
+        if page_count is None:
+            with open_pdf(path) as doc:
+                page_count = doc.page_count
+        if not should_shard(page_count):
+            result, seconds = _run_shard(path, func, 0, page_count, args)
+            return [{'start': 0, 'stop': page_count, 'result': result, 'seconds': seconds}]
+        return _run_pool(path, func, args, page_count, name)
+    finally:
+        if spilled is not None:
+            os.remove(spilled.name)
+
+
+def _run_pool(path: str, func: Callable, args: tuple, page_count: int, name: str) -> List[dict]:
+    began = time.perf_counter()
+    ranges = shard_ranges(page_count)
+    pool = _get_pool()
+    try:
+        futures = [pool.submit(_run_shard, path, func, pages.start, pages.stop, args) for pages in ranges]
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+
+    shards, failure = [], None
+    for pages, future in zip(ranges, futures):
+        try:
+            result, seconds = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _reset_pool(pool)
+            logger.error(f"[{name}] Shard pages {pages.start + 1}-{pages.stop} failed: {e}")
+            failure = failure or e
+            continue
+        shards.append({'start': pages.start, 'stop': pages.stop, 'result': result, 'seconds': seconds})
+    if failure is not None:
+        raise failure
+
+    elapsed = time.perf_counter() - began
+    timings = ', '.join(f"{shard['start'] + 1}-{shard['stop']}: {shard['seconds']:.2f}s" for shard in shards)
+    logger.info(f"[{name}] {page_count} pages in {len(shards)} shards on {pdf_shard_workers} workers, "
+                f"{elapsed:.2f}s wall, {sum(shard['seconds'] for shard in shards):.2f}s in shards ({timings})")
+    return shards
+
+
+def _run_shard(path: str, func: Callable, start: int, stop: int, args: tuple):
+    began = time.perf_counter()
+    doc = open_pdf(path)
+    try:
+        result = func(doc, start, stop, *args)
+    finally:
+        doc.close()
+    return result, time.perf_counter() - began
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    '''
+    The process-wide worker pool, started on first use. Workers are spawned
+    rather than forked so that they do not inherit the server's threads.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=pdf_shard_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    # A worker died (e.g. out of memory); start a new pool on the next call.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List
+from common.logs import logger
+
+# Marks the end of the input on a stage's queue; one is sent per worker.
+_STOP = object()
+
+
+class Stage:
+    '''
+    One step of a Pipeline. func is called with the previous stage's output (or
+    the input item for the first stage) by `workers` threads. queue_size bounds
+    how many items may wait in front of the stage (default twice the worker
+    count), which limits how far earlier stages run ahead, e.g. how many
+    documents are prefetched into memory.
+    '''
+    def __init__(self, name: str, func: Callable, workers: int = 1, queue_size: int = None) -> None:
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.queue_size = queue_size or 2 * self.workers
+
+
+class ByteBudget:
+    '''
+    Bounds the bytes that items hold between stages, where a Stage's
+    queue_size only bounds how many they are: a stage takes an item's size
+    with acquire() before loading it and a later stage gives it back with
+    release() once done. An item larger than the whole budget is let through
+    when nothing else holds any, so that it cannot wait forever.
+    '''
+    def __init__(self, limit_bytes: int) -> None:
+        self.limit_bytes = max(int(limit_bytes), 1)
+        self.used_bytes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes: int) -> None:
+        with self._condition:
+            while self.used_bytes and self.used_bytes + nbytes > self.limit_bytes:
+                self._condition.wait()
+            self.used_bytes += nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._condition:
+            self.used_bytes -= nbytes
+            self._condition.notify_all()
+
+
+class _Envelope:
+    __slots__ = ('index', 'item', 'value', 'error', 'stage', 'seconds')
+
+    def __init__(self, index: int, item) -> None:
+        self.index = index
+        self.item = item
+        self.value = item
+        self.error = None
+        self.stage = None
+        self.seconds = {}
+
+
+class Pipeline:
+    '''
+    Runs items through a sequence of stages connected by bounded queues, so that
+    every stage works on a different item at the same time: while one document
+    is checked, the next is parsed and the ones after it are downloaded. The wall
+    time of a batch approaches that of the slowest stage rather than the sum.
+
+    A failing item skips its remaining stages and is reported with its error;
+    the rest of the batch carries on. Functions that hand an open resource (such
+    as a stream) to the next stage should close it themselves if that stage fails.
+
+        pipeline = Pipeline([
+            Stage('download', fetch, workers=4),
+            Stage('parse', extract_text, workers=2),
+            Stage('check', find_matches),
+        ], name='q-f-check')
+        for result in pipeline.run(paths):
+            ...
+    '''
+    def __init__(self, stages: List[Stage], name: str = 'pipeline') -> None:
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.name = name
+
+    def run(self, items: Iterable) -> List[dict]:
+        '''
+        Processes items, which may be a lazy iterable (e.g. an S3 listing) that
+        is consumed as the first stage has room.
+        Returns one dict per item in input order:
+            {'item', 'result', 'error', 'stage', 'seconds'}
+        where result is the last stage's output, error the exception (or None),
+        stage the name of the stage that failed and seconds the time per stage.
+        '''
+        stages = self.stages
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages] + [queue.Queue()]
+        remaining_workers = [stage.workers for stage in stages]
+        busy = {stage.name: 0.0 for stage in stages}
+        lock = threading.Lock()
+
+        def feed() -> None:
+            index = 0
+            try:
+                for item in items:
+                    queues[0].put(_Envelope(index, item))
+                    index += 1
+            except Exception as e:
+                logger.exception(f"Exception reading input of pipeline '{self.name}'")
+                envelope = _Envelope(index, None)
+                envelope.error, envelope.stage = e, 'input'
+                queues[0].put(envelope)
+            finally:
+                for _ in range(stages[0].workers):
+                    queues[0].put(_STOP)
+
+        def work(position: int) -> None:
+            stage, inbox, outbox = stages[position], queues[position], queues[position + 1]
+            while True:
+                envelope = inbox.get()
+                if envelope is _STOP:
+                    break
+                if envelope.error is None:
+                    start = time.perf_counter()
+                    try:
+                        envelope.value = stage.func(envelope.value)
+                    except Exception as e:
+                        envelope.error, envelope.stage = e, stage.name
+                        logger.error(f"Pipeline '{self.name}' stage '{stage.name}' failed for {envelope.item!r}: {e}")
+                    finally:
+                        elapsed = time.perf_counter() - start
+                        envelope.seconds[stage.name] = elapsed
+                        with lock:
+                            busy[stage.name] += elapsed
+                outbox.put(envelope)
+
+            # The last worker of a stage passes the end of input on to the next stage.
+            with lock:
+                remaining_workers[position] -= 1
+                last = remaining_workers[position] == 0
+            if last:
+                next_workers = stages[position + 1].workers if position + 1 < len(stages) else 1
+                for _ in range(next_workers):
+                    outbox.put(_STOP)
+
+        threads = [threading.Thread(target=feed, name=f'{self.name}-feed', daemon=True)]
+        for position, stage in enumerate(stages):
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=work, args=(position,),
+                                                name=f'{self.name}-{stage.name}-{worker}', daemon=True))
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        envelopes = []
+        while True:
+            envelope = queues[-1].get()
+            if envelope is _STOP:
+                break
+            envelopes.append(envelope)
+        for thread in threads:
+            thread.join()
+
+        wall = time.perf_counter() - started
+        failed = sum(1 for envelope in envelopes if envelope.error is not None)
+        stage_times = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in busy.items())
+        logger.info(f"Pipeline '{self.name}' processed {len(envelopes)} items ({failed} failed) "
+                    f"in {wall:.2f}s; busy time per stage: {stage_times}")
+
+        envelopes.sort(key=lambda envelope: envelope.index)
+        return [
+            {
+                'item': envelope.item,
+                'result': envelope.value if envelope.error is None else None,
+                'error': envelope.error,
+                'stage': envelope.stage,
+                'seconds': envelope.seconds
+            }
+            for envelope in envelopes
+        ]
@@ -1,3 +1,4 @@
+import os
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -18,7 +19,11 @@ async def check_q_f_document(request: DocFormatCheck):
 
         extractor = DocFormatExtractor()
 
-        results = extractor.process_file(document)
+        # A directory or an S3 prefix ending in '/' checks every supported file in it.
+        if document.endswith('/') or os.path.isdir(document):
+            results = extractor.process_directory(document)
+        else:
+            results = extractor.process_file(document)
 
         logger.info(str(f'Completed the check for format. ')+'[check_document_format] [controllers/module_controller.py:35]')
 
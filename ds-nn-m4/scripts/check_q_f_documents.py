@@ -1,17 +1,34 @@
 import re
-import docx
 import pandas as pd
-import pdfplumber
 import os
 from pathlib import Path
+from common.docx_model import DocxModel
 from common.logs import logger
-from common.s3_operations import S3Helper
-import os
+from common.pipeline import ByteBudget, Pipeline, Stage
+from common.s3_operations import S3Helper, s3_spool_max_bytes
+from common.text_extraction import get_extractor
+from dotenv import load_dotenv
+
+load_dotenv()
 
 TMP_DIR = '/tmp'
 if not os.path.exists(TMP_DIR):
     os.makedirs(TMP_DIR)
 
+# process_directory() pipelines download -> parse -> check. Downloads wait on the
+# network and run wide; parsing is CPU bound and holds the GIL for most of its work,
+# so more parse workers mainly help with the I/O inside the parsers.
+q_f_fetch_workers = int(os.getenv('q_f_fetch_workers', 4))
+q_f_parse_workers = int(os.getenv('q_f_parse_workers', 2))
+# Documents downloaded ahead of the parse stage, at most.
+q_f_prefetch = int(os.getenv('q_f_prefetch', 8))
+# Bytes that documents being fetched, waiting and being parsed may hold in memory
+# at once. An S3 document counts for its size up to s3_spool_max_bytes, above which
+# its stream spills to disk; fetches wait while the budget is used up.
+q_f_prefetch_bytes = int(os.getenv('q_f_prefetch_bytes', 256 * 1024 * 1024))
+
+SUPPORTED_EXTENSIONS = {'.docx', '.xlsx', '.vsdx', '.pdf'}
+
 class DocFormatExtractor:
     def __init__(self):
         # Compile regex patterns for better performance
@@ -20,19 +37,32 @@ class DocFormatExtractor:
         
     def extract_from_docx(self, file_path):
         """Extract Q and F formats from DOCX files"""
-        doc = docx.Document(file_path)
-        text = ' '.join([paragraph.text for paragraph in doc.paragraphs])
-        return self._find_matches(text)
+        return self._find_matches(self.extract_text_from_docx(file_path))
     
     def extract_from_xlsx(self, file_path):
         """Extract Q and F formats from XLSX files"""
-        df = pd.read_excel(file_path)
-        # Convert all cells to string and concatenate
-        text = ' '.join(df.astype(str).values.flatten())
-        return self._find_matches(text)
+        return self._find_matches(self.extract_text_from_xlsx(file_path))
     
     def extract_from_vsdx(self, file_path):
         """Extract Q and F formats from VSDX files"""
+        return self._find_matches(self.extract_text_from_vsdx(file_path))
+    
+    def extract_from_pdf(self, file_path):
+        """Extract Q and F formats from PDF files"""
+        return self._find_matches(self.extract_text_from_pdf(file_path))
+
+    def extract_text_from_docx(self, file_path):
+        """Extract the paragraph text of a DOCX file"""
+        return DocxModel.load_cached(file_path).text()
+
+    def extract_text_from_xlsx(self, file_path):
+        """Extract the cell text of an XLSX file"""
+        df = pd.read_excel(file_path)
+        # Convert all cells to string and concatenate
+        return ' '.join(df.astype(str).values.flatten())
+
+    def extract_text_from_vsdx(self, file_path):
+        """Extract the page text of a VSDX file"""
         # Since VSDX is essentially a ZIP file containing XML
         from zipfile import ZipFile
         import xml.etree.ElementTree as ET
@@ -48,16 +78,24 @@ class DocFormatExtractor:
                             if elem.text:
                                 text.append(elem.text)
         
-        return self._find_matches(' '.join(text))
-    
-    def extract_from_pdf(self, file_path):
-        """Extract Q and F formats from PDF files"""
-        text = []
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text.append(page.extract_text())
-        
-        return self._find_matches(' '.join(text))
+        return ' '.join(text)
+
+    def extract_text_from_pdf(self, file_path):
+        """Extract the page text of a PDF file"""
+        return get_extractor().extract_cached(file_path, separator=' ')
+
+    def extract_text(self, source, extension):
+        """Extract the text of a path or binary file object by file extension"""
+        if extension == '.docx':
+            return self.extract_text_from_docx(source)
+        elif extension == '.xlsx':
+            return self.extract_text_from_xlsx(source)
+        elif extension == '.vsdx':
+            return self.extract_text_from_vsdx(source)
+        elif extension == '.pdf':
+            return self.extract_text_from_pdf(source)
+        else:
+            raise ValueError(f"Unsupported file format: {extension}")
     
     def _find_matches(self, text):
         """Find all Q and F format matches in text"""
@@ -68,44 +106,92 @@ class DocFormatExtractor:
             'Q_formats': q_matches,
             'F_formats': f_matches
         }
-    
-    def process_file(self, file_path):
-        """Process a single file based on its extension"""
-        if file_path.startswith('s3://'):
+
+    def open_source(self, file_path):
+        """Returns a binary file object for an S3 path (streamed into memory,
+        not written to TMP_DIR) or the Path of a local file. DOCX and VSDX
+        files are opened for ranged reads, so only the parts read are fetched."""
+        if str(file_path).startswith('s3://'):
             s3_bucket = file_path.split('/')[2]
             s3_helper = S3Helper(s3_bucket)
             s3_key = '/'.join(file_path.split('/')[3:])
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-                    # Download the file from S3
-            s3_helper.download_file_from_s3(s3_key, local_file_path)
-            file_path = local_file_path
-
-        file_path = Path(file_path)
-        extension = file_path.suffix.lower()
-
-        
+            if Path(s3_key).suffix.lower() in ('.docx', '.vsdx'):
+                return s3_helper.open_package(s3_key)
+            return s3_helper.get_object_stream(s3_key)
+        return Path(file_path)
+    
+    def process_file(self, file_path):
+        """Process a single file based on its extension.
+        S3 files are streamed into memory instead of being written to TMP_DIR;
+        every extractor accepts either a path or a binary file object."""
+        source = None
         try:
-            if extension == '.docx':
-                return self.extract_from_docx(file_path)
-            elif extension == '.xlsx':
-                return self.extract_from_xlsx(file_path)
-            elif extension == '.vsdx':
-                return self.extract_from_vsdx(file_path)
-            elif extension == '.pdf':
-                return self.extract_from_pdf(file_path)
-            else:
-                raise ValueError(f"Unsupported file format: {extension}")
+            source = self.open_source(file_path)
+            return self._find_matches(self.extract_text(source, Path(file_path).suffix.lower()))
         except Exception as e:
-            return {'error': f"Error processing {file_path}: {str(e)}"}
+            return {'error': f"Error processing {Path(file_path)}: {str(e)}"}
+        finally:
+            if source is not None and not isinstance(source, Path):
+                source.close()
+
+    def list_directory(self, directory_path, sizes=None):
+        """Yields the supported files under a local directory or an S3 prefix
+        ('s3://bucket/prefix/'), recursively. S3 objects are yielded page by page
+        as they are listed, and their sizes stored in sizes by path if it is given."""
+        if str(directory_path).startswith('s3://'):
+            s3_bucket = directory_path.split('/')[2]
+            s3_prefix = '/'.join(directory_path.split('/')[3:])
+            for item in S3Helper(s3_bucket).iter_files(s3_prefix):
+                if Path(item['Key']).suffix.lower() in SUPPORTED_EXTENSIONS:
+                    file_path = f"s3://{s3_bucket}/{item['Key']}"
+                    if sizes is not None:
+                        sizes[file_path] = item.get('Size', 0)
+                    yield file_path
+        else:
+            for file_path in Path(directory_path).rglob('*'):
+                if file_path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                    yield str(file_path)
     
     def process_directory(self, directory_path):
-        """Process all supported files in a directory"""
+        """Process all supported files in a local directory or S3 prefix.
+        Files go through a download -> parse -> check pipeline, so the next
+        documents are fetched while the current ones are parsed, within
+        q_f_prefetch_bytes of memory."""
+        sizes = {}
+        budget = ByteBudget(q_f_prefetch_bytes)
+
+        def fetch(file_path):
+            # Local files are parsed from disk and hold no memory until then.
+            nbytes = min(sizes.get(file_path, 0), s3_spool_max_bytes)
+            budget.acquire(nbytes)
+            try:
+                return file_path, self.open_source(file_path), nbytes
+            except Exception:
+                budget.release(nbytes)
+                raise
+
+        def parse(fetched):
+            file_path, source, nbytes = fetched
+            try:
+                return self.extract_text(source, Path(file_path).suffix.lower())
+            finally:
+                if not isinstance(source, Path):
+                    source.close()
+                budget.release(nbytes)
+
+        pipeline = Pipeline([
+            Stage('fetch', fetch, workers=q_f_fetch_workers),
+            Stage('parse', parse, workers=q_f_parse_workers, queue_size=q_f_prefetch),
+            Stage('check', self._find_matches)
+        ], name='q-f-check')
+
         results = {}
-        supported_extensions = {'.docx', '.xlsx', '.vsdx', '.pdf'}
-        
-        for file_path in Path(directory_path).rglob('*'):
-            if file_path.suffix.lower() in supported_extensions:
-                results[str(file_path)] = self.process_file(file_path)
+        for outcome in pipeline.run(self.list_directory(directory_path, sizes)):
+            if outcome['error'] is None:
+                results[outcome['item']] = outcome['result']
+            else:
+                file_path = outcome['item'] if outcome['item'] is not None else directory_path
+                results[file_path] = {'error': f"Error processing {file_path}: {str(outcome['error'])}"}
         
         return results
 
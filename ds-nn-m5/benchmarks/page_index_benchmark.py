@@ -0,0 +1,186 @@
+"""
+Accuracy and build time benchmark for common/page_index.py.
+
+Generates a DOCX of about --pages pages (numbered headings, body paragraphs of
+varying length with hyperlinks, runs of short table-cell paragraphs and empty
+paragraphs) together with a PDF rendering of it laid out with PyMuPDF, so that
+the page every paragraph and hyperlink starts on is known. The rendering adds
+what a real one adds: the list numbers of the headings and a running header and
+footer on every page. Then reports, against those pages:
+
+    page index      PageIndex.build() from the DocxModel and the PDF
+    chars / 3000    the estimate m5 used (char_count // 3000 + 1)
+    paras / 40      the estimate m6 used (paragraph number // 40 + 1)
+
+as the share of paragraphs and of hyperlinks given the right page and the
+largest error in pages. The build time excludes the conversion to PDF.
+
+Run from the service root:
+    python -m benchmarks.page_index_benchmark
+    python -m benchmarks.page_index_benchmark --pages 500
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+import fitz  # PyMuPDF
+
+from common.docx_model import DocxModel
+from common.page_index import PageIndex
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+HYPERLINK_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink'
+WORDS = ('quality', 'procedure', 'document', 'control', 'review', 'record', 'process', 'audit', 'supplier',
+         'risk', 'change', 'training', 'design', 'verification', 'release', 'deviation', 'batch', 'the',
+         'of', 'and', 'to', 'is', 'for', 'ISO', 'GMP', 'FDA', 'SOP', 'CAPA')
+CELLS = ('Yes', 'No', 'N/A', 'Owner', 'Approved', 'QA', 'Draft')
+LINE_CHARS = 90
+PAGE_LINES = 46
+FONT_SIZE = 10
+LINE_HEIGHT = 15
+
+
+def generate(docx_path, pdf_path, pages, seed=1):
+    '''
+    Writes the DOCX and its rendering and returns, for every paragraph, the
+    page it starts on and {paragraph number: hyperlink page}.
+    '''
+    rng = random.Random(seed)
+    blocks = []  # (kind, words, hyperlink start word or None)
+    while sum(len(' '.join(words)) for _, words, _ in blocks) < pages * LINE_CHARS * PAGE_LINES * 0.8:
+        kind = rng.choices(('heading', 'body', 'cells', 'empty'), weights=(1, 6, 1, 1))[0]
+        if kind == 'heading':
+            blocks.append(('heading', [rng.choice(WORDS).title() for _ in range(rng.randint(1, 4))], None))
+        elif kind == 'body':
+            words = [rng.choice(WORDS) for _ in range(rng.choice((12, 40, 90, 160, 300)))]
+            link = rng.randrange(len(words) - 2) if rng.random() < 0.3 else None
+            blocks.append(('body', words, link))
+        elif kind == 'cells':
+            for _ in range(rng.randint(3, 9)):
+                blocks.append(('cells', [rng.choice(CELLS)], None))
+        else:
+            blocks.append(('empty', [], None))
+
+    # Lay the blocks out, recording the page of each one and of its hyperlink.
+    lines, starts, link_pages = [], [], {}
+    heading = 0
+
+    def page_of_line(line_number):
+        return line_number // PAGE_LINES + 1
+
+    for number, (kind, words, link) in enumerate(blocks):
+        starts.append(page_of_line(len(lines)))
+        if kind == 'heading':
+            heading += 1
+            words = [f'{heading}.'] + words
+        line = []
+        for position, word in enumerate(words):
+            if line and len(' '.join(line + [word])) > LINE_CHARS:
+                lines.append(' '.join(line))
+                line = []
+            if link is not None and position == link:
+                link_pages[number] = page_of_line(len(lines))
+            line.append(word)
+        lines.append(' '.join(line))
+
+    pdf = fitz.open()
+    page_count = page_of_line(len(lines) - 1)
+    for page_number in range(1, page_count + 1):
+        page = pdf.new_page()
+        page.insert_text((72, 40), 'Quality Management System - Standard Operating Procedure', fontsize=8)
+        for row, text in enumerate(lines[(page_number - 1) * PAGE_LINES:page_number * PAGE_LINES]):
+            page.insert_text((54, 70 + row * LINE_HEIGHT), text, fontsize=FONT_SIZE)
+        page.insert_text((72, 810), f'Page {page_number} of {page_count}', fontsize=8)
+    pdf.save(pdf_path)
+    pdf.close()
+
+    paragraphs, relationships = [], []
+    for number, (kind, words, link) in enumerate(blocks):
+        style = '<w:pPr><w:pStyle w:val="Heading1"/></w:pPr>' if kind == 'heading' else ''
+        if link is None:
+            runs = f'<w:r><w:t xml:space="preserve">{" ".join(words)}</w:t></w:r>' if words else ''
+        else:
+            r_id = f'rIdLink{number}'
+            relationships.append(f'<Relationship Id="{r_id}" Type="{HYPERLINK_REL}" Target="https://example.com/{number}" TargetMode="External"/>')
+            runs = (f'<w:r><w:t xml:space="preserve">{" ".join(words[:link])} </w:t></w:r>'
+                    f'<w:hyperlink r:id="{r_id}"><w:r><w:t>{" ".join(words[link:link + 2])}</w:t></w:r></w:hyperlink>'
+                    f'<w:r><w:t xml:space="preserve"> {" ".join(words[link + 2:])}</w:t></w:r>')
+        paragraphs.append(f'<w:p>{style}{runs}</w:p>')
+    with zipfile.ZipFile(docx_path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/></Types>')
+        package.writestr('_rels/.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                         'Target="word/document.xml"/></Relationships>')
+        package.writestr('word/document.xml',
+                         f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {W} {R}><w:body>{"".join(paragraphs)}</w:body></w:document>')
+        package.writestr('word/_rels/document.xml.rels',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{"".join(relationships)}</Relationships>')
+    return starts, link_pages
+
+
+def score(pages, expected):
+    errors = [abs(page - want) for page, want in zip(pages, expected)]
+    return sum(1 for error in errors if error == 0) / len(errors), max(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='Approximate pages in the generated document')
+    parser.add_argument('--repeat', type=int, default=3, help='Builds of the index; the best time is reported')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_page_index_benchmark_')
+    try:
+        docx_path = os.path.join(work_dir, 'document.docx')
+        pdf_path = os.path.join(work_dir, 'document.pdf')
+        starts, link_pages = generate(docx_path, pdf_path, args.pages)
+        model = DocxModel.load(docx_path)
+
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            index = PageIndex.build(model, pdf_path)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        print(f"document: {index.page_count} pages, {len(model.paragraphs)} paragraphs, {len(link_pages)} hyperlinks; "
+              f"index built in {best * 1000:.0f} ms, {index.coverage:.1%} of paragraphs with text matched\n")
+
+        # The estimates, as m5 and m6 computed them
+        char_pages, char_count = [], 0
+        for para in model.paragraphs:
+            char_count += len(para.text)
+            char_pages.append(char_count // 3000 + 1)
+        estimates = (
+            ('page index', [index.page_of(para) for para in model.paragraphs]),
+            ('chars / 3000', char_pages),
+            ('paras / 40', [number // 40 + 1 for number in range(len(model.paragraphs))]),
+        )
+        hyperlinks = {hyperlink.paragraph.index: hyperlink for hyperlink in model.hyperlinks}
+        numbers = sorted(link_pages)
+        print(f"{'method':<14} {'paragraphs':>11} {'max error':>10} {'hyperlinks':>11} {'max error':>10}")
+        for name, pages in estimates:
+            paragraph_score, paragraph_error = score(pages, starts)
+            if name == 'page index':
+                linked = [index.page_of(hyperlinks[number]) for number in numbers]
+            else:
+                linked = [pages[number] for number in numbers]
+            link_score, link_error = score(linked, [link_pages[number] for number in numbers])
+            print(f"{name:<14} {paragraph_score:>11.1%} {paragraph_error:>10} {link_score:>11.1%} {link_error:>10}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Concurrency benchmark for FormatCheckerService.download_s3_file.
+
+Runs batches of S3 downloads at 1, 8 and 32 concurrent requests on one event loop,
+as uvicorn does, against the local object store with a simulated per-request
+latency. The download cache is disabled so that every request transfers.
+
+"blocking" calls boto3 directly inside the coroutine, which is what
+S3Operations.download_file used to do: the loop stalls for every transfer and
+throughput does not grow with concurrency. "executor" is the current path
+through the shared transfer pool.
+
+Run from the service root:
+    python -m benchmarks.transfer_concurrency
+    python -m benchmarks.transfer_concurrency --requests 128 --latency-ms 100 --size-kb 1024
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+PREFIX = 'benchmark/transfer/'
+CONCURRENCY_LEVELS = (1, 8, 32)
+
+
+def configure(work_dir, latency_ms):
+    # Must run before common.* is imported: those modules read their settings at import time.
+    os.environ['object_store_backend'] = 'local'
+    os.environ['object_store_root'] = os.path.join(work_dir, 'store')
+    os.environ['object_store_latency_ms'] = str(latency_ms)
+    os.environ['s3_cache_enabled'] = 'false'
+    os.environ['scratch_root'] = os.path.join(work_dir, 'scratch')
+
+
+async def run_batch(download, bucket, keys, concurrency):
+    '''
+    Downloads every key with at most `concurrency` requests in flight.
+    Returns (wall seconds, per-request latencies in ms).
+    '''
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request(key):
+        async with limit:
+            start = time.perf_counter()
+            await download(f's3://{bucket}/{key}')
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(key) for key in keys))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=64, help='Downloads per concurrency level')
+    parser.add_argument('--size-kb', type=int, default=512, help='Size of each object')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Delay added to every object store request')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nn_transfer_benchmark_')
+    configure(work_dir, args.latency_ms)
+
+    object_store = importlib.import_module('common.object_store')
+    format_checker = importlib.import_module('scripts.format_checker')
+    workspace_module = importlib.import_module('common.workspace')
+
+    service = format_checker.FormatCheckerService()
+
+    # S3Operations reads from its configured bucket, so seed that one.
+    bucket = service.s3_ops.bucket_name
+    store = object_store.get_local_object_store()
+    os.makedirs(os.path.join(store.root, bucket), exist_ok=True)
+    keys = [f'{PREFIX}document{index:04d}.pdf' for index in range(args.requests)]
+    for key in keys:
+        store.put_object(Bucket=bucket, Key=key, Body=os.urandom(args.size_kb * 1024))
+
+    async def executor_download(s3_path):
+        async with workspace_module.ScratchWorkspace('benchmark', reserve_bytes=0) as workspace:
+            await service.download_s3_file(s3_path, workspace)
+
+    async def blocking_download(s3_path):
+        async with workspace_module.ScratchWorkspace('benchmark', reserve_bytes=0) as workspace:
+            service.s3_ops._download_file_blocking('/'.join(s3_path.split('/')[3:]), workspace.file(s3_path))
+
+    try:
+        print(f"{'mode':<10} {'concurrency':>12} {'req/s':>10} {'MB/s':>10} {'p50 ms':>10} {'p95 ms':>10}")
+        for mode, download in (('blocking', blocking_download), ('executor', executor_download)):
+            for concurrency in CONCURRENCY_LEVELS:
+                seconds, latencies = asyncio.run(run_batch(download, bucket, keys, concurrency))
+                latencies.sort()
+                p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+                megabytes = len(keys) * args.size_kb / 1024
+                print(f"{mode:<10} {concurrency:>12} {len(keys) / seconds:>10.1f} {megabytes / seconds:>10.1f} "
+                      f"{statistics.median(latencies):>10.1f} {p95:>10.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import numpy as np
+
+from common.pdf_layout import PdfLayout
+
+# Format rules evaluated over a PdfLayout's columns as whole-array expressions.
+# Each rule returns the rows that break it (or a per-row value to compare), so
+# that a check only builds Python objects for the violations it reports:
+#
+#     layout = PdfLayout.extract(doc)
+#     for row in size_tolerance(layout.span_size, expected, 0.2).tolist():
+#         report(layout.span_text(row), ...)
+
+
+def size_tolerance(sizes: np.ndarray, expected: np.ndarray, tolerance: float, rows: np.ndarray = None) -> np.ndarray:
+    '''
+    Returns the rows whose size differs from expected by more than tolerance.
+    expected is a per-row array (or a scalar); rows limits the check to a
+    subset, given as a boolean mask or row numbers.
+    '''
+    broken = np.abs(sizes - expected) > tolerance
+    if rows is not None:
+        broken &= _mask(rows, len(sizes))
+    return np.flatnonzero(broken)
+
+
+def font_flags(layout: PdfLayout, *words: str) -> np.ndarray:
+    '''
+    Returns a per-span mask of spans whose font name contains any of words,
+    case-insensitively. Names are tested once per distinct font.
+    '''
+    by_font = np.array([any(word in font.lower() for word in words) for font in layout.fonts], dtype=bool)
+    return by_font[layout.span_font] if len(by_font) else np.zeros(layout.span_count, dtype=bool)
+
+
+def page_extents(layout: PdfLayout, blocks: np.ndarray = None) -> np.ndarray:
+    '''
+    Returns a (page_count, 4) array with the x0, y0, x1, y1 extent of the
+    blocks on each page. A page without blocks gets (width, height, 0, 0),
+    so that it reads as an empty box. blocks limits the blocks considered.
+    '''
+    extents = np.zeros((layout.page_count, 4))
+    extents[:, 0] = layout.page_width
+    extents[:, 1] = layout.page_height
+    pages, bbox = layout.block_page, layout.block_bbox
+    if blocks is not None:
+        pages, bbox = pages[blocks], bbox[blocks]
+    np.minimum.at(extents[:, 0], pages, bbox[:, 0])
+    np.minimum.at(extents[:, 1], pages, bbox[:, 1])
+    np.maximum.at(extents[:, 2], pages, bbox[:, 2])
+    np.maximum.at(extents[:, 3], pages, bbox[:, 3])
+    return extents
+
+
+def outside_frame(bbox: np.ndarray, pages: np.ndarray, frames: np.ndarray) -> np.ndarray:
+    '''
+    Returns the rows of bbox that are not contained in the frame of their
+    page. frames is a (page_count, 4) x0, y0, x1, y1 array indexed by pages.
+    '''
+    frame = frames[pages]
+    broken = ((bbox[:, 0] < frame[:, 0]) | (bbox[:, 1] < frame[:, 1]) |
+              (bbox[:, 2] > frame[:, 2]) | (bbox[:, 3] > frame[:, 3]))
+    return np.flatnonzero(broken)
+
+
+def leading_symbols(layout: PdfLayout, symbols, separator: str = ' ') -> np.ndarray:
+    '''
+    Returns the spans whose stripped text starts with one of symbols (single
+    characters) followed by separator or by nothing.
+    '''
+    codes = layout.codes
+    start, end = layout.stripped_bounds()
+    # Pad so that start + 1 is a valid index for spans that end the text.
+    padded = np.append(codes, np.uint32(0))
+    symbol_codes = np.array([ord(symbol) for symbol in symbols if len(symbol) == 1], dtype=np.uint32)
+    found = (end > start) & np.isin(padded[start], symbol_codes)
+    found &= (end - start == 1) | (padded[start + 1] == ord(separator))
+    return np.flatnonzero(found)
+
+
+def indentation_levels(indents: np.ndarray, max_level: int = 3) -> np.ndarray:
+    '''
+    Returns the list level of each item in a run of list items from their
+    indentation: one level deeper than the previous item when indented further,
+    back to level 1 when indented less, the previous item's level otherwise.
+    The first item is compared against an indentation of 0 and level 0.
+    '''
+    step = np.sign(np.diff(indents, prepend=0))
+    deeper = np.cumsum(step > 0)
+    positions = np.arange(len(indents))
+    last_reset = np.maximum.accumulate(np.where(step < 0, positions, -1))
+    # Within a run between resets the level only grows, so capping the count
+    # is the same as capping each step.
+    levels = np.where(last_reset >= 0, 1 + deeper - deeper[np.maximum(last_reset, 0)], deeper)
+    return np.minimum(levels, max_level)
+
+
+def _mask(rows: np.ndarray, size: int) -> np.ndarray:
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        return rows
+    mask = np.zeros(size, dtype=bool)
+    mask[rows] = True
+    return mask
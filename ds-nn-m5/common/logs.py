@@ -0,0 +1,51 @@
+import os
+from logging.config import dictConfig
+import logging
+
+try:
+    BASE_DIR = os.getcwd()
+    LOG_DIR = os.path.join(BASE_DIR, 'logs')
+
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'verbose': {
+                'format': '%(asctime)s - %(name)s - %(levelname)s - %(pathname)s - %(lineno)d - %(message)s'
+            },
+            'verbose_moodys_ml': {
+                'format': '%(asctime)s - %(name)s - %(levelname)s - %(pathname)s - %(lineno)d - %(id)d - %(message)s'
+            },
+            'frontend': {
+                'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+            },
+        },
+        'handlers': {
+            'console': {
+                'class': 'logging.StreamHandler',
+                'level': 'DEBUG',
+                'formatter': 'verbose',
+            },
+            'doc_format_checker': {
+                'class': 'logging.FileHandler',
+                'level': 'DEBUG',
+                'formatter': 'verbose',
+                'filename': os.path.join(LOG_DIR, 'doc_format_checker.log')
+            }
+        },
+        'loggers': {
+            'doc_format_checker': {
+                'handlers': ['doc_format_checker', 'console'],
+                'level': 'DEBUG',
+                'propagate': True,
+            }
+        },
+    }
+
+    dictConfig(LOGGING)
+    logger = logging.getLogger('doc_format_checker')
+except Exception as e:
+    pass
\ No newline at end of file
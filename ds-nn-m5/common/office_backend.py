@@ -0,0 +1,196 @@
+import importlib
+import importlib.util
+import os
+import threading
+from typing import List
+from common.conversion_cache import convert_cached
+from common.logs import logger
+from common.office_pool import converter_name, get_office_pool, libreoffice_path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'libreoffice' (warm LibreOffice workers, see common/office_pool.py), 'word'
+# (Microsoft Word over COM, Windows only, see common/word_backend.py) or the
+# 'package.module:ClassName' of another OfficeBackend.
+office_backend = os.getenv('office_backend', 'libreoffice')
+
+BACKENDS = {
+    'libreoffice': 'common.office_backend:LibreOfficeBackend',
+    'word': 'common.word_backend:WordBackend',
+}
+
+# List types, numbered as Word's WdListType
+LIST_NONE = 0
+LIST_NO_NUMBERING = 1
+LIST_BULLET = 2
+LIST_NUMBERED = 3
+LIST_PICTURE_BULLET = 6
+
+# com.sun.star.style.NumberingType
+_NUMBER_NONE = 5
+_CHAR_SPECIAL = 6
+_BITMAP = 8
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class LaidOutParagraph:
+    '''
+    A paragraph as the office application lays it out: its text, style name
+    and font, and, in a list, the list type, the label the application numbers
+    it with (such as '2.1' or a bullet character) and its 1-based list level.
+    Outside lists list_type is LIST_NONE, list_string '' and level 0.
+    '''
+    def __init__(self, text, style='', list_type=LIST_NONE, list_string='', level=0, font_name=None) -> None:
+        self.text = text
+        self.style = style
+        self.list_type = list_type
+        self.list_string = list_string
+        self.level = level
+        self.font_name = font_name
+
+    def __repr__(self) -> str:
+        return f'LaidOutParagraph({self.text[:30]!r}, style={self.style!r}, list_type={self.list_type}, list_string={self.list_string!r})'
+
+
+class OfficeBackend:
+    '''
+    Converts DOCX files to PDF and reports how an office application lays them
+    out, for the checks that need more than the document's XML (list labels,
+    pagination). Calls may come from several threads at once, each for a
+    document of its own; a backend runs them in parallel or queues them, but
+    never makes one job disturb another.
+
+        backend = get_office_backend()
+        pdf_path = backend.convert(docx_path, output_dir)
+        bullets = [p for p in backend.paragraphs(docx_path) if p.list_type == LIST_BULLET]
+    '''
+    name = 'office'
+
+    def converter(self) -> str:
+        '''
+        Names the converter, with its version where known, for keying the PDFs
+        and page indexes it produces, since applications lay documents out
+        differently.
+        '''
+        return self.name
+
+    def convert(self, docx_path: str, output_dir: str) -> str:
+        '''
+        Converts a DOCX to PDF in output_dir and returns the path of the PDF,
+        named after the DOCX.
+        '''
+        raise NotImplementedError(f'{type(self).__name__} does not convert documents')
+
+    def paragraphs(self, docx_path: str) -> List[LaidOutParagraph]:
+        '''
+        Returns the paragraphs of the body, those of tables cell by cell, in
+        document order.
+        '''
+        raise NotImplementedError(f'{type(self).__name__} does not lay out documents')
+
+    def check_layout(self) -> None:
+        '''
+        Raises RuntimeError when paragraphs() cannot run on this host.
+        '''
+
+
+class LibreOfficeBackend(OfficeBackend):
+    '''
+    The process-wide OfficePool: office_pool_size warm LibreOffice workers with
+    profiles of their own, so that as many jobs run at once. paragraphs() needs
+    the uno module.
+    '''
+    name = 'libreoffice'
+
+    def __init__(self) -> None:
+        self.pool = get_office_pool()
+        if self.pool is None:
+            raise RuntimeError(f"LibreOffice is not available: '{libreoffice_path}' was not found or office_pool_enabled is off")
+
+    def converter(self) -> str:
+        return converter_name()
+
+    def convert(self, docx_path: str, output_dir: str) -> str:
+        return self.pool.convert(docx_path, output_dir)
+
+    def paragraphs(self, docx_path: str) -> List[LaidOutParagraph]:
+        return self.pool.run(docx_path, _read_paragraphs)
+
+    def check_layout(self) -> None:
+        # Conversions may run without uno (office_pool_cold_start), reading the layout may not.
+        if importlib.util.find_spec('uno') is None:
+            raise RuntimeError('Reading the layout of documents from LibreOffice needs the uno module, installed with the python3-uno system package')
+
+
+def get_office_backend() -> OfficeBackend:
+    '''
+    The process-wide backend named by office_backend. Raises RuntimeError when
+    it cannot run on this host, e.g. 'word' without Windows and Word.
+    '''
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            module_name, _, class_name = BACKENDS.get(office_backend.lower(), office_backend).partition(':')
+            backend = getattr(importlib.import_module(module_name), class_name)()
+            logger.info(f"Office backend '{office_backend}' ready ({backend.converter()})")
+            _backend = backend
+        return _backend
+
+
+def check_office_backend(layout: bool = False) -> OfficeBackend:
+    '''
+    Creates the backend when a service starts, so that a missing dependency
+    (LibreOffice and python3-uno, or Word and pywin32) stops the service with
+    a RuntimeError naming it rather than failing its requests. With layout it
+    also checks that paragraphs() can run.
+    '''
+    backend = get_office_backend()
+    if layout:
+        backend.check_layout()
+    return backend
+
+
+def convert_to_pdf(docx_path: str, output_dir: str = None) -> str:
+    '''
+    Converts a DOCX to PDF in output_dir (next to the DOCX by default) with the
+    office backend and returns the path of the PDF, served from the conversion
+    cache (see common/conversion_cache.py) when the same bytes were converted
+    before by the same converter.
+    '''
+    backend = get_office_backend()
+    output_dir = output_dir or os.path.dirname(os.path.abspath(docx_path))
+    return convert_cached(docx_path, output_dir, lambda: backend.convert(docx_path, output_dir), backend.converter())
+
+
+def _read_paragraphs(document) -> List[LaidOutParagraph]:
+    # Walks a UNO text document, descending into table cells row by row.
+    paragraphs = []
+
+    def walk(text) -> None:
+        enumeration = text.createEnumeration()
+        while enumeration.hasMoreElements():
+            element = enumeration.nextElement()
+            if element.supportsService('com.sun.star.text.TextTable'):
+                for cell_name in element.getCellNames():
+                    walk(element.getCellByName(cell_name).getText())
+            elif element.supportsService('com.sun.star.text.Paragraph'):
+                paragraphs.append(_paragraph(element))
+
+    walk(document.getText())
+    return paragraphs
+
+
+def _paragraph(element) -> LaidOutParagraph:
+    text = element.getString()
+    style = element.getPropertyValue('ParaStyleName')
+    font_name = element.getPropertyValue('CharFontName')
+    # Void (None) outside lists
+    if not element.getPropertyValue('NumberingIsNumber'):
+        return LaidOutParagraph(text, style, font_name=font_name)
+    level = element.getPropertyValue('NumberingLevel')
+    numbering = {prop.Name: prop.Value for prop in element.getPropertyValue('NumberingRules').getByIndex(level)}
+    list_type = {_NUMBER_NONE: LIST_NO_NUMBERING, _CHAR_SPECIAL: LIST_BULLET, _BITMAP: LIST_PICTURE_BULLET}.get(numbering.get('NumberingType'), LIST_NUMBERED)
+    return LaidOutParagraph(text, style, list_type, element.getPropertyValue('ListLabelString'), level + 1, font_name)
@@ -0,0 +1,243 @@
+import bisect
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import unicodedata
+from typing import Callable
+from common.docx_model import Bookmark, DocxModel, Field, Hyperlink, Paragraph
+from common.mapped_file import open_pdf
+from dotenv import load_dotenv
+
+load_dotenv()
+
+libreoffice_path = os.getenv('libreoffice_path', 'libreoffice')
+page_index_convert_timeout = float(os.getenv('page_index_convert_timeout', 300))
+
+# A paragraph is looked for by its first PROBE_WORDS words and found where at
+# least MATCH_RATIO of them line up with the PDF's words. Short probes (headings,
+# table cells) are made of common words, so they are only looked for within
+# SHORT_WINDOW words of the previous match; longer ones within SEARCH_WINDOW.
+PROBE_WORDS = 8
+MATCH_RATIO = 0.75
+SHORT_PROBE_WORDS = 3
+SHORT_WINDOW = 400
+SEARCH_WINDOW = 20000
+
+_WORD = re.compile(r'\w+')
+
+
+def _words(text: str) -> list:
+    # NFKC folds the ligatures and the like that PDF text extraction returns.
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return _WORD.findall(text.lower())
+
+
+def _tokens(text: str) -> list:
+    # (normalized word, character offset) of a paragraph's words
+    if text.isascii():
+        return [(match.group().lower(), match.start()) for match in _WORD.finditer(text)]
+    return [(unicodedata.normalize('NFKC', match.group()).lower(), match.start()) for match in _WORD.finditer(text)]
+
+
+def convert_to_pdf(docx_path: str, output_dir: str) -> str:
+    '''
+    Converts a DOCX to PDF in output_dir with headless LibreOffice and returns
+    the path of the PDF.
+    '''
+    command = [libreoffice_path, '--headless', '--convert-to', 'pdf', '--outdir', output_dir, docx_path]
+    subprocess.run(command, check=True, capture_output=True, timeout=page_index_convert_timeout)
+    pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"LibreOffice did not write {pdf_path}")
+    return pdf_path
+
+
+class PageIndex:
+    '''
+    Page numbers of the paragraphs, hyperlinks, bookmarks and fields of a DOCX,
+    taken from a rendering of the document to PDF instead of estimated from
+    character or paragraph counts.
+
+        index = PageIndex.load_cached(path, model)
+        index.page_of(paragraph)            # or a Hyperlink, Bookmark or Field
+        index.anchor_page('_Toc123456')     # target of an internal link
+
+    The index is built by walking the paragraphs in document order and finding
+    the sequence of words each one starts with in the PDF's words, after the
+    previous match; words the PDF adds (list numbers, headers and footers, page
+    numbers) are skipped over. A paragraph that runs onto the next page keeps
+    the character offsets where its pages change, so that a hyperlink gets the
+    page its own text is on. Paragraphs without text, or whose words were not
+    found, take the page of the paragraph before them.
+
+    Items are looked up by Paragraph.index, so the model the index is queried
+    with may be a references_only model of the same document.
+    '''
+    # Bump when the matching changes, so that indexes in the artifact cache are
+    # rebuilt.
+    ARTIFACT_VERSION = 1
+
+    def __init__(self, paragraph_pages: list, page_breaks: dict, bookmarks: dict, page_count: int, coverage: float) -> None:
+        self.paragraph_pages = paragraph_pages
+        self.page_breaks = page_breaks
+        self.bookmarks = bookmarks
+        self.page_count = page_count
+        self.coverage = coverage
+
+    @classmethod
+    def build(cls, model: DocxModel, pdf) -> 'PageIndex':
+        '''
+        Builds the index of a full (not references_only) DocxModel from a path
+        to, or an open fitz document of, a PDF rendering of the same document.
+        '''
+        if not model.all_paragraphs and (model.hyperlinks or model.bookmarks or model.fields):
+            raise ValueError('PageIndex needs a full DocxModel, not a references_only one')
+
+        document = open_pdf(pdf) if isinstance(pdf, (str, os.PathLike)) else pdf
+        try:
+            words, page_starts = [], []
+            for page in document:
+                page_starts.append(len(words))
+                words.extend(_words(page.get_text()))
+            page_count = len(document)
+        finally:
+            if document is not pdf:
+                document.close()
+
+        positions = {}
+        for position, word in enumerate(words):
+            positions.setdefault(word, []).append(position)
+
+        def page_at(position: int) -> int:
+            return bisect.bisect_right(page_starts, position)
+
+        paragraph_pages = [None] * len(model.all_paragraphs)
+        page_breaks = {}
+        cursor = 0
+        matched = with_text = 0
+        for index, paragraph in enumerate(model.all_paragraphs):
+            tokens = _tokens(paragraph.text)
+            if not tokens:
+                continue
+            with_text += 1
+            start = _find([word for word, _ in tokens[:PROBE_WORDS]], words, positions, cursor)
+            if start is None:
+                continue
+            matched += 1
+            page = paragraph_pages[index] = page_at(start)
+            if page_at(min(start + len(tokens), len(words)) - 1) != page:
+                breaks = []
+                for number, (_, offset) in enumerate(tokens):
+                    word_page = page_at(min(start + number, len(words) - 1))
+                    if word_page != page:
+                        breaks.append((offset, word_page))
+                        page = word_page
+                page_breaks[index] = breaks
+            # Stop short of the paragraph's end, in case the PDF lost some of its words.
+            cursor = start + max(1, len(tokens) * 3 // 4)
+
+        # Unmatched paragraphs continue the page of the paragraph before them.
+        previous = next((page for page in paragraph_pages if page is not None), 1 if page_count else None)
+        for index, page in enumerate(paragraph_pages):
+            if page is None:
+                paragraph_pages[index] = previous
+            else:
+                previous = page
+
+        index = cls(paragraph_pages, page_breaks, {}, page_count, matched / with_text if with_text else 1.0)
+        for bookmark in model.bookmarks:
+            if bookmark.name not in index.bookmarks:
+                index.bookmarks[bookmark.name] = index.page_of(bookmark)
+        return index
+
+    @classmethod
+    def render(cls, source, model: DocxModel = None, convert: Callable[[str, str], str] = convert_to_pdf) -> 'PageIndex':
+        '''
+        Builds the index of a DOCX given as a path or a seekable binary file by
+        converting it to PDF with convert(docx_path, output_dir) -> pdf_path in
+        a temporary directory. model is the full DocxModel, loaded when not given.
+        '''
+        with tempfile.TemporaryDirectory(prefix='nn_page_index_') as work_dir:
+            if isinstance(source, (str, os.PathLike)):
+                docx_path = os.fspath(source)
+            else:
+                docx_path = os.path.join(work_dir, 'document.docx')
+                source.seek(0)
+                with open(docx_path, 'wb') as file:
+                    shutil.copyfileobj(source, file)
+                source.seek(0)
+            if model is None:
+                model = DocxModel.load(docx_path)
+            return cls.build(model, convert(docx_path, work_dir))
+
+    @classmethod
+    def load_cached(cls, source, model: DocxModel = None, convert: Callable[[str, str], str] = convert_to_pdf,
+                    renderer: str = 'libreoffice') -> 'PageIndex':
+        '''
+        Like render(), but served from the artifact cache (see common/artifact_cache.py)
+        when the same document was indexed before. renderer names what convert
+        lays the document out with, since Word and LibreOffice paginate differently.
+        '''
+        from common.artifact_cache import cached
+        version = f'{cls.ARTIFACT_VERSION}.{DocxModel.ARTIFACT_VERSION}-{renderer}'
+        return cached('page-index', version, source, lambda: cls.render(source, model, convert))
+
+    def paragraph_page(self, index: int, offset: int = 0):
+        '''
+        Returns the page of the character at offset in the paragraph at index in
+        all_paragraphs, or None when there is no such paragraph.
+        '''
+        if index is None or not 0 <= index < len(self.paragraph_pages):
+            return None
+        page = self.paragraph_pages[index]
+        for break_offset, break_page in self.page_breaks.get(index, ()):
+            if break_offset > offset:
+                break
+            page = break_page
+        return page
+
+    def page_of(self, item, offset: int = 0):
+        '''
+        Returns the 1-based page of a Paragraph (at a character offset), a
+        Hyperlink, a Bookmark or a Field of the document, or None when it is
+        not in a paragraph or the PDF had no pages.
+        '''
+        if isinstance(item, Paragraph):
+            return self.paragraph_page(item.index, offset)
+        if isinstance(item, Hyperlink):
+            return self.paragraph_page(item.paragraph.index, item.start)
+        if isinstance(item, (Bookmark, Field)):
+            return self.paragraph_page(item.paragraph.index) if item.paragraph is not None else None
+        raise TypeError(f'Cannot look up the page of {type(item).__name__}')
+
+    def anchor_page(self, name: str):
+        '''
+        Returns the page of the bookmark an internal hyperlink or REF field
+        points to, or None if the document has no bookmark of that name.
+        '''
+        return self.bookmarks.get(name)
+
+
+def _find(probe: list, words: list, positions: dict, cursor: int):
+    # Earliest start at or after cursor where enough of the probe's words line
+    # up. Candidates come from the probe's two rarest words, so a common word
+    # never leads to a scan of the document, and one PDF word that differs
+    # (a hyphenated line break, say) does not hide the match.
+    needed = math.ceil(len(probe) * MATCH_RATIO)
+    limit = cursor + (SHORT_WINDOW if len(probe) < SHORT_PROBE_WORDS else SEARCH_WINDOW)
+    anchors = sorted(range(len(probe)), key=lambda number: len(positions.get(probe[number], ())))[:2]
+    best = None
+    for anchor in anchors:
+        candidates = positions.get(probe[anchor], ())
+        for position in candidates[bisect.bisect_left(candidates, cursor + anchor):]:
+            start = position - anchor
+            if start >= limit or (best is not None and start >= best):
+                break
+            if sum(1 for number, word in enumerate(probe) if start + number < len(words) and words[start + number] == word) >= needed:
+                best = start
+                break
+    return best
@@ -0,0 +1,262 @@
+import fitz  # PyMuPDF
+import numpy as np
+from common.artifact_cache import cached
+from common.pdf_sharding import run_sharded, should_shard
+
+# Block types in PyMuPDF's get_text('dict') output.
+TEXT_BLOCK = 0
+IMAGE_BLOCK = 1
+
+# Whether a code point is one str.isspace() accepts, for every code point up
+# to U+3000 (the last one) plus one entry that any higher code point maps to.
+WHITESPACE = np.array([chr(code).isspace() for code in range(0x3002)], dtype=bool)
+
+
+class PdfLayout:
+    '''
+    The text layout of a PDF, extracted with one get_text('dict') call per page
+    and stored as columns, so that several checks can share one extraction
+    instead of each walking the document again.
+
+    Spans, in reading order (page, block, line, span):
+        span_page      int32    0-based page number
+        span_block     int32    row in the block columns
+        span_line      int32    line number, unique across the document
+        span_bbox      float64  (n, 4) x0, y0, x1, y1 in points
+        span_size      float64  font size in points
+        span_font      int32    index into fonts
+        span_flags     int32    PyMuPDF span flags (bold, italic, ...)
+        span_color     int32    sRGB colour
+        span_start/end int64    offsets of the span's text in text
+                                (and in codes, its code points)
+    Blocks, text and image:
+        block_page, block_bbox, block_type
+    Pages:
+        page_width, page_height
+
+        layout = PdfLayout.extract(fitz.open(path))
+        for index in layout.block_spans(block):
+            layout.span_text(index), layout.span_size[index]
+    '''
+    # Bump the first part when the columns or their extraction change, so that
+    # layouts in the artifact cache are rebuilt; a new PyMuPDF does the same.
+    ARTIFACT_VERSION = f'1-pymupdf{fitz.VersionBind}'
+
+    def __init__(self) -> None:
+        self.page_count = 0
+        self.page_width = np.zeros(0)
+        self.page_height = np.zeros(0)
+        self.block_page = np.zeros(0, dtype=np.int32)
+        self.block_bbox = np.zeros((0, 4))
+        self.block_type = np.zeros(0, dtype=np.int8)
+        self.span_page = np.zeros(0, dtype=np.int32)
+        self.span_block = np.zeros(0, dtype=np.int32)
+        self.span_line = np.zeros(0, dtype=np.int32)
+        self.span_bbox = np.zeros((0, 4))
+        self.span_size = np.zeros(0)
+        self.span_font = np.zeros(0, dtype=np.int32)
+        self.span_flags = np.zeros(0, dtype=np.int32)
+        self.span_color = np.zeros(0, dtype=np.int32)
+        self.span_start = np.zeros(0, dtype=np.int64)
+        self.span_end = np.zeros(0, dtype=np.int64)
+        self.text = ''
+        self.fonts = []
+        self._block_span_bounds = None
+        self._page_block_bounds = None
+        self._page_span_bounds = None
+        self._codes = None
+        self._stripped = None
+
+    @classmethod
+    def extract(cls, doc, start: int = 0, stop: int = None) -> 'PdfLayout':
+        '''
+        Extracts pages start..stop-1 (default: all) of an open PyMuPDF document.
+        Page numbers in the result stay those of the document.
+        '''
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        pages = range(start, stop)
+        page_width, page_height = [], []
+        block_page, block_bbox, block_type = [], [], []
+        span_page, span_block, span_line, span_bbox = [], [], [], []
+        span_size, span_font, span_flags, span_color = [], [], [], []
+        lengths, texts = [], []
+        font_ids = {}
+        line_number = 0
+
+        for page_number in pages:
+            page = doc.load_page(page_number)
+            page_width.append(page.rect.width)
+            page_height.append(page.rect.height)
+            for block in page.get_text('dict')['blocks']:
+                block_index = len(block_page)
+                block_page.append(page_number)
+                block_bbox.append(block['bbox'])
+                block_type.append(block.get('type', TEXT_BLOCK))
+                for line in block.get('lines', ()):
+                    for span in line['spans']:
+                        span_page.append(page_number)
+                        span_block.append(block_index)
+                        span_line.append(line_number)
+                        span_bbox.append(span['bbox'])
+                        span_size.append(span['size'])
+                        span_font.append(font_ids.setdefault(span['font'], len(font_ids)))
+                        span_flags.append(span['flags'])
+                        span_color.append(span['color'])
+                        lengths.append(len(span['text']))
+                        texts.append(span['text'])
+                    line_number += 1
+
+        layout = cls()
+        layout.page_count = doc.page_count
+        # Pages outside start..stop keep zero size; their rows are simply absent.
+        layout.page_width = np.zeros(doc.page_count)
+        layout.page_height = np.zeros(doc.page_count)
+        layout.page_width[start:stop] = page_width
+        layout.page_height[start:stop] = page_height
+        layout.block_page = np.array(block_page, dtype=np.int32)
+        layout.block_bbox = np.array(block_bbox, dtype=np.float64).reshape(-1, 4)
+        layout.block_type = np.array(block_type, dtype=np.int8)
+        layout.span_page = np.array(span_page, dtype=np.int32)
+        layout.span_block = np.array(span_block, dtype=np.int32)
+        layout.span_line = np.array(span_line, dtype=np.int32)
+        layout.span_bbox = np.array(span_bbox, dtype=np.float64).reshape(-1, 4)
+        layout.span_size = np.array(span_size, dtype=np.float64)
+        layout.span_font = np.array(span_font, dtype=np.int32)
+        layout.span_flags = np.array(span_flags, dtype=np.int32)
+        layout.span_color = np.array(span_color, dtype=np.int32)
+        layout.span_end = np.cumsum(np.array(lengths, dtype=np.int64))
+        layout.span_start = layout.span_end - np.array(lengths, dtype=np.int64)
+        layout.text = ''.join(texts)
+        layout.fonts = list(font_ids)
+        return layout
+
+    @classmethod
+    def extract_file(cls, source, doc=None) -> 'PdfLayout':
+        '''
+        Extracts all pages of a PDF given as a path or as bytes. Documents of
+        pdf_shard_threshold pages or more are extracted in page shards by worker
+        processes (see common/pdf_sharding.py); smaller ones from doc, when it is
+        already open, or from a document opened here. The layout is kept in the
+        artifact cache (see common/artifact_cache.py), so a document that was
+        extracted before is not read again.
+        '''
+        return cached('pdf-layout', cls.ARTIFACT_VERSION, source, lambda: cls._extract_file(source, doc))
+
+    @classmethod
+    def _extract_file(cls, source, doc=None) -> 'PdfLayout':
+        if doc is not None and not should_shard(doc.page_count):
+            return cls.extract(doc)
+        page_count = doc.page_count if doc is not None else None
+        shards = run_sharded(source, cls.extract, page_count=page_count, name='layout')
+        return cls.concat([shard['result'] for shard in shards])
+
+    @classmethod
+    def concat(cls, layouts: list) -> 'PdfLayout':
+        '''
+        Joins layouts of consecutive page ranges of one document, in page order,
+        into the layout of the whole range.
+        '''
+        if len(layouts) == 1:
+            return layouts[0]
+        layout = cls()
+        layout.page_count = layouts[0].page_count
+        # Each part has zero-size pages outside its own range.
+        layout.page_width = np.sum([part.page_width for part in layouts], axis=0)
+        layout.page_height = np.sum([part.page_height for part in layouts], axis=0)
+        block_offsets = np.cumsum([0] + [len(part.block_page) for part in layouts])
+        line_offsets = np.cumsum([0] + [int(part.span_line.max()) + 1 if part.span_count else 0 for part in layouts])
+        text_offsets = np.cumsum([0] + [len(part.text) for part in layouts])
+        font_ids = {}
+        font_maps = [np.array([font_ids.setdefault(font, len(font_ids)) for font in part.fonts], dtype=np.int32)
+                     for part in layouts]
+        layout.block_page = np.concatenate([part.block_page for part in layouts])
+        layout.block_bbox = np.concatenate([part.block_bbox for part in layouts])
+        layout.block_type = np.concatenate([part.block_type for part in layouts])
+        layout.span_page = np.concatenate([part.span_page for part in layouts])
+        layout.span_block = np.concatenate([part.span_block + offset for part, offset in zip(layouts, block_offsets)], dtype=np.int32)
+        layout.span_line = np.concatenate([part.span_line + offset for part, offset in zip(layouts, line_offsets)], dtype=np.int32)
+        layout.span_bbox = np.concatenate([part.span_bbox for part in layouts])
+        layout.span_size = np.concatenate([part.span_size for part in layouts])
+        layout.span_font = np.concatenate([font_map[part.span_font] if len(font_map) else part.span_font
+                                           for part, font_map in zip(layouts, font_maps)], dtype=np.int32)
+        layout.span_flags = np.concatenate([part.span_flags for part in layouts])
+        layout.span_color = np.concatenate([part.span_color for part in layouts])
+        layout.span_start = np.concatenate([part.span_start + offset for part, offset in zip(layouts, text_offsets)])
+        layout.span_end = np.concatenate([part.span_end + offset for part, offset in zip(layouts, text_offsets)])
+        layout.text = ''.join(part.text for part in layouts)
+        layout.fonts = list(font_ids)
+        return layout
+
+    @property
+    def span_count(self) -> int:
+        return len(self.span_page)
+
+    @property
+    def image_page(self) -> np.ndarray:
+        return self.block_page[self.block_type == IMAGE_BLOCK]
+
+    @property
+    def image_bbox(self) -> np.ndarray:
+        return self.block_bbox[self.block_type == IMAGE_BLOCK]
+
+    def span_text(self, index: int) -> str:
+        return self.text[self.span_start[index]:self.span_end[index]]
+
+    def span_texts(self) -> list:
+        '''
+        Returns the text of every span as a list, for loops over all spans.
+        '''
+        text = self.text
+        return [text[start:end] for start, end in zip(self.span_start.tolist(), self.span_end.tolist())]
+
+    @property
+    def codes(self) -> np.ndarray:
+        '''
+        text as an array of code points, one per character, so that
+        span_start/span_end index it the same way they index text.
+        '''
+        if self._codes is None:
+            self._codes = np.frombuffer(self.text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        return self._codes
+
+    def stripped_bounds(self) -> tuple:
+        '''
+        Returns (start, end) offsets of every span's text as str.strip() would
+        leave it. Blank spans get start == end.
+        '''
+        if self._stripped is None:
+            codes = self.codes
+            solid = np.flatnonzero(~WHITESPACE[np.minimum(codes, len(WHITESPACE) - 1)])
+            # First non-space offset at or after the span's start, with a
+            # sentinel past the end of text for spans after the last one.
+            first = np.append(solid, len(codes))[np.searchsorted(solid, self.span_start)]
+            # Last non-space offset before the span's end, plus one; 0 if none.
+            last = np.insert(solid + 1, 0, 0)[np.searchsorted(solid, self.span_end)]
+            start = np.minimum(first, self.span_end)
+            end = np.maximum(last, start)
+            self._stripped = (start, end)
+        return self._stripped
+
+    def page_blocks(self, page: int) -> range:
+        '''
+        Returns the block rows of a 0-based page.
+        '''
+        if self._page_block_bounds is None:
+            self._page_block_bounds = np.searchsorted(self.block_page, np.arange(self.page_count + 1))
+        return range(int(self._page_block_bounds[page]), int(self._page_block_bounds[page + 1]))
+
+    def page_spans(self, page: int) -> range:
+        '''
+        Returns the span rows of a 0-based page.
+        '''
+        if self._page_span_bounds is None:
+            self._page_span_bounds = np.searchsorted(self.span_page, np.arange(self.page_count + 1))
+        return range(int(self._page_span_bounds[page]), int(self._page_span_bounds[page + 1]))
+
+    def block_spans(self, block: int) -> range:
+        '''
+        Returns the span rows of a block; empty for image blocks.
+        '''
+        if self._block_span_bounds is None:
+            self._block_span_bounds = np.searchsorted(self.span_block, np.arange(len(self.block_page) + 1))
+        return range(int(self._block_span_bounds[block]), int(self._block_span_bounds[block + 1]))
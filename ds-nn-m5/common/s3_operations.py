@@ -1,18 +1,47 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 from dotenv import load_dotenv
+from common.download_cache import get_download_cache
+from common.object_store import local_backend_enabled, get_local_object_store
 
 load_dotenv()
 
+# Upper bound on S3 transfers running at once across all requests in the process.
+s3_transfer_workers = int(os.getenv('s3_transfer_workers', 16))
+
+_transfer_executor = None
+_transfer_executor_lock = threading.Lock()
+
+
+def get_transfer_executor() -> ThreadPoolExecutor:
+    """Shared thread pool that runs blocking boto3 transfers off the event loop"""
+    global _transfer_executor
+    if _transfer_executor is None:
+        with _transfer_executor_lock:
+            if _transfer_executor is None:
+                _transfer_executor = ThreadPoolExecutor(max_workers=s3_transfer_workers, thread_name_prefix='s3-transfer')
+    return _transfer_executor
+
+
 class S3Operations:
     def __init__(self, bucket_name='eqc-gito'):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('aws_access_key_id'),
-            aws_secret_access_key=os.getenv('aws_secret_access_key'),
-            region_name=os.getenv('aws_region')
-        )
+        if local_backend_enabled():
+            # object_store_backend=local: serve the bucket from object_store_root
+            self.s3_client = get_local_object_store()
+        else:
+            self.s3_client = boto3.client(
+                's3',
+                aws_access_key_id=os.getenv('aws_access_key_id'),
+                aws_secret_access_key=os.getenv('aws_secret_access_key'),
+                region_name=os.getenv('aws_region'),
+                # One pooled connection per transfer thread
+                config=Config(max_pool_connections=s3_transfer_workers)
+            )
         self.bucket_name = bucket_name
 
     def download_directory(self, prefix: str, local_dir: str):
@@ -42,6 +71,11 @@ class S3Operations:
             raise Exception(f"Failed to download files from S3: {str(e)}")
 
     async def download_file(self, s3_path: str, local_path: str):
+        """
+        Download a file without blocking the event loop. The blocking boto3 transfer
+        runs on the shared transfer pool, so downloads for concurrent requests overlap
+        and at most s3_transfer_workers run at once; further requests wait their turn.
+        """
         try:
             # Parse s3 path (s3://bucket-name/key)
             key = '/'.join(s3_path.split('/')[3:])  # Skip s3:// and bucket name
@@ -49,12 +83,20 @@ class S3Operations:
             # Ensure directory exists
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
             
-            # Download the file
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(get_transfer_executor(), self._download_file_blocking, key, local_path)
+            return local_path
+        except ClientError as e:
+            raise Exception(f"S3 download failed: {str(e)}")
+
+    def _download_file_blocking(self, key: str, local_path: str):
+        """Download a file on the calling thread, going through the shared download cache when enabled"""
+        cache = get_download_cache()
+        if cache is not None:
+            cache.materialize(self.s3_client, self.bucket_name, key, local_path)
+        else:
             self.s3_client.download_file(
                 self.bucket_name,
                 key,
                 local_path
             )
-            return local_path
-        except ClientError as e:
-            raise Exception(f"S3 download failed: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from common.download_cache import FileLock
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+scratch_root = os.getenv('scratch_root', os.path.join(tempfile.gettempdir(), 'nn_scratch'))
+scratch_quota_bytes = int(os.getenv('scratch_quota_bytes', 10 * 1024 * 1024 * 1024))
+# Space reserved for a workspace up front; reserve() grows it for large outputs.
+scratch_reserve_bytes = int(os.getenv('scratch_reserve_bytes', 256 * 1024 * 1024))
+scratch_wait_timeout = float(os.getenv('scratch_wait_timeout', 300))
+scratch_orphan_age = float(os.getenv('scratch_orphan_age', 3600))
+scratch_sweep_interval = float(os.getenv('scratch_sweep_interval', 300))
+
+
+class ScratchQuota:
+    '''
+    Host-wide accounting of the scratch space under a root directory, shared by
+    every process and service that uses the root. A workspace counts for the
+    larger of its reservation, recorded in the workspace, and what it holds on
+    disk, so files that outgrow a reservation are counted too; anything else
+    under the root (such as orphans awaiting the sweeper) counts for its size.
+    Checks are serialised across processes with a file lock on the root.
+
+    acquire() blocks while the quota is full (backpressure) and gives up after a
+    timeout. A request larger than the whole quota is let through once nothing
+    else uses the root, so it cannot wait forever.
+    '''
+    RESERVATION_FILE = '.nn_reserved'
+    LOCK_FILE = '.quota.lock'
+
+    def __init__(self, limit_bytes: int, root: str) -> None:
+        self.limit_bytes = limit_bytes
+        self.root = root
+        # Wakes waiters of this process when a workspace closes; others are polled.
+        self._condition = threading.Condition()
+
+    def used_bytes(self) -> int:
+        '''
+        Returns the bytes counted against the quota under the root.
+        '''
+        total = 0
+        for name in os.listdir(self.root):
+            if name == self.LOCK_FILE:
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.isdir(path):
+                    total += max(_reservation(path), _directory_size(path))
+                else:
+                    total += os.path.getsize(path)
+            except OSError:
+                # Removed meanwhile
+                continue
+        return total
+
+    def acquire(self, path: str, nbytes: int, timeout: float = None) -> None:
+        '''
+        Grows the reservation of the workspace directory at path by nbytes.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with FileLock(os.path.join(self.root, self.LOCK_FILE)):
+                used = self.used_bytes()
+                reserved = _reservation(path)
+                held = max(reserved, _directory_size(path))
+                grown = max(reserved + nbytes, held)
+                if used == held or used - held + grown <= self.limit_bytes:
+                    with open(os.path.join(path, self.RESERVATION_FILE), 'w') as reservation:
+                        reservation.write(str(reserved + nbytes))
+                    return
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"Scratch quota full: {used} of {self.limit_bytes} bytes in use under '{self.root}', "
+                                   f"could not reserve {nbytes} more within {timeout}s")
+            with self._condition:
+                self._condition.wait(min(1.0, remaining) if remaining is not None else 1.0)
+
+    def release(self) -> None:
+        '''
+        Wakes waiters of this process once a workspace has been removed.
+        '''
+        with self._condition:
+            self._condition.notify_all()
+
+
+def _reservation(path: str) -> int:
+    try:
+        with open(os.path.join(path, ScratchQuota.RESERVATION_FILE)) as reservation:
+            return int(reservation.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def get_scratch_quota(root: str = None) -> ScratchQuota:
+    '''
+    Returns the process-wide ScratchQuota of a root (default scratch_root).
+    '''
+    root = root or scratch_root
+    with _quotas_lock:
+        if root not in _quotas:
+            _quotas[root] = ScratchQuota(scratch_quota_bytes, root)
+        return _quotas[root]
+
+
+_quotas = {}
+_quotas_lock = threading.Lock()
+_active = set()
+_active_lock = threading.Lock()
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class ScratchWorkspace:
+    '''
+    A unique scratch directory for one request under scratch_root.
+
+    Entering creates the directory and reserves reserve_bytes of the host-wide
+    scratch quota (see ScratchQuota), waiting while it is full; leaving deletes
+    the directory, and with it the reservation, whether the request succeeded,
+    failed or was cancelled.
+    Use `with` in synchronous code and `async with` in coroutines, where waiting
+    for quota does not block the event loop.
+
+        with ScratchWorkspace('margin-check') as workspace:
+            local_path = workspace.file('input.docx')
+    '''
+    def __init__(self, prefix: str = 'request', reserve_bytes: int = None, root: str = None) -> None:
+        self.prefix = prefix
+        self.reserved_bytes = scratch_reserve_bytes if reserve_bytes is None else reserve_bytes
+        self.root = root or scratch_root
+        self.path = None
+
+    def file(self, name: str) -> str:
+        '''
+        Returns a path for name inside the workspace. Only the base name is used.
+        '''
+        return os.path.join(self.path, os.path.basename(name))
+
+    def reserve(self, nbytes: int) -> None:
+        '''
+        Reserves nbytes more of the quota for this workspace, e.g. before writing a
+        converted PDF much larger than the initial reservation. Blocks while the quota is full.
+        '''
+        get_scratch_quota(self.root).acquire(self.path, nbytes, scratch_wait_timeout)
+        self.reserved_bytes += nbytes
+
+    def usage(self) -> int:
+        '''
+        Returns the bytes currently on disk in the workspace.
+        '''
+        return _directory_size(self.path) if self.path else 0
+
+    def open(self) -> 'ScratchWorkspace':
+        _ensure_sweeper()
+        os.makedirs(self.root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f'{self.prefix}-', dir=self.root)
+        try:
+            get_scratch_quota(self.root).acquire(path, self.reserved_bytes, scratch_wait_timeout)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        self.path = path
+        with _active_lock:
+            _active.add(self.path)
+        return self
+
+    def close(self) -> None:
+        if self.path is None:
+            return
+        path, self.path = self.path, None
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+            if os.path.exists(path):
+                # Usually a file still open on Windows; the sweeper retries later.
+                logger.warning(f"Scratch workspace '{path}' could not be fully removed")
+        finally:
+            with _active_lock:
+                _active.discard(path)
+            get_scratch_quota(self.root).release()
+
+    def __enter__(self) -> 'ScratchWorkspace':
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    async def __aenter__(self) -> 'ScratchWorkspace':
+        future = asyncio.get_running_loop().run_in_executor(None, self.open)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The open may still complete in its thread; clean it up when it does.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self.close())
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def sweep_orphans(max_age: float = None, root: str = None) -> int:
+    '''
+    Removes entries under the scratch root that belong to no open workspace and
+    have not been modified for max_age seconds (default scratch_orphan_age), e.g.
+    left behind by a killed process. Open workspaces of this process are touched
+    so sweepers in other processes sharing the root leave them alone.
+    Returns the number of entries removed.
+    '''
+    max_age = scratch_orphan_age if max_age is None else max_age
+    root = root or scratch_root
+    if not os.path.isdir(root):
+        return 0
+
+    with _active_lock:
+        active = set(_active)
+    for path in active:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if path in active or name == ScratchQuota.LOCK_FILE:
+            continue
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"Scratch sweeper removed {removed} orphaned entries from '{root}'")
+    return removed
+
+
+def _sweep_forever() -> None:
+    # The first pass runs at startup and clears leftovers from a previous run.
+    while True:
+        try:
+            sweep_orphans()
+        except Exception:
+            logger.exception("Exception in scratch sweeper")
+        time.sleep(scratch_sweep_interval)
+
+
+def _ensure_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None or scratch_sweep_interval <= 0:
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name='scratch-sweeper', daemon=True)
+            _sweeper.start()
@@ -1,9 +1,18 @@
 # processor.py
-from docx import Document
 import fitz  # PyMuPDF
+import numpy as np
 from typing import List, Dict
+from common.docx_model import DocxModel
+from common.layout_rules import font_flags, size_tolerance
+from common.logs import logger
+from common.office_backend import get_office_backend
+from common.page_index import PageIndex
+from common.pdf_layout import PdfLayout
 from scripts.models import TextElement, PageContent, FormatIssue
 
+# Styles in the order _determine_styles numbers them
+STYLES = ('Heading 1', 'Heading 2', 'Heading 3', 'Normal')
+
 class DocumentProcessor:
     def __init__(self):
         self.font_sizes = {
@@ -25,11 +34,14 @@ class DocumentProcessor:
             return 'Heading 3'
         return 'Normal'
 
+
     def process_docx(self, file_path: str) -> List[FormatIssue]:
-        doc = Document(file_path)
+        doc = DocxModel.load_cached(file_path)
         issues = []
         
-        # Calculate pages based on sections
+        # Page numbers from a PDF rendering of the document; estimated from the
+        # character count only when it cannot be converted
+        page_index = self._page_index(file_path, doc)
         total_pages = self._calculate_pages(doc)
         current_page = 1
         chars_per_page = 3000
@@ -37,14 +49,17 @@ class DocumentProcessor:
         
         for para in doc.paragraphs:
             if para.text.strip():
-                char_count += len(para.text)
-                current_page = min(total_pages, (char_count // chars_per_page) + 1)
+                if page_index is not None:
+                    current_page = page_index.page_of(para)
+                else:
+                    char_count += len(para.text)
+                    current_page = min(total_pages, (char_count // chars_per_page) + 1)
                 
                 if para.runs:
                     font_size = None
                     for run in para.runs:
-                        if run.font.size:
-                            font_size = run.font.size.pt
+                        if run.size:
+                            font_size = run.size
                             break
                     
                     # Get the normalized style name
@@ -66,6 +81,15 @@ class DocumentProcessor:
         
         return issues
 
+    def _page_index(self, file_path: str, doc):
+        """Page index of the document, or None if it cannot be converted to PDF"""
+        try:
+            backend = get_office_backend()
+            return PageIndex.load_cached(file_path, doc, convert=backend.convert, renderer=backend.converter())
+        except Exception as e:
+            logger.warning(f"Could not index the pages of {file_path}, estimating them: {e}")
+            return None
+
     def _calculate_pages(self, doc) -> int:
         """Estimate total pages in the document"""
         total_chars = sum(len(paragraph.text) for paragraph in doc.paragraphs)
@@ -77,39 +101,28 @@ class DocumentProcessor:
         issues = []
         
         try:
-            # Process each page
-            for page_num in range(pdf.page_count):
-                page = pdf[page_num]
-                blocks = page.get_text("dict")["blocks"]
-                
-                # Process text blocks on page
-                for block in blocks:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                text = span["text"].strip()
-                                if text:
-                                    font_size = round(span["size"], 1)
-                                    style = self._determine_style(span["font"], font_size)
-                                    
-                                    # Check format with tolerance
-                                    expected_size = self.font_sizes.get(style)
-                                    if expected_size and abs(font_size - expected_size) > self.pdf_tolerance:
-                                        issues.append(FormatIssue(
-                                            page=page_num + 1,
-                                            text=text[:100],
-                                            current_size=font_size,
-                                            expected_size=expected_size,
-                                            style=style
-                                        ))
+            layout = PdfLayout.extract_file(file_path, pdf)
+
+            # Check format with tolerance, over all spans at once
+            font_sizes = np.round(layout.span_size, 1)
+            styles = self._determine_styles(layout, font_sizes)
+            expected_sizes = np.array([self.font_sizes[style] for style in STYLES])[styles]
+            start, end = layout.stripped_bounds()
+            for index in size_tolerance(font_sizes, expected_sizes, self.pdf_tolerance, rows=end > start).tolist():
+                issues.append(FormatIssue(
+                    page=int(layout.span_page[index]) + 1,
+                    text=layout.text[start[index]:end[index]][:100],
+                    current_size=float(font_sizes[index]),
+                    expected_size=self.font_sizes[STYLES[styles[index]]],
+                    style=STYLES[styles[index]]
+                ))
             
-            pdf.close()
             return issues
             
         except Exception as e:
-            if pdf:
-                pdf.close()
             raise Exception(f"Error processing PDF: {str(e)}")
+        finally:
+            pdf.close()
     
     def _determine_style(self, font_name: str, font_size: float) -> str:
         """Determine text style based on font properties"""
@@ -122,4 +135,10 @@ class DocumentProcessor:
                 return 'Heading 2'
             elif font_size >= 11 - self.pdf_tolerance:
                 return 'Heading 3'
-        return 'Normal'
\ No newline at end of file
+        return 'Normal'
+
+    def _determine_styles(self, layout: PdfLayout, font_sizes: np.ndarray) -> np.ndarray:
+        """Determine the style of every span, as indexes into STYLES; same rules as _determine_style"""
+        is_bold = font_flags(layout, "bold", "heavy")
+        conditions = [is_bold & (font_sizes >= size - self.pdf_tolerance) for size in (13, 12, 11)]
+        return np.select(conditions, [0, 1, 2], default=3)
\ No newline at end of file
@@ -0,0 +1,398 @@
+import sys
+from lxml import etree
+from common.ooxml_package import OoxmlPackage
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+STYLES_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+
+_W = '{%s}' % W_NS
+BODY, P, R, T, TAB, PTAB, BR, CR, NO_BREAK_HYPHEN = (_W + tag for tag in ('body', 'p', 'r', 't', 'tab', 'ptab', 'br', 'cr', 'noBreakHyphen'))
+PPR, RPR, PSTYLE, NUMPR, NUMID, ILVL, SZ, RFONTS, BOLD, ITALIC = (_W + tag for tag in ('pPr', 'rPr', 'pStyle', 'numPr', 'numId', 'ilvl', 'sz', 'rFonts', 'b', 'i'))
+HYPERLINK, BOOKMARK_START, BOOKMARK_END, FLD_CHAR, INSTR_TEXT, FLD_SIMPLE = (_W + tag for tag in ('hyperlink', 'bookmarkStart', 'bookmarkEnd', 'fldChar', 'instrText', 'fldSimple'))
+VAL, ID, NAME, TYPE, ANCHOR, INSTR, ASCII, FLD_CHAR_TYPE = (_W + attr for attr in ('val', 'id', 'name', 'type', 'anchor', 'instr', 'ascii', 'fldCharType'))
+R_ID = '{%s}id' % R_NS
+
+# Lower-case built-in style names python-docx shows in title case, kept so that
+# style names read the same as para.style.name.
+_UI_STYLE_NAMES = {'caption': 'Caption', 'footer': 'Footer', 'header': 'Header'}
+_UI_STYLE_NAMES.update({f'heading {level}': f'Heading {level}' for level in range(1, 10)})
+
+_OFF_VALUES = {'0', 'false', 'off'}
+
+
+class Style:
+    '''
+    A paragraph or character style. There is one instance per style ID, shared by
+    every paragraph that uses it. num_id and ilvl are the style's own numbering.
+    '''
+    __slots__ = ('style_id', 'name', 'type', 'based_on', 'num_id', 'ilvl')
+
+    def __init__(self, style_id, name, type='paragraph', based_on=None, num_id=None, ilvl=None) -> None:
+        self.style_id = style_id
+        self.name = name
+        self.type = type
+        self.based_on = based_on
+        self.num_id = num_id
+        self.ilvl = ilvl
+
+    def __repr__(self) -> str:
+        return f'Style({self.style_id!r}, {self.name!r})'
+
+
+class Run:
+    '''
+    A run of text with its direct formatting. size is in points and, like
+    python-docx's run.font.size, None unless set on the run itself.
+    '''
+    __slots__ = ('text', 'size', 'font', 'bold', 'italic')
+
+    def __init__(self, text, size=None, font=None, bold=None, italic=None) -> None:
+        self.text = text
+        self.size = size
+        self.font = font
+        self.bold = bold
+        self.italic = italic
+
+
+class Paragraph:
+    '''
+    A paragraph. text and runs follow python-docx: runs directly in the paragraph
+    or in its hyperlinks. num_id / ilvl come from the paragraph's numbering
+    properties or else its style; both are None when it is not in a list.
+    index is the paragraph's position in all_paragraphs of the full model, also
+    in a references_only model, so that both can look up the same paragraph.
+    '''
+    __slots__ = ('text', 'style', 'num_id', 'ilvl', 'runs', 'hyperlinks', 'in_body', 'index')
+
+    def __init__(self, style=None, in_body=False, index=None) -> None:
+        self.text = ''
+        self.style = style
+        self.num_id = None
+        self.ilvl = None
+        self.runs = ()
+        self.hyperlinks = ()
+        self.in_body = in_body
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f'Paragraph({self.text[:40]!r}, style={self.style.name!r})'
+
+
+class Hyperlink:
+    '''
+    A hyperlink. target is the relationship target of an external link, anchor the
+    bookmark an internal link points to. start:end is its span in paragraph.text.
+    '''
+    __slots__ = ('paragraph', 'r_id', 'target', 'anchor', 'text', 'start', 'end')
+
+    def __init__(self, paragraph, r_id=None, target=None, anchor=None, start=0) -> None:
+        self.paragraph = paragraph
+        self.r_id = r_id
+        self.target = target
+        self.anchor = anchor
+        self.text = ''
+        self.start = start
+        self.end = start
+
+
+class Bookmark:
+    '''
+    A bookmark and the text between its start and end. paragraph is the one it
+    starts in (or, for a bookmark between paragraphs, the next one).
+    '''
+    __slots__ = ('paragraph', 'bookmark_id', 'name', 'text')
+
+    def __init__(self, paragraph, bookmark_id, name) -> None:
+        self.paragraph = paragraph
+        self.bookmark_id = bookmark_id
+        self.name = name
+        self.text = ''
+
+
+class Field:
+    '''
+    A complex (fldChar) or simple field: its instruction, e.g. 'REF _Ref123 \\h',
+    and the result text Word last displayed for it.
+    '''
+    __slots__ = ('paragraph', 'instruction', 'result')
+
+    def __init__(self, paragraph, instruction='') -> None:
+        self.paragraph = paragraph
+        self.instruction = instruction
+        self.result = ''
+
+
+class DocxModel:
+    '''
+    Read-only model of the main story of a DOCX file, built in one streaming pass
+    over word/document.xml. It replaces python-docx where a check only reads the
+    document: records are __slots__ objects, styles are shared per ID, font names
+    are interned and elements are discarded as soon as they are read, so a large
+    document takes a fraction of the memory and time of docx.Document().
+
+        model = DocxModel.load(path_or_binary_file)
+        for para in model.paragraphs:
+            para.text, para.style.name, para.num_id, para.ilvl, para.runs
+
+    paragraphs holds the body paragraphs in order, like document.paragraphs;
+    all_paragraphs also includes those in tables and text boxes. hyperlinks,
+    bookmarks and fields cover the whole main story.
+
+    With references_only=True only hyperlinks, bookmarks and fields are kept
+    (with the paragraphs they are in) and no runs are built, so memory follows
+    the number of references rather than the size of the document.
+    '''
+    # Bump when the records or the parsing change, so that models in the
+    # artifact cache are rebuilt.
+    ARTIFACT_VERSION = 2
+
+    def __init__(self) -> None:
+        self.paragraphs = []
+        self.all_paragraphs = []
+        self.hyperlinks = []
+        self.bookmarks = []
+        self.fields = []
+        self.styles = {}
+        self.relationships = {}
+        self.default_style = Style(None, 'Normal')
+
+    @classmethod
+    def load(cls, source, references_only: bool = False) -> 'DocxModel':
+        '''
+        Builds the model from a path or a seekable binary file. Only the main
+        document, its relationships and the styles part are read; images and
+        other embedded objects are never decompressed.
+        '''
+        model = cls()
+        with OoxmlPackage(source) as package:
+            document_part = package.main_part() or 'word/document.xml'
+            model.relationships = package.relationships(document_part)
+
+            styles_part = package.related_part(document_part, STYLES_REL)
+            if styles_part is not None:
+                with package.open_part(styles_part) as part:
+                    model._read_styles(part)
+
+            with package.open_part(document_part) as part:
+                model._read_document(part, references_only)
+        return model
+
+    @classmethod
+    def load_cached(cls, source, references_only: bool = False) -> 'DocxModel':
+        '''
+        Like load(), but served from the artifact cache (see common/artifact_cache.py)
+        when the same document was loaded before.
+        '''
+        from common.artifact_cache import cached
+        kind = 'docx-references' if references_only else 'docx-model'
+        return cached(kind, cls.ARTIFACT_VERSION, source, lambda: cls.load(source, references_only))
+
+    def text(self, separator: str = ' ') -> str:
+        '''
+        Returns the text of the body paragraphs joined by separator.
+        '''
+        return separator.join(para.text for para in self.paragraphs)
+
+    def _read_styles(self, part) -> None:
+        for _, element in etree.iterparse(part, tag=_W + 'style', huge_tree=True):
+            style_id = element.get(_W + 'styleId')
+            name = element.find(NAME)
+            name = name.get(VAL) if name is not None else style_id
+            based_on = element.find(_W + 'basedOn')
+            style = Style(
+                style_id,
+                _UI_STYLE_NAMES.get(name, name),
+                element.get(TYPE, 'paragraph'),
+                based_on.get(VAL) if based_on is not None else None
+            )
+            num_pr = element.find(f'{PPR}/{NUMPR}')
+            if num_pr is not None:
+                style.num_id, style.ilvl = _numbering(num_pr)
+            self.styles[style_id] = style
+            if style.type == 'paragraph' and element.get(_W + 'default') in ('1', 'true', 'on'):
+                self.default_style = style
+            element.clear()
+
+    def _style_numbering(self, style: Style):
+        seen = set()
+        while style is not None and style.style_id not in seen:
+            if style.num_id is not None:
+                return style.num_id, style.ilvl or 0
+            seen.add(style.style_id)
+            style = self.styles.get(style.based_on)
+        return None, None
+
+    def _read_document(self, part, references_only: bool = False) -> None:
+        paragraphs = []       # open paragraphs; more than one inside text boxes
+        runs = []             # open runs: [text parts, size, font, bold, italic, counted]
+        hyperlinks = []       # open hyperlinks
+        fields = []           # open fields: [Field, instruction parts, result parts, in result]
+        bookmarks = {}        # open bookmarks by ID: (Bookmark, text parts)
+        pending_bookmarks = []  # started between paragraphs
+        path = []             # tags of the open elements
+        para_parts = {}       # id(paragraph) -> (text parts, runs, hyperlinks)
+        paragraph_count = 0
+        body = None
+
+        def emit(text: str) -> None:
+            run = runs[-1]
+            if run[5]:
+                run[0].append(text)
+            if hyperlinks:
+                for hyperlink in hyperlinks:
+                    hyperlink[1].append(text)
+            for field in fields:
+                if field[3]:
+                    field[2].append(text)
+            for bookmark, parts in bookmarks.values():
+                parts.append(text)
+
+        for event, element in etree.iterparse(part, events=('start', 'end'), huge_tree=True):
+            tag = element.tag
+            if event == 'start':
+                parent = path[-1] if path else None
+                path.append(tag)
+                if tag == P:
+                    paragraph = Paragraph(self.default_style, in_body=parent == BODY, index=paragraph_count)
+                    paragraph_count += 1
+                    paragraphs.append(paragraph)
+                    para_parts[id(paragraph)] = ([], [], [])
+                    if not references_only:
+                        self.all_paragraphs.append(paragraph)
+                        if paragraph.in_body:
+                            self.paragraphs.append(paragraph)
+                    for bookmark in pending_bookmarks:
+                        bookmark.paragraph = paragraph
+                    pending_bookmarks.clear()
+                elif tag == R:
+                    # python-docx counts runs directly in the paragraph or in a hyperlink.
+                    counted = bool(paragraphs) and (parent == P or (parent == HYPERLINK and len(path) > 2 and path[-3] == P))
+                    runs.append([[], None, None, None, None, counted])
+                elif tag == HYPERLINK and paragraphs:
+                    paragraph = paragraphs[-1]
+                    r_id = element.get(R_ID)
+                    relationship = self.relationships.get(r_id)
+                    offset = sum(len(text) for text in para_parts[id(paragraph)][0])
+                    hyperlink = Hyperlink(paragraph, r_id, relationship[1] if relationship else None, element.get(ANCHOR), offset)
+                    hyperlinks.append((hyperlink, []))
+                    self.hyperlinks.append(hyperlink)
+                    para_parts[id(paragraph)][2].append(hyperlink)
+                elif tag == BOOKMARK_START:
+                    bookmark = Bookmark(paragraphs[-1] if paragraphs else None, element.get(ID), element.get(NAME))
+                    bookmarks[bookmark.bookmark_id] = (bookmark, [])
+                    self.bookmarks.append(bookmark)
+                    if bookmark.paragraph is None:
+                        pending_bookmarks.append(bookmark)
+                elif tag == FLD_CHAR and runs:
+                    field_type = element.get(FLD_CHAR_TYPE)
+                    if field_type == 'begin':
+                        field = Field(paragraphs[-1] if paragraphs else None)
+                        fields.append([field, [], [], False])
+                        self.fields.append(field)
+                    elif field_type == 'separate' and fields:
+                        fields[-1][3] = True
+                    elif field_type == 'end' and fields:
+                        _close_field(fields.pop())
+                elif tag == FLD_SIMPLE:
+                    field = Field(paragraphs[-1] if paragraphs else None, element.get(INSTR, ''))
+                    fields.append([field, None, [], True])
+                    self.fields.append(field)
+                elif tag == BODY:
+                    body = element
+                continue
+
+            path.pop()
+            in_run = bool(runs) and path[-1] == R
+            if tag == T:
+                if in_run and element.text:
+                    emit(element.text)
+            elif tag in (TAB, PTAB):
+                if in_run:
+                    emit('\t')
+            elif tag == BR:
+                if in_run and element.get(TYPE, 'textWrapping') == 'textWrapping':
+                    emit('\n')
+            elif tag == CR:
+                if in_run:
+                    emit('\n')
+            elif tag == NO_BREAK_HYPHEN:
+                if in_run:
+                    emit('-')
+            elif tag == INSTR_TEXT:
+                if fields and element.text and fields[-1][1] is not None and not fields[-1][3]:
+                    fields[-1][1].append(element.text)
+            elif tag == SZ:
+                if runs and len(path) > 1 and path[-1] == RPR and path[-2] == R:
+                    value = element.get(VAL)
+                    if value and value.replace('.', '', 1).isdigit():
+                        runs[-1][1] = float(value) / 2
+            elif tag == RFONTS:
+                if runs and len(path) > 1 and path[-1] == RPR and path[-2] == R:
+                    font = element.get(ASCII)
+                    runs[-1][2] = sys.intern(font) if font else None
+            elif tag in (BOLD, ITALIC):
+                if runs and len(path) > 1 and path[-1] == RPR and path[-2] == R:
+                    runs[-1][3 if tag == BOLD else 4] = element.get(VAL, 'true').lower() not in _OFF_VALUES
+            elif tag == PSTYLE:
+                if paragraphs and len(path) > 1 and path[-1] == PPR and path[-2] == P:
+                    paragraphs[-1].style = self.styles.get(element.get(VAL), self.default_style)
+            elif tag == NUMPR:
+                if paragraphs and len(path) > 1 and path[-1] == PPR and path[-2] == P:
+                    paragraphs[-1].num_id, paragraphs[-1].ilvl = _numbering(element)
+            elif tag == R:
+                parts, size, font, bold, italic, counted = runs.pop()
+                if counted:
+                    text = ''.join(parts)
+                    paragraph_parts = para_parts[id(paragraphs[-1])]
+                    paragraph_parts[0].append(text)
+                    if not references_only:
+                        paragraph_parts[1].append(Run(text, size, font, bold, italic))
+            elif tag == HYPERLINK:
+                if hyperlinks:
+                    hyperlink, parts = hyperlinks.pop()
+                    hyperlink.text = ''.join(parts)
+                    hyperlink.end = sum(len(text) for text in para_parts[id(hyperlink.paragraph)][0])
+            elif tag == BOOKMARK_END:
+                open_bookmark = bookmarks.pop(element.get(ID), None)
+                if open_bookmark is not None:
+                    open_bookmark[0].text = ''.join(open_bookmark[1])
+            elif tag == FLD_SIMPLE:
+                if fields and fields[-1][1] is None:
+                    _close_field(fields.pop())
+            elif tag == P:
+                paragraph = paragraphs.pop()
+                text_parts, paragraph_runs, paragraph_hyperlinks = para_parts.pop(id(paragraph))
+                paragraph.text = ''.join(text_parts)
+                if paragraph_runs:
+                    paragraph.runs = tuple(paragraph_runs)
+                if paragraph_hyperlinks:
+                    paragraph.hyperlinks = tuple(paragraph_hyperlinks)
+                if paragraph.num_id is None:
+                    paragraph.num_id, paragraph.ilvl = self._style_numbering(paragraph.style)
+
+            # Everything below the body level has been read: drop finished blocks.
+            if body is not None and len(path) == 2 and path[-1] == BODY:
+                element.clear()
+                body.remove(element)
+
+        # Bookmarks never closed run to the end of the document.
+        for bookmark, parts in bookmarks.values():
+            bookmark.text = ''.join(parts)
+
+
+def _close_field(open_field: list) -> None:
+    field, instruction_parts, result_parts, _ = open_field
+    if instruction_parts is not None:
+        field.instruction = ''.join(instruction_parts)
+    field.result = ''.join(result_parts)
+
+
+def _numbering(num_pr):
+    num_id = num_pr.find(NUMID)
+    ilvl = num_pr.find(ILVL)
+    num_id = num_id.get(VAL) if num_id is not None else None
+    ilvl = ilvl.get(VAL) if ilvl is not None else None
+    return (int(num_id) if num_id and num_id.isdigit() else None,
+            int(ilvl) if ilvl and ilvl.isdigit() else 0)
+
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import List
+from common.logs import logger
+from common.office_backend import LIST_NONE, LaidOutParagraph, OfficeBackend
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Word instances running at once
+word_backend_concurrency = int(os.getenv('word_backend_concurrency', 2))
+
+WD_FORMAT_PDF = 17
+WD_ALERTS_NONE = 0
+
+
+class WordBackend(OfficeBackend):
+    '''
+    Microsoft Word over COM automation, for Windows hosts with Word and pywin32
+    installed (office_backend=word). Every job starts a Word instance of its own
+    (DispatchEx rather than Dispatch, which attaches to a running one) and quits
+    it when done, so that jobs running at once never share or close each other's
+    documents and no Word process has to be killed beforehand. At most
+    word_backend_concurrency instances run at once; further jobs wait.
+    '''
+    name = 'word'
+
+    def __init__(self) -> None:
+        try:
+            import pythoncom
+            import win32com.client
+        except ImportError as e:
+            raise RuntimeError(f"The word office backend needs Windows with Microsoft Word and pywin32: {e}")
+        self._slots = threading.BoundedSemaphore(max(1, word_backend_concurrency))
+
+    def convert(self, docx_path: str, output_dir: str) -> str:
+        pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+        self._run(docx_path, lambda document: document.SaveAs(os.path.abspath(pdf_path), FileFormat=WD_FORMAT_PDF))
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"Word did not write {pdf_path}")
+        return pdf_path
+
+    def paragraphs(self, docx_path: str) -> List[LaidOutParagraph]:
+        return self._run(docx_path, _read_paragraphs)
+
+    def _run(self, docx_path: str, action):
+        # Opens the document read-only in a new Word instance and returns action(document).
+        import pythoncom
+        import win32com.client
+        with self._slots:
+            pythoncom.CoInitialize()
+            word = None
+            document = None
+            try:
+                word = win32com.client.DispatchEx('Word.Application')
+                word.Visible = False
+                word.DisplayAlerts = WD_ALERTS_NONE
+                document = word.Documents.Open(os.path.abspath(docx_path), ReadOnly=True, AddToRecentFiles=False)
+                return action(document)
+            finally:
+                try:
+                    if document is not None:
+                        document.Close(SaveChanges=0)
+                except Exception as e:
+                    logger.warning(f"Error closing document in Word: {e}")
+                try:
+                    if word is not None:
+                        word.Quit()
+                except Exception as e:
+                    logger.warning(f"Error quitting Word: {e}")
+                pythoncom.CoUninitialize()
+
+
+def _read_paragraphs(document) -> List[LaidOutParagraph]:
+    paragraphs = []
+    for para in document.Paragraphs:
+        text_range = para.Range
+        style = text_range.Style
+        list_format = text_range.ListFormat
+        list_type = list_format.ListType
+        if list_type == LIST_NONE:
+            paragraphs.append(LaidOutParagraph(text_range.Text, style.NameLocal if style else '', font_name=text_range.Font.Name))
+        else:
+            paragraphs.append(LaidOutParagraph(text_range.Text, style.NameLocal if style else '', list_type, list_format.ListString,
+                                               list_format.ListLevelNumber, text_range.Font.Name))
+    return paragraphs
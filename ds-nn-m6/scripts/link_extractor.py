@@ -1,11 +1,15 @@
 from abc import ABC, abstractmethod
-from docx import Document
 import PyPDF2
 import re
 from typing import Set, Dict, List, Optional
 from urllib.parse import urlparse
+import io
 import os
 from pdf2docx import Converter
+from common.docx_model import DocxModel
+from common.office_backend import get_office_backend
+from common.page_index import PageIndex
+from common.text_extraction import get_extractor
 
 class LinkExtractor(ABC):
     """Abstract base class for document link extractors"""
@@ -25,10 +29,18 @@ class LinkExtractor(ABC):
 class DocxLinkExtractor(LinkExtractor):
     """DOCX file link extractor"""
     def extract_links(self, file_path: str) -> Dict[str, Dict]:
-        doc = Document(file_path)
+        doc = DocxModel.load(file_path)
         links = {}
         
-        # Calculate pages based on paragraph count
+        # Page numbers from the office backend's PDF rendering of the document, cached by content
+        try:
+            backend = get_office_backend()
+            page_index = PageIndex.load_cached(file_path, doc, convert=backend.convert, renderer=backend.converter())
+        except Exception as e:
+            print(f"Error indexing pages, estimating them: {str(e)}")
+            page_index = None
+        
+        # Otherwise calculate pages based on paragraph count
         total_paragraphs = len(doc.paragraphs)
         paragraphs_per_page = 40  # Approximate number of paragraphs per page
         
@@ -36,33 +48,25 @@ class DocxLinkExtractor(LinkExtractor):
         for i, paragraph in enumerate(doc.paragraphs):
             current_page = (i // paragraphs_per_page) + 1
             
-            # First try to get hyperlinks with their text
-            for hyperlink in paragraph._element.findall(".//w:hyperlink", {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                rId = hyperlink.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')
-                if rId:
-                    # Get the relationship target (URL)
-                    relationship = doc.part.rels[rId]
-                    if relationship.reltype.endswith('/hyperlink'):
-                        url = relationship._target
-                        
-                        # Get the display text
-                        texts = []
-                        for run in hyperlink.findall(".//w:t", {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                            if run.text:
-                                texts.append(run.text)
-                        display_text = ''.join(texts)
+            # Hyperlinks with a relationship target, resolved when the document was loaded
+            for hyperlink in paragraph.hyperlinks:
+                if hyperlink.r_id and hyperlink.r_id in doc.relationships:
+                    rel_type, url, _ = doc.relationships[hyperlink.r_id]
+                    if rel_type.endswith('/hyperlink'):
+                        display_text = hyperlink.text
                         
                         if not display_text:
                             display_text = "Link"
                             
                         if self.is_external_link(url):
+                            page = page_index.page_of(hyperlink) if page_index is not None else current_page
                             if url not in links:
                                 links[url] = {
                                     "display_text": display_text,
                                     "pages": []
                                 }
-                            if current_page not in links[url]["pages"]:
-                                links[url]["pages"].append(current_page)
+                            if page not in links[url]["pages"]:
+                                links[url]["pages"].append(page)
         
         return links
 
@@ -70,81 +74,65 @@ class PdfLinkExtractor(LinkExtractor):
     """PDF file link extractor"""
     def extract_links(self, file_path: str) -> Dict[str, Dict]:
         links = {}
-        temp_files = []
+        # The intermediate DOCX is built in memory, so no temp file is written next to the PDF
+        docx_stream = io.BytesIO()
         
         try:
             # First get the original PDF for page number reference
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                pdf_text_by_page = {}
-                
-                # Store text content of each PDF page
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    pdf_text_by_page[page_num] = page.extract_text()
+            pdf_text_by_page = {}
+            
+            # Store text content of each PDF page
+            for page_num, text in enumerate(get_extractor().iter_pages(file_path), 1):
+                pdf_text_by_page[page_num] = text
 
             # Convert PDF to DOCX for better text extraction
-            docx_path = file_path.rsplit('.', 1)[0] + '_temp.docx'
-            temp_files.append(docx_path)
-            
             try:
                 # Convert PDF to DOCX
                 cv = Converter(file_path)
-                cv.convert(docx_path)
+                cv.convert(docx_stream)
                 cv.close()
                 
-                # Load the DOCX document
-                doc = Document(docx_path)
+                # Only the hyperlinks are needed; the images pdf2docx embeds are never read
+                docx_stream.seek(0)
+                doc = DocxModel.load(docx_stream, references_only=True)
                 
-                # Process each paragraph
-                for paragraph in doc.paragraphs:
-                    # Get hyperlinks from paragraph's XML element
-                    root = paragraph._element
-                    for hyperlink in root.findall('.//w:hyperlink', 
-                        {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                        # Get relationship id
-                        rel_id = hyperlink.get(
-                            '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
-                        )
+                # Hyperlinks of the body paragraphs, in document order
+                for hyperlink in doc.hyperlinks:
+                    if not hyperlink.paragraph.in_body:
+                        continue
+                    rel_id = hyperlink.r_id
+                    
+                    if rel_id and rel_id in doc.relationships:
+                        # Get URL from relationship
+                        url = doc.relationships[rel_id][1]
                         
-                        if rel_id and rel_id in paragraph.part.rels:
-                            # Get URL from relationship
-                            url = paragraph.part.rels[rel_id]._target
+                        if self.is_external_link(url):
+                            # Get text from the hyperlink
+                            link_text = hyperlink.text
                             
-                            if self.is_external_link(url):
-                                # Get text from the hyperlink
-                                link_text = ''.join(
-                                    t.text for t in hyperlink.findall(
-                                        './/w:t', 
-                                        {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-                                    )
-                                )
-                                
-                                # Use actual link text or fallback
-                                display_text = link_text if link_text else "Link"
-                                
-                                # Find the actual page number from PDF
-                                page_number = self._find_page_number(pdf_text_by_page, display_text)
-                                
-                                if url not in links:
-                                    links[url] = {
-                                        "display_text": display_text,
-                                        "pages": []
-                                    }
-                                if page_number:  # Only add page number if found
-                                    links[url]["pages"].append(page_number)
-                                else:
-                                    links[url]["pages"].append("Not Found")  # Add "Not Found" instead of a page number
-                
+                            # Use actual link text or fallback
+                            display_text = link_text if link_text else "Link"
+                            
+                            # Find the actual page number from PDF
+                            page_number = self._find_page_number(pdf_text_by_page, display_text)
+                            
+                            if url not in links:
+                                links[url] = {
+                                    "display_text": display_text,
+                                    "pages": []
+                                }
+                            if page_number:  # Only add page number if found
+                                links[url]["pages"].append(page_number)
+                            else:
+                                links[url]["pages"].append("Not Found")  # Add "Not Found" instead of a page number
+            
             except Exception as e:
                 print(f"Error in DOCX conversion: {str(e)}")
                 # Fallback to original PDF extraction if conversion fails
                 return self._extract_from_pdf(file_path)
                 
         finally:
-            # Clean up temporary files
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+            docx_stream.close()
         
         return links
 
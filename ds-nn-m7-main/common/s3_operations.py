@@ -1,6 +1,19 @@
 import os
+import hashlib
+import io
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from common.logs import logger
+from common.object_store import local_backend_enabled, get_local_object_store
+from common.download_cache import get_download_cache
+from common.mapped_file import open_mapped
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,30 +21,269 @@ load_dotenv()
 aws_access_key_id = os.getenv('aws_access_key_id')
 aws_secret_access_key = os.getenv('aws_secret_access_key')
 aws_region_name = os.getenv('aws_region')
+s3_max_pool_connections = int(os.getenv('s3_max_pool_connections', 32))
+s3_transfer_concurrency = int(os.getenv('s3_transfer_concurrency', 8))
+s3_multipart_chunksize = int(os.getenv('s3_multipart_chunksize', 8 * 1024 * 1024))
+s3_spool_max_bytes = int(os.getenv('s3_spool_max_bytes', 64 * 1024 * 1024))
+s3_upload_workers = int(os.getenv('s3_upload_workers', 4))
+s3_upload_concurrency = int(os.getenv('s3_upload_concurrency', 10))
+s3_upload_chunksize = int(os.getenv('s3_upload_chunksize', 16 * 1024 * 1024))
+# Zip packages (DOCX, XLSX, ...) of at least s3_range_min_bytes are read with
+# ranged GETs of the parts a check needs; smaller ones are downloaded whole.
+s3_range_min_bytes = int(os.getenv('s3_range_min_bytes', 1024 * 1024))
+s3_range_tail_bytes = int(os.getenv('s3_range_tail_bytes', 64 * 1024))
+s3_range_read_bytes = int(os.getenv('s3_range_read_bytes', 256 * 1024))
+s3_range_max_read_bytes = int(os.getenv('s3_range_max_read_bytes', 8 * 1024 * 1024))
+
+# Shared transfer settings for download_file / upload_file. Small DOCX files stay
+# single-part; larger PDFs are split into parallel ranged parts.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=s3_multipart_chunksize,
+    multipart_chunksize=s3_multipart_chunksize,
+    max_concurrency=s3_transfer_concurrency,
+    use_threads=True
+)
+
+# Uploads are mostly annotated / converted PDFs of 10-200 MB: larger parts keep the
+# part count low while still sending each file over several connections.
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=s3_upload_chunksize,
+    multipart_chunksize=s3_upload_chunksize,
+    max_concurrency=s3_upload_concurrency,
+    use_threads=True
+)
+
+# User metadata key holding the SHA-256 of the uploaded content.
+CONTENT_HASH_METADATA_KEY = 'sha256'
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(region_name: str = None, access_key_id: str = None, secret_access_key: str = None):
+    '''
+    Returns the process-wide S3 client for a region and set of credentials.
+    The client is created lazily on first use and then shared, so credentials,
+    the botocore service model and the connection pool are only set up once.
+    boto3 clients are thread-safe once created.
+    With object_store_backend=local a directory-backed LocalObjectStore is
+    returned instead, so everything runs without AWS.
+    '''
+    if local_backend_enabled():
+        return get_local_object_store()
+
+    region_name = region_name or aws_region_name
+    access_key_id = access_key_id or aws_access_key_id
+    secret_access_key = secret_access_key or aws_secret_access_key
+    key = (region_name, access_key_id, secret_access_key)
+
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                # Sessions are not thread-safe, so each client gets its own.
+                session = boto3.session.Session(
+                    region_name=region_name,
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key
+                )
+                client = session.client(
+                    's3',
+                    config=Config(
+                        max_pool_connections=s3_max_pool_connections,
+                        retries={'max_attempts': 5, 'mode': 'standard'}
+                    )
+                )
+                _clients[key] = client
+                logger.info(f"Created shared S3 client for region '{region_name}' (pool size {s3_max_pool_connections})")
+    return client
+
+
+def file_sha256(file_name: str, chunk_size: int = 1024 * 1024) -> str:
+    '''
+    Returns the hex SHA-256 of a local file, read in chunks.
+    '''
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class S3RangeFile(io.RawIOBase):
+    '''
+    Read-only, seekable file over one version of an S3 object that fetches only
+    the byte ranges that are read. zipfile needs the end of the file (the
+    central directory) and then each member it opens, so a DOCX opened through
+    it costs a GET for the tail plus a few GETs per part read, and images that
+    nobody reads are never transferred.
+
+    The first read within the last tail_bytes fetches all of them, which
+    covers the central directory of most documents. Other reads fetch at least
+    read_bytes, doubling up to max_read_bytes while reads stay sequential, so
+    a large part streams in a few requests. Every GET carries IfMatch on the
+    ETag, so a concurrent overwrite fails rather than mixing two versions. If a
+    ranged GET fails for any other reason, the whole object is downloaded once
+    and the remaining reads are served from that copy.
+
+    content_digest identifies the object version (bucket, key and ETag) for
+    the artifact cache, so it does not have to read the whole object to hash it.
+    '''
+    def __init__(self, s3_client, bucket: str, key: str, head: dict, tail_bytes: int = None,
+                 read_bytes: int = None, max_read_bytes: int = None) -> None:
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = head['ContentLength']
+        self.etag = head['ETag']
+        etag = self.etag.strip('"')
+        self.content_digest = hashlib.sha256(f'{bucket}\0{key}\0{etag}'.encode('utf-8')).hexdigest()
+        self.read_bytes = read_bytes or s3_range_read_bytes
+        self.max_read_bytes = max_read_bytes or s3_range_max_read_bytes
+        self.stats = {'requests': 0, 'bytes_fetched': 0, 'fallback': False}
+        self._position = 0
+        self._window = self.read_bytes
+        self._last_end = None
+        self._buffer = (0, b'')
+        self._fallback = None
+        self._tail_start = max(self.size - (tail_bytes or s3_range_tail_bytes), 0)
+        self._tail = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), self.size - self._position)
+        if count <= 0:
+            return 0
+        start, end = self._position, self._position + count
+        if self._tail is None and start >= self._tail_start:
+            self._tail = (self._tail_start, self._fetch(self._tail_start, self.size))
+        data = self._cached(start, end)
+        if data is None:
+            # Grow the read-ahead while reads continue where the last one ended.
+            self._window = min(self._window * 2, self.max_read_bytes) if start == self._last_end else self.read_bytes
+            fetch_end = min(max(end, start + self._window), self.size)
+            self._buffer = (start, self._fetch(start, fetch_end))
+            self._last_end = fetch_end
+            data = self._buffer[1][:count]
+        buffer[:count] = data
+        self._position = end
+        return count
+
+    def close(self) -> None:
+        if self._fallback is not None:
+            self._fallback.close()
+        super().close()
+
+    def _cached(self, start: int, end: int):
+        for buffer_start, data in (self._buffer, self._tail or self._buffer):
+            if buffer_start <= start and end <= buffer_start + len(data):
+                return data[start - buffer_start:end - buffer_start]
+        return None
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        if self._fallback is None:
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, IfMatch=self.etag,
+                                                     Range=f'bytes={start}-{end - 1}')
+                with response['Body'] as body:
+                    data = body.read()
+                if len(data) != end - start:
+                    raise IOError(f"Expected {end - start} bytes, got {len(data)}")
+                self.stats['requests'] += 1
+                self.stats['bytes_fetched'] += len(data)
+                return data
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+                    raise
+                logger.warning(f"Ranged read of s3://{self.bucket}/{self.key} failed, downloading it whole: {e}")
+            except Exception as e:
+                logger.warning(f"Ranged read of s3://{self.bucket}/{self.key} failed, downloading it whole: {e}")
+            # download_fileobj does not take IfMatch, so stream a plain GET.
+            self._fallback = tempfile.SpooledTemporaryFile(max_size=s3_spool_max_bytes)
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, IfMatch=self.etag)
+            with response['Body'] as body:
+                shutil.copyfileobj(body, self._fallback, s3_multipart_chunksize)
+            self.stats['fallback'] = True
+            self.stats['requests'] += 1
+            self.stats['bytes_fetched'] += self.size
+        self._fallback.seek(start)
+        return self._fallback.read(end - start)
+
 
 class S3Helper:
     def __init__(self,s3_bucket_name) -> None:
         '''
-        Initializes the S3Helper object.
+        Initializes the S3Helper object. This is a cheap handle on the shared
+        client returned by get_s3_client(), so it is fine to create one per request.
         '''
         self.bucket_name = s3_bucket_name
-        self.s3_client = boto3.client(
-            's3',
-            region_name=aws_region_name,  # Specified the region for the S3 client
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
+        self.s3_client = get_s3_client()
         self.logger = logger
 
-    def upload_file_to_s3(self, file_name: str, object_name: str) -> None:
+    def upload_file_to_s3(self, file_name: str, object_name: str, skip_unchanged: bool = True) -> dict:
         '''
-        Uploads a file to S3 bucket.
+        Uploads a file to S3 bucket. The SHA-256 of the content is stored in the object
+        metadata; with skip_unchanged the upload is skipped when the object under
+        object_name already has the same hash.
+        Returns a report: {'file_name', 'object_name', 'bytes_sent', 'seconds', 'skipped', 'error'}.
         '''
+        report = {'file_name': file_name, 'object_name': object_name, 'bytes_sent': 0, 'seconds': 0.0, 'skipped': False, 'error': None}
+        started = time.perf_counter()
         try:
-            self.s3_client.upload_file(file_name, self.bucket_name, object_name)
-            self.logger.info(f"File '{file_name}' uploaded to S3 bucket '{self.bucket_name}' as '{object_name}'.")
+            content_hash = file_sha256(file_name)
+            if skip_unchanged and self.get_stored_sha256(object_name) == content_hash:
+                report['skipped'] = True
+                self.logger.info(f"File '{file_name}' unchanged in S3 bucket '{self.bucket_name}' as '{object_name}', upload skipped.")
+            else:
+                self.s3_client.upload_file(
+                    file_name, self.bucket_name, object_name,
+                    ExtraArgs={'Metadata': {CONTENT_HASH_METADATA_KEY: content_hash}},
+                    Config=UPLOAD_TRANSFER_CONFIG
+                )
+                report['bytes_sent'] = os.path.getsize(file_name)
+                self.logger.info(f"File '{file_name}' uploaded to S3 bucket '{self.bucket_name}' as '{object_name}'.")
         except Exception as e:
+            report['error'] = str(e)
             self.logger.exception(f"Exception in upload_file_to_s3(): File - '{file_name}', S3 bucket - '{self.bucket_name}', object_name - '{object_name}'")
+        report['seconds'] = time.perf_counter() - started
+        return report
+
+    def get_stored_sha256(self, object_name: str):
+        '''
+        Returns the content hash recorded in the object's metadata, or None if the
+        object does not exist or was uploaded without one.
+        '''
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise e
+        return head.get('Metadata', {}).get(CONTENT_HASH_METADATA_KEY)
 
     def download_file_from_s3(self, object_name: str, file_name: str) -> None:
         '''
@@ -39,7 +291,11 @@ class S3Helper:
         '''
         try:
             self.logger.info(f"Downloading file from S3: Bucket - '{self.bucket_name}', Object - '{object_name}', Local - '{file_name}'")
-            self.s3_client.download_file(self.bucket_name, object_name, file_name)
+            cache = get_download_cache()
+            if cache is not None:
+                cache.materialize(self.s3_client, self.bucket_name, object_name, file_name, TRANSFER_CONFIG)
+            else:
+                self.s3_client.download_file(self.bucket_name, object_name, file_name, Config=TRANSFER_CONFIG)
             self.logger.info(f"File '{object_name}' downloaded from S3 bucket '{self.bucket_name}' to '{file_name}'.")
         except boto3.exceptions.S3UploadFailedError as e:
             self.logger.exception(f"S3UploadFailedError in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
@@ -48,19 +304,131 @@ class S3Helper:
             self.logger.exception(f"Exception in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
             raise e
 
-    def upload_directory(self, dir_name: str, prefix: str = "") -> None:
+    def download_file_cached(self, object_name: str) -> str:
         '''
-        Uploads a directory to S3 bucket.
+        Returns a read-only local path for an object from the shared download cache.
+        A cache hit costs one HEAD request. Falls back to a download into a fresh
+        temporary directory when the cache is disabled.
         '''
         try:
+            cache = get_download_cache()
+            if cache is not None:
+                return cache.fetch(self.s3_client, self.bucket_name, object_name, TRANSFER_CONFIG)
+            file_name = os.path.join(tempfile.mkdtemp(), os.path.basename(object_name))
+            self.s3_client.download_file(self.bucket_name, object_name, file_name, Config=TRANSFER_CONFIG)
+            return file_name
+        except Exception as e:
+            self.logger.exception(f"Exception in download_file_cached(): File - '{object_name}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def get_object_stream(self, object_name: str, spool_max_bytes: int = None):
+        '''
+        Reads an object without writing a temp file. Returns a seekable binary file
+        positioned at the start: the shared download cache entry if the current version
+        is already cached (memory-mapped, see common/mapped_file.py), otherwise a
+        SpooledTemporaryFile that stays in memory and only spills to disk above
+        spool_max_bytes (default s3_spool_max_bytes).
+        python-docx, PyPDF2, pdfplumber, pandas and zipfile accept it directly;
+        for PyMuPDF use common.mapped_file.open_pdf(stream), which does not copy a
+        cached entry into memory.
+        The caller should close the returned file.
+        '''
+        try:
+            cache = get_download_cache()
+            if cache is not None:
+                cached_path, _ = cache.lookup(self.s3_client, self.bucket_name, object_name)
+                if cached_path is not None:
+                    return open_mapped(cached_path)
+            stream = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes or s3_spool_max_bytes)
+            self.s3_client.download_fileobj(self.bucket_name, object_name, stream, Config=TRANSFER_CONFIG)
+            stream.seek(0)
+            self.logger.info(f"File '{object_name}' read from S3 bucket '{self.bucket_name}' into memory.")
+            return stream
+        except Exception as e:
+            self.logger.exception(f"Exception in get_object_stream(): File - '{object_name}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def open_package(self, object_name: str):
+        '''
+        Opens a zip package (DOCX, XLSX, VSDX) for reading a few of its parts,
+        such as word/document.xml, without downloading the rest. Returns a
+        seekable binary file for zipfile, DocxModel or OoxmlPackage: the shared
+        download cache entry, memory-mapped, if the current version is cached,
+        an S3RangeFile that range-reads what is used, or, for objects under
+        s3_range_min_bytes, the object read whole into memory as by
+        get_object_stream().
+        The caller should close the returned file.
+        '''
+        try:
+            cache = get_download_cache()
+            if cache is not None:
+                cached_path, head = cache.lookup(self.s3_client, self.bucket_name, object_name)
+                if cached_path is not None:
+                    return open_mapped(cached_path)
+            else:
+                head = self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+            if head['ContentLength'] < s3_range_min_bytes:
+                stream = tempfile.SpooledTemporaryFile(max_size=s3_spool_max_bytes)
+                self.s3_client.download_fileobj(self.bucket_name, object_name, stream, Config=TRANSFER_CONFIG)
+                stream.seek(0)
+                return stream
+            stream = S3RangeFile(self.s3_client, self.bucket_name, object_name, head)
+            self.logger.info(f"File '{object_name}' opened for ranged reads from S3 bucket '{self.bucket_name}' ({head['ContentLength']} bytes).")
+            return stream
+        except Exception as e:
+            self.logger.exception(f"Exception in open_package(): File - '{object_name}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def iter_files(self, s3_prefix: str, recursive: bool = True):
+        '''
+        Yields the listing entries ('Key', 'Size', 'ETag', ...) of the objects under a
+        prefix page by page, so callers can start on the first objects while the rest
+        is still being listed. With recursive=False only the top level is listed.
+        '''
+        try:
+            if s3_prefix and not s3_prefix.endswith('/'):
+                s3_prefix += '/'
+            params = {'Bucket': self.bucket_name, 'Prefix': s3_prefix}
+            if not recursive:
+                params['Delimiter'] = '/'
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(**params):
+                for item in page.get('Contents', []):
+                    if not item['Key'].endswith('/'):  # Skip S3 "directory" objects
+                        yield item
+        except Exception as e:
+            self.logger.exception(f"Exception in iter_files(): prefix - '{s3_prefix}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def upload_directory(self, dir_name: str, prefix: str = "", max_workers: int = None, skip_unchanged: bool = True) -> list:
+        '''
+        Uploads a directory to S3 bucket, max_workers files at a time (default
+        s3_upload_workers). Each file is itself sent in parallel parts.
+        Returns the per-object reports from upload_file_to_s3().
+        '''
+        reports = []
+        try:
+            uploads = []
             for root, dirs, files in os.walk(dir_name):
                 for file in files:
                     local_file_path = os.path.join(root, file)
                     relative_path = os.path.relpath(local_file_path, dir_name)
                     s3_object_name = os.path.join(prefix, relative_path)
-                    self.upload_file_to_s3(local_file_path, s3_object_name)
+                    uploads.append((local_file_path, s3_object_name))
+
+            with ThreadPoolExecutor(max_workers=max_workers or s3_upload_workers) as executor:
+                futures = [executor.submit(self.upload_file_to_s3, local_file_path, s3_object_name, skip_unchanged)
+                           for local_file_path, s3_object_name in uploads]
+                for future in as_completed(futures):
+                    reports.append(future.result())
+
+            sent = sum(report['bytes_sent'] for report in reports)
+            skipped = sum(1 for report in reports if report['skipped'])
+            failed = sum(1 for report in reports if report['error'])
+            self.logger.info(f"upload_directory(): {len(reports)} files from '{dir_name}', {skipped} skipped, {failed} failed, {sent} bytes sent")
         except Exception as e:
             self.logger.exception(f"Exception in upload_directory():  inp_dir_name - {dir_name}")
+        return reports
 
     def download_directory(self, s3_prefix: str, local_dir: str) -> None:
         '''
@@ -80,6 +448,6 @@ class S3Helper:
                     os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
                     # Download the object
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
+                    self.s3_client.download_file(self.bucket_name, key, local_path, Config=TRANSFER_CONFIG)
         except Exception as e:
             self.logger.exception(f"Exception in download_directory(): {e}")
\ No newline at end of file
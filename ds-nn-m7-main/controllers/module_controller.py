@@ -2,10 +2,11 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from scripts.validate_references import verify_references
-from scripts.terminate_active_COM import terminate_active_processes
+from common.office_backend import check_office_backend
 from common.logs import logger
 import os
 from common.s3_operations import S3Helper
+from common.workspace import ScratchWorkspace
 
 TMP_DIR = '/tmp'
 if not os.path.exists(TMP_DIR):
@@ -13,6 +14,9 @@ if not os.path.exists(TMP_DIR):
 
 app = FastAPI()
 
+# Heading numbers are read from the office backend's layout, so the start fails without it.
+check_office_backend(layout=True)
+
 class DocBookmarkCheck(BaseModel):
     file_path: str
 
@@ -22,10 +26,10 @@ async def check_doc_bookmarks(request: DocBookmarkCheck):
         logger.info(str(f'Starting to check the format for document. ')+'[check_doc_bookmarks] [controllers/module_controller.py:16]')
 
         document = request.file_path
-        terminate_active_processes()
 
         if document.endswith('.docx'):
-            internal, toc = verify_references(document)
+            async with ScratchWorkspace('m7-references') as workspace:
+                internal, toc = verify_references(document, workspace)
 
         else:
             raise Exception("File type not supported.")
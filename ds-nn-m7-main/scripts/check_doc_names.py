@@ -6,11 +6,11 @@ import zipfile
 import os
 from common.s3_operations import S3Helper
 from common.logs import logger
-import win32com.client
+from common.docx_model import DocxModel
+from common.office_backend import get_office_backend
+from common.page_index import PageIndex
 from pathlib import Path
-import pythoncom
 import re
-from scripts.terminate_active_COM import terminate_active_processes
 
 def find_git_root(start_path: Path) -> Path:
     """Finds the root of the Git repository by looking for the .git folder."""
@@ -112,12 +112,13 @@ TMP_DIR.mkdir(parents=True, exist_ok=True)
 #         logger.error(str(f'Encountered error while extracting references - {e}')+' [extract_bookmark_reference] [scripts/check_doc_names.py:86]')
 #         raise Exception(str(f'{e}'))
 
-def extract_bookmark_references(docx_path):
+def extract_bookmark_references(docx_path, model: DocxModel = None):
     """
     Extract bookmark references, associated names, and hyperlink texts from a Word document (.docx).
     
     Args:
         docx_path (str): Path to the .docx file.
+        model (DocxModel): The document already loaded with DocxModel.load_cached(), if available.
     
     Returns:
         tuple: A tuple containing a list of tuples:
@@ -126,78 +127,36 @@ def extract_bookmark_references(docx_path):
             - Hyperlink text (str) if present, otherwise None
     """
     try:
-        if docx_path.startswith('s3'):
-            s3_bucket = docx_path.split('/')[2]
-            s3_helper = S3Helper(s3_bucket)
-            s3_key = '/'.join(docx_path.split('/')[3:])
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-            s3_helper.download_file_from_s3(s3_key, local_file_path)
-            docx_path = local_file_path
-
         logger.info('Starting extracting references and hyperlink text')
-        # doc = Document(docx_path)
-
-        # Extract XML content from the document
-        with zipfile.ZipFile(docx_path, 'r') as z:
-            with z.open('word/document.xml') as f:
-                document_xml_content = f.read().decode('utf-8', errors='replace')
-
-        # Remove XML declaration if it exists
-        document_xml_content = re.sub(r'^<\?xml[^>]+\?>', '', document_xml_content).strip()
-
-        # Wrap the cleaned XML content inside a <root> element
-        wrapped_xml = f"<root>{document_xml_content}</root>"
-
-        # Parse safely
-        root = etree.fromstring(wrapped_xml)
+        if model is None:
+            if docx_path.startswith('s3'):
+                # Only the main document part is fetched, with ranged reads; images are never downloaded
+                s3_bucket = docx_path.split('/')[2]
+                s3_helper = S3Helper(s3_bucket)
+                s3_key = '/'.join(docx_path.split('/')[3:])
+                with s3_helper.open_package(s3_key) as source:
+                    model = DocxModel.load_cached(source, references_only=True)
+            else:
+                model = DocxModel.load_cached(docx_path, references_only=True)
 
-        # Extract bookmark references
+        # Extract bookmark references (REF fields) with the name Word displays for each
         references = []
-        for instr in root.findall(".//w:instrText", namespaces={"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}):
-            if instr.text and "REF" in instr.text:
-                parts = instr.text.split()
+        names = []
+        for field in model.fields:
+            if "REF" in field.instruction and field.result:
+                parts = field.instruction.split()
                 if len(parts) > 1:
                     references.append(parts[1])  # Extract the bookmark name
+                    names.append(field.result if len(field.result) < 200 else "Invalid link format")
 
-        # Extract names and hyperlink text associated with bookmarks
-        names = []
+        # Extract hyperlinks to bookmarks and their text
         hyperlinks = []
-        capture = False
-        current_name = []
-
-        for elem in root.iter():
-            tag = elem.tag
-            attrib = elem.attrib
-            text = elem.text
-
-            # Check for the start of a bookmark name
-            if tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldChar" and attrib.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldCharType") == "separate":
-                capture = True
-            # Check for the end of a bookmark name
-            elif tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldChar" and attrib.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldCharType") == "end":
-                capture = False
-                if current_name:
-                    curr_name = "".join(current_name)
-                    if len(curr_name) < 200:
-                        names.append(curr_name)
-                    else:
-                        names.append("Invalid link format")
-                    current_name = []
-            # Collect text when within a bookmark name
-            elif capture and tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t" and text:
-                current_name.append(text)
-
-            # Check for hyperlinks
-            elif tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}hyperlink":
-                anchor = attrib.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}anchor")
-                if anchor:
-                    hyperlink_text = "".join(
-                        t.text for t in elem.findall(".//w:t", namespaces={"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"})
-                    )
-                    # print((anchor, hyperlink_text))
-                    if len(hyperlink_text) >= 200:
-                        hyperlink_text = "Invalid link format"
-                    hyperlinks.append((anchor, hyperlink_text))
+        for hyperlink in model.hyperlinks:
+            if hyperlink.anchor:
+                hyperlink_text = hyperlink.text
+                if len(hyperlink_text) >= 200:
+                    hyperlink_text = "Invalid link format"
+                hyperlinks.append((hyperlink.anchor, hyperlink_text))
 
         logger.info('Extraction complete, compiling into a list')
         # print(f'Refernces: {references}, names: {names}')
@@ -223,49 +182,38 @@ def extract_bookmark_references(docx_path):
         raise Exception(str(e))
     
 def extract_links_and_references_pages(doc_path):
-    # Initialize Word application
+    # Hyperlinks and cross-references are read from the document model and
+    # their pages from a page index of the office backend's PDF (cached by
+    # content), so the document is not repaginated or walked page by page.
+    # The backend is still needed for the list numbers of the headings.
     try:
-        terminate_active_processes()
-        pythoncom.CoInitialize()
-        word = win32com.client.Dispatch("Word.Application")
-        word.Visible = False  # Keep Word application hidden
-        print("Word Opened")
-        doc = word.Documents.Open(doc_path)
-        word.ActiveDocument.Repaginate()
+        model = DocxModel.load_cached(doc_path)
+        backend = get_office_backend()
+        page_index = PageIndex.load_cached(doc_path, model, convert=backend.convert, renderer=backend.converter())
         results = []
         print("Iterating over links")
         # Iterate over hyperlinks
-        if doc.hyperlinks.Count > 0:
-            for hyperlink in doc.Hyperlinks:
-                link_text = hyperlink.TextToDisplay
-                address = hyperlink.Address if hyperlink.Address else f"Internal: {hyperlink.SubAddress}"
-                try:
-                    anchor_range = hyperlink.Range
-                    page_number = anchor_range.Information(3)
-                except Exception as e:
-                    continue
-                print(page_number)  # wdActiveEndPageNumber
-                results.append({
-                    "type": "Hyperlink",
-                    "page_number": page_number,
-                    "link_text": link_text,
-                    "target": address
-                })
+        for hyperlink in model.hyperlinks:
+            address = hyperlink.target if hyperlink.target else f"Internal: {hyperlink.anchor or ''}"
+            page_number = page_index.page_of(hyperlink)
+            results.append({
+                "type": "Hyperlink",
+                "page_number": page_number,
+                "link_text": hyperlink.text,
+                "target": address
+            })
         
         print("Iterating over cross-refs")
         # Iterate over fields for cross-references
-        for field in doc.Fields:
-            if field.Type == 3:  # wdFieldRef (Cross-reference)
-                ref_text = field.Result.Text
-                target_range = field.Result
-                target_text = field.Code.text if target_range else "No target text"
-                anchor_range = field.Code
-                page_number = anchor_range.Information(3)  # wdActiveEndPageNumber
+        for field in model.fields:
+            instruction = field.instruction.split()
+            if instruction and instruction[0].upper() == 'REF':  # wdFieldRef (Cross-reference)
+                page_number = page_index.page_of(field)
                 results.append({
                     "type": "Cross-reference",
                     "page_number": page_number,
-                    "ref_text": ref_text,
-                    "target_text": target_text
+                    "ref_text": field.result,
+                    "target_text": field.instruction
                 })
         
         cleaning_up = {}
@@ -303,27 +251,29 @@ def extract_links_and_references_pages(doc_path):
             print(temp_dict)
             print('***********************************************************************************')
         print(final_links)
-        total_pages = doc.ComputeStatistics(2)
+        # Paragraph texts as the backend returns them, to find each heading in the model
+        paragraph_names = [re.sub(r'[\x00-\x1F\x7F\uF000-\uFFFF]', '', para.text.strip()) for para in model.all_paragraphs]
+        position = 0
         headings = []
-        for page_num in range(1, total_pages + 1):
-                    page_start = doc.GoTo(What=1, Which=1, Count=page_num).Start  # 1 is wdGoToPage
-                    page_end = doc.GoTo(What=1, Which=1, Count=page_num + 1).Start if page_num < total_pages else doc.Content.End
-                    
-                    # Create range object for current page
-                    page_range = doc.Range(page_start, page_end)
-            # Process each paragraph in the page
-                    for para in page_range.Paragraphs:
-                        if para.Range.Style and (('Heading' in para.Range.Style.NameLocal or 'Header' in para.Range.Style.NameLocal) and 'Table' not in para.Range.Style.NameLocal):
-                            print(para.Range.Text)
-                            # if para.Range.Text.strip():
-                            name = para.Range.Text.strip()
-                            name = re.sub(r'[\x00-\x1F\x7F\uF000-\uFFFF]', '', name)
-                            number = None
-                            if para.Range.ListFormat.ListType > 0:
-                                number = para.Range.ListFormat.ListString.strip()
-                                number =  re.sub(r'[\x00-\x1F\x7F\uF000-\uFFFF]', '', number)
-                            headings.append((name, number, page_num))
-                            print((name, number, page_num))
+        # Process each paragraph once, in document order
+        for para in backend.paragraphs(doc_path):
+            if para.style and (('Heading' in para.style or 'Header' in para.style) and 'Table' not in para.style):
+                print(para.text)
+                name = para.text.strip()
+                name = re.sub(r'[\x00-\x1F\x7F\uF000-\uFFFF]', '', name)
+                number = None
+                if para.list_type > 0:
+                    number = para.list_string.strip()
+                    number =  re.sub(r'[\x00-\x1F\x7F\uF000-\uFFFF]', '', number)
+                # The page of the next paragraph of the model with the same text
+                page_num = None
+                for index in range(position, len(paragraph_names)):
+                    if paragraph_names[index] == name:
+                        page_num = page_index.paragraph_page(index)
+                        position = index + 1
+                        break
+                headings.append((name, number, page_num))
+                print((name, number, page_num))
         heading_numbers_new = []
         sset = set()
         for ele in headings:
@@ -337,21 +287,3 @@ def extract_links_and_references_pages(doc_path):
     except Exception as e:
         logger.error(str(f'Encountered the following error while extracting links - {e}')+' [extract_links_and_references_pages] [scripts\check_doc_names.py:261]')
         raise Exception(str(f'Encountered the following error while extracting links - {e}'))
-    finally:
-        try:
-            if doc:
-                doc.Close(SaveChanges=0)
-                del doc
-        except Exception as close_err:
-                logger.warning(f"Error closing document: {close_err}")
-
-        try:
-            if word:
-                word.Quit()
-                del word
-        except Exception as quit_err:
-            logger.warning(f"Error quitting Word: {quit_err}")
-
-        pythoncom.CoUninitialize()
-    
-    
\ No newline at end of file
@@ -1,19 +1,15 @@
-import zipfile
-from lxml import etree
 import fitz
-import re, subprocess, os
+import re, os
 from common.s3_operations import S3Helper
 from common.logs import logger
+from common.docx_model import DocxModel
+from common.office_backend import convert_to_pdf
 from scripts.check_doc_names import extract_bookmark_references, extract_links_and_references_pages
 from pathlib import Path
-from docx2pdf import convert
-import pythoncom
-from scripts.terminate_active_COM import terminate_active_processes
 import os
-import time
 from common.s3_operations import S3Helper
-import win32com
 from scripts.toc import toc_errors
+from common.workspace import ScratchWorkspace
 
 def find_git_root(start_path: Path) -> Path:
     """Finds the root of the Git repository by looking for the .git folder."""
@@ -33,11 +29,12 @@ TMP_DIR = repo_root / "s3_downloads"
 # Create the directory if it doesn’t exist
 TMP_DIR.mkdir(parents=True, exist_ok=True)
 
-def extract_bookmarks_and_citations_from_docx(file_path):
+def extract_bookmarks_and_citations_from_docx(file_path, model: DocxModel = None):
     """
     Extract bookmarks and their associated text, along with citations (hyperlinks) and their destination text from a DOCX file.
 
     :param docx_path: Path to the DOCX file
+    :param model: The document already loaded with DocxModel.load_cached(), if available
     :return: Dictionary with bookmarks and citations
     """
     try:
@@ -46,105 +43,38 @@ def extract_bookmarks_and_citations_from_docx(file_path):
             "citations": []
         }
 
-        if file_path.startswith('s3://'):
+        logger.info(str(f'Starting to extract bookmarks from the document ')+'[extract_bookmarks_and_citations_from_docx] [scripts/validate_references.py:34]')
+        if model is None:
+            if file_path.startswith('s3://'):
+                # Only the main document part is fetched, with ranged reads; images are never downloaded
                 s3_bucket = file_path.split('/')[2]
                 s3_helper = S3Helper(s3_bucket)
                 s3_key = '/'.join(file_path.split('/')[3:])
-                ts = str(time.time()).replace('.', '_')
-                local_key = list(s3_key.split('.'))
-                local_key[0] += f'_{ts}'
-                local_key = '.'.join(local_key)
-                local_file_path = os.path.join(TMP_DIR, os.path.basename(local_key))
-                s3_helper.download_file_from_s3(s3_key, local_file_path)
-                file_path = local_file_path
-
-        logger.info(str(f'Starting to extract bookmarks from the document ')+'[extract_bookmarks_and_citations_from_docx] [scripts/validate_references.py:34]')
-        # Open the DOCX file as a zip archive
-        print(f"Using file: {file_path}")
-        (f"Last modified: {os.path.getmtime(file_path)}")
-        with zipfile.ZipFile(file_path, 'r') as z:
-            # Extract the main document XML
-            z.testzip()
-            with z.open('word/document.xml') as f:
-                document_xml_content = f.read()
-            # Extract the relationships file for hyperlinks
-            with z.open('word/_rels/document.xml.rels') as f:
-                relationships_xml_content = f.read()
-        
-        logger.info(str('Parsing xml structure ')+'[extract_bookmarks_and_citations_from_docx] [scripts/validate_references.py:44]')
-        # Parse the XML content using lxml
-        print(document_xml_content)
-        print(relationships_xml_content)
-        parser = etree.XMLParser(recover=True, remove_blank_text=True)
-        doc_root = etree.fromstring(document_xml_content, parser)
-        rel_root = etree.fromstring(relationships_xml_content, parser)
-        
-        namespace = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-                    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'}
-        
-        # Build a dictionary of relationship IDs to URLs
-        rels = {
-            rel.get('Id'): rel.get('Target') for rel in rel_root.findall('.//Relationship')
-        }
+                with s3_helper.open_package(s3_key) as source:
+                    model = DocxModel.load_cached(source, references_only=True)
+            else:
+                model = DocxModel.load_cached(file_path, references_only=True)
 
-        logger.info(str(f'Relations between IDs and URLs established ')+'[extract_bookmarks_and_citations_from_docx] [scripts/validate_references.py:57]')
-        # Extract bookmarks
-        for bookmark_start in doc_root.findall('.//w:bookmarkStart', namespace):
-            bookmark_name = bookmark_start.get(f'{{{namespace["w"]}}}name')
-            
-            # Now gather the text between the bookmarkStart and bookmarkEnd
-            parent = bookmark_start.getparent()
-            bookmark_text = ""
-            
-            # Collect text nodes after bookmarkStart and before bookmarkEnd
-            current_element = bookmark_start.getnext()
-            while current_element is not None:
-                if current_element.tag.endswith("bookmarkEnd") and current_element.get(f'{{{namespace["w"]}}}id') == bookmark_start.get(f'{{{namespace["w"]}}}id'):
-                    break
-                # Check if the element is a 't' (text) element or part of a 'r' (run) element
-                if current_element.tag.endswith("t"):  # If the tag is text
-                    bookmark_text += current_element.text or ""
-                elif current_element.tag.endswith("r"):  # If it is a 'run' (r) element, check for nested text
-                    for sub_elem in current_element.iter():
-                        if sub_elem.tag.endswith("t"):
-                            bookmark_text += sub_elem.text or ""
-                current_element = current_element.getnext()
-            # print(bookmark_text)
-            bookmark_name = bookmark_start.get(f'{{{namespace["w"]}}}name')
-            # Locate the text node immediately following the bookmark
-            parent = bookmark_start.getparent()
-            destination_text = ""
-            if parent is not None:
-                for sibling in parent.iter():
-                    if sibling.tag.endswith("t"):  # If the tag is text
-                        destination_text += sibling.text or ""
-            
+        # Extract bookmarks with the text they span and the text of the paragraph they are in
+        for bookmark in model.bookmarks:
+            destination_text = bookmark.paragraph.text if bookmark.paragraph is not None else ""
             result["bookmarks"].append({
-                'bookmark_name': bookmark_name,
+                'bookmark_name': bookmark.name,
                 'destination_text': destination_text.strip() if len(destination_text.strip()) < 200 else "Invalid link format",
-                'bookmark_text': bookmark_text
+                'bookmark_text': bookmark.text
             })
         
         logger.info(str('Bookmarks extracted. ')+'[extract_bookmarks_and_citations_from_docx] [scripts/validate_references.py:95]')
         # Extract citations (hyperlinks)
-        for hyperlink in doc_root.findall('.//w:hyperlink', namespace):
-            # Get the relationship ID for the hyperlink
-            rel_id = hyperlink.get(f'{{{namespace["r"]}}}id')
-            link = rels.get(rel_id, None)  # Resolve the URL from relationships
-            
-            # Extract the text associated with the hyperlink
-            citation_text = ""
-            for child in hyperlink.iter():
-                if child.tag.endswith("t"):  # If the tag is text
-                    citation_text += child.text or ""
+        for hyperlink in model.hyperlinks:
+            # Resolve the URL from relationships
+            relationship = model.relationships.get(hyperlink.r_id)
+            link = relationship[1] if relationship else None
+            citation_text = hyperlink.text
             
-            # Extract the destination text following the hyperlink
-            destination_text = ""
-            parent = hyperlink.getparent()
-            if parent is not None:
-                for sibling in parent.iter():
-                    if sibling.tag.endswith("t") and sibling not in hyperlink.iter():
-                        destination_text += sibling.text or ""
+            # The destination text is the rest of the paragraph around the hyperlink
+            paragraph_text = hyperlink.paragraph.text
+            destination_text = paragraph_text[:hyperlink.start] + paragraph_text[hyperlink.end:]
             
             if citation_text and link:
                 result["citations"].append({
@@ -152,7 +82,6 @@ def extract_bookmarks_and_citations_from_docx(file_path):
                     'link': link,
                     'destination_text': destination_text.strip() if len(destination_text.strip()) < 200 else "Invalid link format"
                 })
-            # print(result)
         return result
     
     except Exception as e:
@@ -160,69 +89,12 @@ def extract_bookmarks_and_citations_from_docx(file_path):
         raise Exception(str(f'{e}'))
 
 def convert_docx_to_pdf(file_path) -> str:
-        """Convert document to PDF using Microsoft Office COM automation"""
-        output_dir = os.path.dirname(file_path)
-        pdf_file = os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.pdf')
-
+        """Convert document to PDF next to it (cached by content) with the office backend, warm LibreOffice workers by default"""
         try:
-            # Try using win32com for Word to PDF conversion
-            try:
-                terminate_active_processes()
-                pythoncom.CoInitialize() 
-                word = win32com.client.Dispatch("Word.Application")
-                word.Visible = False
-                doc = word.Documents.Open(file_path)
-                doc.SaveAs(pdf_file, FileFormat=17)  # 17 represents PDF format
-                return pdf_file
-            except Exception as e:
-                logger.error(f"COM automation failed: {str(e)}")
-
-                # Fallback to alternative conversion methods
-                try:
-                    # Try using docx2pdf if available
-                    convert(file_path, pdf_file)
-                    return pdf_file
-                except ImportError:
-                    # Last resort: Try using system installed Office
-                    soffice_paths = [
-                        r"C:\Program Files\Microsoft Office\root\Office16\WINWORD.EXE",
-                        r"C:\Program Files (x86)\Microsoft Office\root\Office16\WINWORD.EXE",
-                    ]
-
-                    for soffice_path in soffice_paths:
-                        if os.path.exists(soffice_path):
-                            command = [
-                                soffice_path,
-                                "/q",
-                                "/n",
-                                "/f",
-                                "/c",
-                                f"SaveAs.PDF({pdf_file})",
-                                file_path
-                            ]
-                            subprocess.run(command, check=True)
-                            return pdf_file
-
-                    raise Exception("No viable PDF conversion method found")
-
+            return convert_to_pdf(file_path)
         except Exception as e:
             logger.error(f"PDF conversion failed: {str(e)}")
             raise
-        
-        finally:
-            try:
-                if doc:
-                    doc.Close()
-                    del doc
-            except Exception as e:
-                logger.error(str('Error deleting doc ')+'[convert to pdf] [scripts\margin_check.py:137]')
-            try:
-                if word:
-                    word.Quit()
-                    del word
-            except Exception as e:
-                logger.error(str('Error deleting word app ')+'[convert to pdf] [scripts\margin_check.py:143]')
-            pythoncom.CoUninitialize()
 
 # def convert_docx_to_pdf(docx_file):
 #     # Deriving the PDF output file path in the same directory as the input file
@@ -288,19 +160,24 @@ def extract_headings_from_pdf(pdf_file, headings):
         raise Exception(str(f'{e}'))
     
 
-def verify_references(docx_path):
+def verify_references(docx_path, workspace: ScratchWorkspace = None):
     try:
         if docx_path.startswith('s3'):
                 s3_bucket = docx_path.split('/')[2]
                 s3_helper = S3Helper(s3_bucket)
                 s3_key = '/'.join(docx_path.split('/')[3:])
-                local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
+                if workspace is not None:
+                    local_file_path = workspace.file(s3_key)
+                else:
+                    local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
                     # Download the file from S3
                 s3_helper.download_file_from_s3(s3_key, local_file_path)
                 docx_path =  local_file_path
 
-        data = extract_bookmarks_and_citations_from_docx(docx_path)
-        llist = extract_bookmark_references(docx_path)
+        # Stream the document once for both extractors, keeping only its references
+        model = DocxModel.load_cached(docx_path, references_only=True)
+        data = extract_bookmarks_and_citations_from_docx(docx_path, model)
+        llist = extract_bookmark_references(docx_path, model)
         # pdf_file = convert_docx_to_pdf(docx_path)
         # pdf_file = "C:\\Users\\Yash\\Downloads\\Test3_BRKT (1) - test.pdf"
         page_nums, headings, final_list = extract_links_and_references_pages(docx_path)
@@ -397,6 +274,7 @@ def verify_references(docx_path):
     finally:
         # if os.path.exists(pdf_file):
         #     os.remove(pdf_file)
-        if os.path.exists(docx_path):
+        # A workspace removes its own files when it closes
+        if workspace is None and os.path.exists(docx_path):
             print("Deleting")
             os.remove(docx_path)
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable
+from common.artifact_cache import ArtifactCache, content_hash
+from common.download_cache import FileLock
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+conversion_cache_enabled = os.getenv('conversion_cache_enabled', 'true').lower() in ('1', 'true', 'yes')
+conversion_cache_dir = os.getenv('conversion_cache_dir', os.path.join(tempfile.gettempdir(), 'nn_conversion_cache'))
+conversion_cache_max_bytes = int(os.getenv('conversion_cache_max_bytes', 2 * 1024 * 1024 * 1024))
+# Set to mirror converted PDFs under this prefix of conversion_cache_bucket, so
+# that other hosts find them too.
+conversion_cache_s3_prefix = os.getenv('conversion_cache_s3_prefix', '')
+conversion_cache_bucket = os.getenv('conversion_cache_bucket', os.getenv('aws_bucket'))
+
+KIND = 'pdf'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_conversion_cache():
+    '''
+    Returns the process-wide cache of converted PDFs, an ArtifactCache of its own
+    under conversion_cache_dir, or None when conversion_cache_enabled is off.
+    '''
+    global _cache
+    if not conversion_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ArtifactCache(conversion_cache_dir, conversion_cache_max_bytes)
+    return _cache
+
+
+def convert_cached(docx_path: str, output_dir: str, convert: Callable[[], str], converter: str) -> str:
+    '''
+    Returns the path of the PDF of docx_path in output_dir, named after the DOCX,
+    calling convert() -> pdf_path only if no PDF of the same bytes made by the
+    same converter (a name and version such as 'libreoffice-7.6.4.1') is cached
+    on this host or, with conversion_cache_s3_prefix set, in S3.
+
+    Concurrent calls for the same document, in this process or another one on
+    the host, wait for the one that converts it and then copy its result.
+    '''
+    cache = get_conversion_cache()
+    if cache is None:
+        return convert()
+
+    digest = content_hash(docx_path)
+    pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+    cached_path = cache.get_file(KIND, digest, converter, '.pdf')
+    if cached_path is None:
+        entry_path = cache.entry_path(KIND, digest, converter, '.pdf')
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # A dot name, which storing the entry does not take for another version
+        # of it and remove.
+        lock_path = os.path.join(os.path.dirname(entry_path), '.' + os.path.basename(entry_path) + cache.LOCK_SUFFIX)
+        with FileLock(lock_path):
+            if os.path.exists(entry_path):
+                # Converted while this call waited for the lock.
+                cached_path = entry_path
+            else:
+                cached_path = _fetch_mirrored(cache, digest, converter)
+            if cached_path is None:
+                result = convert()
+                cached_path = cache.put_file(KIND, digest, converter, result)
+                if cached_path is not None:
+                    _mirror(cached_path, digest, converter)
+                if os.path.abspath(result) != os.path.abspath(pdf_path):
+                    shutil.copyfile(result, pdf_path)
+                return pdf_path
+    shutil.copyfile(cached_path, pdf_path)
+    logger.info(f"Converted PDF of '{os.path.basename(docx_path)}' served from the conversion cache")
+    return pdf_path
+
+
+def _mirror_key(digest: str, converter: str) -> str:
+    return f"{conversion_cache_s3_prefix.rstrip('/')}/{digest}-{converter}.pdf"
+
+
+def _fetch_mirrored(cache: ArtifactCache, digest: str, converter: str):
+    # The path of the mirrored PDF once stored in the local cache, or None.
+    if not conversion_cache_s3_prefix or not conversion_cache_bucket:
+        return None
+    from common.s3_operations import S3Helper
+    key = _mirror_key(digest, converter)
+    try:
+        helper = S3Helper(conversion_cache_bucket)
+        if helper.get_stored_sha256(key) is None:
+            return None
+        with tempfile.TemporaryDirectory(prefix='nn_conversion_') as work_dir:
+            local_path = os.path.join(work_dir, 'mirrored.pdf')
+            helper.download_file_from_s3(key, local_path)
+            return cache.put_file(KIND, digest, converter, local_path)
+    except Exception as e:
+        logger.warning(f"Could not read converted PDF {key} from S3: {e}")
+        return None
+
+
+def _mirror(path: str, digest: str, converter: str) -> None:
+    # Best effort, like every cache write.
+    if not conversion_cache_s3_prefix or not conversion_cache_bucket:
+        return
+    from common.s3_operations import S3Helper
+    key = _mirror_key(digest, converter)
+    try:
+        S3Helper(conversion_cache_bucket).upload_file_to_s3(path, key)
+    except Exception as e:
+        logger.warning(f"Could not mirror converted PDF to S3 as {key}: {e}")
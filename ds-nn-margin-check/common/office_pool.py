@@ -0,0 +1,352 @@
+import atexit
+import os
+import pathlib
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+libreoffice_path = os.getenv('libreoffice_path', 'libreoffice')
+office_pool_enabled = os.getenv('office_pool_enabled', 'true').lower() in ('1', 'true', 'yes')
+office_pool_size = int(os.getenv('office_pool_size', 2))
+# Seconds a conversion may run, a job may wait for a free worker, and a worker
+# may take to start before it is given up on.
+office_pool_job_timeout = float(os.getenv('office_pool_job_timeout', 300))
+office_pool_queue_timeout = float(os.getenv('office_pool_queue_timeout', 600))
+office_pool_start_timeout = float(os.getenv('office_pool_start_timeout', 60))
+# Workers are restarted after this many jobs, which bounds what a long-lived
+# office process leaks.
+office_pool_max_jobs = int(os.getenv('office_pool_max_jobs', 200))
+# Workers talk to LibreOffice through the uno module (the python3-uno system
+# package). Without it the pool refuses to start, unless office_pool_cold_start
+# is on: then each job runs a cold `libreoffice --convert-to pdf`, seconds
+# slower, and an error is logged when the pool starts.
+office_pool_cold_start = os.getenv('office_pool_cold_start', 'false').lower() in ('1', 'true', 'yes')
+
+UNO_MISSING = 'The office pool needs the uno module, installed with the python3-uno system package'
+
+_pool = None
+_pool_lock = threading.Lock()
+_converter = None
+
+
+class OfficeWorker:
+    '''
+    One headless LibreOffice process with a user profile of its own, so that
+    workers never contend for a profile's lock file, listening for UNO
+    connections on a named pipe. Documents are converted over that connection
+    by the running process, which skips the seconds a cold start takes.
+
+    Talking to the process needs the uno module (python3-uno, or LibreOffice's
+    own Python). Without it jobs fail, or with office_pool_cold_start each job
+    runs `libreoffice --convert-to pdf` with the worker's profile instead: still
+    one job per profile at a time, but a cold start each time.
+    '''
+    def __init__(self, number: int, root: str) -> None:
+        self.number = number
+        self.profile_dir = os.path.join(root, f'profile-{number}')
+        self.pipe_name = f'nn_office_{os.getpid()}_{number}'
+        self.jobs = 0
+        self._process = None
+        self._desktop = None
+
+    def start(self) -> None:
+        '''
+        Starts the office process and waits until it accepts connections.
+        '''
+        self.stop()
+        uno = _import_uno()
+        if uno is None:
+            return
+        command = [libreoffice_path, f'-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}',
+                   '--headless', '--invisible', '--nologo', '--norestore', '--nodefault', '--nolockcheck',
+                   f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext']
+        began = time.monotonic()
+        self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local_context)
+        while True:
+            try:
+                context = resolver.resolve(f'uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext')
+                break
+            except Exception:
+                # NoConnectException until the process listens on the pipe
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"Office worker {self.number} exited with code {self._process.returncode} while starting")
+                if time.monotonic() - began > office_pool_start_timeout:
+                    self.stop()
+                    raise TimeoutError(f"Office worker {self.number} did not start within {office_pool_start_timeout}s")
+                time.sleep(0.25)
+        self._desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        self.jobs = 0
+        logger.info(f"Office worker {self.number} started in {time.monotonic() - began:.1f}s (pid {self._process.pid})")
+
+    def healthy(self) -> bool:
+        '''
+        True if the process is running and answers over its connection.
+        '''
+        if self._process is None or self._process.poll() is not None:
+            return False
+        try:
+            self._desktop.getFrames()
+            return True
+        except Exception:
+            return False
+
+    def stop(self) -> None:
+        process, self._process, self._desktop = self._process, None, None
+        if process is None or process.poll() is not None:
+            return
+        process.kill()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Office worker {self.number} (pid {process.pid}) did not exit after kill")
+
+    def convert(self, docx_path: str, pdf_path: str, timeout: float) -> None:
+        '''
+        Converts docx_path to pdf_path, restarting the process first if it is
+        not healthy or has run office_pool_max_jobs jobs. A job that runs past
+        timeout seconds has its process killed and raises TimeoutError.
+        '''
+        if _import_uno() is None:
+            if not office_pool_cold_start:
+                raise RuntimeError(UNO_MISSING)
+            self._convert_cold(docx_path, pdf_path, timeout)
+            return
+        self.run(docx_path, lambda document: _store_pdf(document, pdf_path), timeout)
+
+    def run(self, docx_path: str, action: Callable, timeout: float):
+        '''
+        Opens docx_path read-only and returns action(document), called with the
+        UNO text document before it is closed. Restarts and times out like
+        convert(); raises RuntimeError without the uno module.
+        '''
+        uno = _import_uno()
+        if uno is None:
+            raise RuntimeError('Reading documents from LibreOffice needs the uno module')
+        if not self.healthy() or self.jobs >= office_pool_max_jobs:
+            self.start()
+        self.jobs += 1
+        # A UNO call cannot be interrupted; killing the process makes it fail.
+        timer = threading.Timer(timeout, self.stop)
+        timer.daemon = True
+        timer.start()
+        try:
+            document = self._desktop.loadComponentFromURL(uno.systemPathToFileUrl(os.path.abspath(docx_path)), '_blank', 0,
+                                                          (_property('Hidden', True), _property('ReadOnly', True)))
+            if document is None:
+                raise RuntimeError(f"LibreOffice could not open '{docx_path}'")
+            try:
+                return action(document)
+            finally:
+                document.close(True)
+        except Exception:
+            timed_out = not timer.is_alive()
+            self.stop()
+            if timed_out:
+                raise TimeoutError(f"Processing of '{docx_path}' took longer than {timeout}s")
+            raise
+        finally:
+            timer.cancel()
+
+    def _convert_cold(self, docx_path: str, pdf_path: str, timeout: float) -> None:
+        output_dir = os.path.dirname(os.path.abspath(pdf_path))
+        command = [libreoffice_path, f'-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}',
+                   '--headless', '--convert-to', 'pdf', '--outdir', output_dir, docx_path]
+        try:
+            subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"Conversion of '{docx_path}' took longer than {timeout}s")
+        written = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+        if os.path.abspath(written) != os.path.abspath(pdf_path) and os.path.exists(written):
+            os.replace(written, pdf_path)
+
+
+class OfficePool:
+    '''
+    A fixed number of OfficeWorkers that convert DOCX files to PDF. A job takes
+    the next free worker, waiting in line (up to office_pool_queue_timeout
+    seconds) while all of them are busy, so that at most size conversions run
+    at once. Workers are started ahead of time by warm(), or else by the first
+    job that takes them, checked before every job and restarted when they
+    died, hung past the job timeout or reached office_pool_max_jobs.
+
+        pdf_path = get_office_pool().convert(docx_path, output_dir)
+    '''
+    def __init__(self, size: int = office_pool_size, root: str = None) -> None:
+        self.size = max(1, size)
+        self.root = root or tempfile.mkdtemp(prefix='nn_office_pool_')
+        self.stats = {'jobs': 0, 'failures': 0, 'timeouts': 0}
+        self._stats_lock = threading.Lock()
+        self._workers = [OfficeWorker(number, self.root) for number in range(self.size)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._closed = False
+
+    def warm(self, wait: bool = False) -> None:
+        '''
+        Starts the workers one by one, so that a job arriving meanwhile takes a
+        started worker if there is one (and otherwise starts the one it takes).
+        Runs in a background thread unless wait is set. Without the uno module
+        it raises RuntimeError, or only logs an error with office_pool_cold_start.
+        '''
+        if _import_uno() is None:
+            if not office_pool_cold_start:
+                raise RuntimeError(f"{UNO_MISSING} (or office_pool_cold_start=true to start LibreOffice cold for every job)")
+            logger.error(f"{UNO_MISSING}: with office_pool_cold_start every conversion starts LibreOffice cold")
+            return
+
+        def start_all():
+            for _ in range(self.size):
+                worker = self._idle.get()
+                try:
+                    if not worker.healthy():
+                        worker.start()
+                except Exception as e:
+                    logger.warning(f"Office worker {worker.number} failed to start: {e}")
+                finally:
+                    self._idle.put(worker)
+
+        if wait:
+            start_all()
+        else:
+            threading.Thread(target=start_all, name='office-pool-warm', daemon=True).start()
+
+    def convert(self, docx_path: str, output_dir: str = None, timeout: float = None) -> str:
+        '''
+        Converts a DOCX to PDF in output_dir (next to the DOCX by default) and
+        returns the path of the PDF. Raises TimeoutError when no worker became
+        free within office_pool_queue_timeout or the conversion took longer
+        than timeout (default office_pool_job_timeout) seconds.
+        '''
+        output_dir = output_dir or os.path.dirname(os.path.abspath(docx_path))
+        pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+        began = time.perf_counter()
+        worker, _ = self._on_worker(docx_path, lambda worker: worker.convert(docx_path, pdf_path, timeout or office_pool_job_timeout))
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"LibreOffice did not write {pdf_path}")
+        logger.info(f"Office worker {worker.number} converted '{os.path.basename(docx_path)}' in {time.perf_counter() - began:.2f}s")
+        return pdf_path
+
+    def run(self, docx_path: str, action: Callable, timeout: float = None):
+        '''
+        Opens a DOCX read-only on the next free worker and returns
+        action(document), called with the UNO text document, e.g. to read how
+        LibreOffice numbers its lists. Needs the uno module; raises TimeoutError
+        like convert().
+        '''
+        _, result = self._on_worker(docx_path, lambda worker: worker.run(docx_path, action, timeout or office_pool_job_timeout))
+        return result
+
+    def _on_worker(self, docx_path: str, job: Callable):
+        # Runs job(worker) on the next free worker; returns the worker and the result.
+        if self._closed:
+            raise RuntimeError('Office pool is closed')
+        try:
+            worker = self._idle.get(timeout=office_pool_queue_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No office worker became free within {office_pool_queue_timeout}s")
+        try:
+            result = job(worker)
+        except Exception as e:
+            self._count('timeouts' if isinstance(e, TimeoutError) else 'failures')
+            logger.error(f"Office worker {worker.number} failed on '{docx_path}': {e}")
+            raise
+        finally:
+            self._idle.put(worker)
+        self._count('jobs')
+        return worker, result
+
+    def close(self) -> None:
+        '''
+        Stops the workers and removes their profiles.
+        '''
+        self._closed = True
+        for worker in self._workers:
+            worker.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+
+def get_office_pool() -> OfficePool:
+    '''
+    The process-wide pool, created and warmed on first use and closed when the
+    process exits. Returns None when office_pool_enabled is off or LibreOffice
+    (libreoffice_path) is not installed, and raises RuntimeError like warm()
+    without the uno module.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None and office_pool_enabled and shutil.which(libreoffice_path):
+            pool = OfficePool()
+            try:
+                pool.warm()
+            except Exception:
+                pool.close()
+                raise
+            atexit.register(pool.close)
+            _pool = pool
+        return _pool
+
+
+def convert_with_office_pool(docx_path: str, output_dir: str = None) -> str:
+    '''
+    Converts a DOCX to PDF with the process-wide pool and returns the path of
+    the PDF, written to output_dir (next to the DOCX by default).
+    '''
+    pool = get_office_pool()
+    if pool is None:
+        raise RuntimeError(f"LibreOffice is not available: '{libreoffice_path}' was not found or office_pool_enabled is off")
+    return pool.convert(docx_path, output_dir)
+
+
+def converter_name() -> str:
+    '''
+    Names the converter with the installed LibreOffice version, such as
+    'libreoffice-7.6.4.1', for keying converted PDFs (see
+    common/conversion_cache.py), so that an upgrade does not serve PDFs laid
+    out by the old version.
+    '''
+    global _converter
+    if _converter is None:
+        try:
+            # "LibreOffice 7.6.4.1 e19e193f88cd6c0525a17fb7a176ed8e6a3e2aa1"
+            output = subprocess.run([libreoffice_path, '--version'], capture_output=True, text=True, timeout=60).stdout.split()
+            _converter = f'libreoffice-{output[1]}' if len(output) > 1 else 'libreoffice'
+        except (OSError, subprocess.SubprocessError):
+            _converter = 'libreoffice'
+    return _converter
+
+
+def _import_uno():
+    # None when the uno bridge is not installed for this Python.
+    try:
+        import uno
+    except ImportError:
+        return None
+    return uno
+
+
+def _store_pdf(document, pdf_path: str) -> None:
+    uno = _import_uno()
+    document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)), (_property('FilterName', 'writer_pdf_Export'),))
+
+
+def _property(name: str, value):
+    from com.sun.star.beans import PropertyValue
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
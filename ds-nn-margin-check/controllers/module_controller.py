@@ -2,8 +2,9 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, validator
 from scripts.margin_check import DocumentFormatReviewer, PDFFormatReviewer
-from scripts.terminate_active_COM import terminate_active_processes
+from common.office_backend import check_office_backend
 from common.logs import logger
+from common.workspace import ScratchWorkspace
 from typing import Dict, Union
 
 class DocFormatCheck(BaseModel):
@@ -28,22 +29,26 @@ class DocFormatCheck(BaseModel):
 
 app = FastAPI()
 
+# DOCX files are converted to PDF with the office backend, so the start fails without it.
+check_office_backend()
+
 @app.post('/check_margin')
 async def check_margin(request: DocFormatCheck):
     try:
         logger.info(str(f'Starting to check the format for document. ')+'[check_document_format] [controllers/module_controller.py:16]')
-        terminate_active_processes()
         document = request.file_path
         margin_dict = request.margin_dict
         
-        if document.endswith('.docx'):
-            reviewer = DocumentFormatReviewer(document, margin_dict)
-            results = reviewer.review_document(margin_dict)
-        elif document.endswith('.pdf'):
-            reviewer = PDFFormatReviewer(document, margin_dict)
-            results = reviewer.review_document()
-        else:
-            raise Exception("File type not supported.")
+        # Downloads, converted and annotated PDFs are removed when the workspace closes
+        async with ScratchWorkspace('margin-check') as workspace:
+            if document.endswith('.docx'):
+                reviewer = DocumentFormatReviewer(document, margin_dict, workspace)
+                results = reviewer.review_document(margin_dict)
+            elif document.endswith('.pdf'):
+                reviewer = PDFFormatReviewer(document, margin_dict, workspace)
+                results = reviewer.review_document()
+            else:
+                raise Exception("File type not supported.")
         
         logger.info(str(f'Completed the check for format. ')+'[check_document_format] [controllers/module_controller.py:35]')
         
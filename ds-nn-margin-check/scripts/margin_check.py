@@ -1,25 +1,24 @@
 import os
 import time
 import re
-import subprocess
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional, Any, Union
 
-import pythoncom
 import fitz  # PyMuPDF
-import win32com.client
 from docx import Document
 from docx.shared import Inches, Twips, Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.oxml import OxmlElement
-from docx2pdf import convert
 from PyPDF2 import PdfReader
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer, LTChar, LTAnno, LTTextBox
 from lxml import etree
 
 from common.logs import logger
+from common.office_backend import convert_to_pdf
+from common.pdf_sharding import run_sharded, should_shard
 from common.s3_operations import S3Helper
+from common.workspace import ScratchWorkspace
 
 bucket_name = os.getenv('aws_bucket')
 s3_helper = S3Helper(bucket_name)
@@ -41,13 +40,15 @@ TMP_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class DocumentFormatReviewer:
-    def __init__(self, doc_path: str, margin_dict: Dict[str, Union[float, int]]):
+    def __init__(self, doc_path: str, margin_dict: Dict[str, Union[float, int]], workspace: ScratchWorkspace = None):
         """
         Initialize the DocumentFormatReviewer with a path to a Word document
-        and a dictionary for margin specifications.
+        and a dictionary for margin specifications. Downloads, the converted PDF
+        and the annotated PDF go into workspace when one is given, otherwise TMP_DIR.
         """
         try:
             logger.info(f"Opening document: {doc_path}")
+            self.workspace = workspace
             # If the document is on S3, download it locally
             if doc_path.startswith('s3://'):
                 doc_path = self.download_s3_file(doc_path)
@@ -62,10 +63,14 @@ class DocumentFormatReviewer:
             logger.error(f"Failed to open document: {str(e)}")
             raise Exception(f"Failed to open document: {str(e)}")
 
+    def scratch_dir(self) -> str:
+        """Directory for downloaded and generated files"""
+        return self.workspace.path if self.workspace is not None else str(TMP_DIR)
+
     def download_s3_file(self, file_path: str) -> str:
         """
         Download a file from S3 using the provided file path.
-        The file is downloaded to TMP_DIR with a unique timestamp appended.
+        The file is downloaded to scratch_dir() with a unique timestamp appended.
         """
         try:
             from common.s3_operations import S3Helper  # Ensure import is local
@@ -76,7 +81,7 @@ class DocumentFormatReviewer:
             local_key = list(s3_key.split('.'))
             local_key[0] += f'_{ts}'
             local_key = '.'.join(local_key)
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(local_key))
+            local_file_path = os.path.join(self.scratch_dir(), os.path.basename(local_key))
             logger.info("Downloading S3 file: " + file_path + " to local path: " + local_file_path +
                         " [__init__ S3] [ds-nn-m9\\scripts\\template_extract.py:150]")
             s3_helper.download_file_from_s3(s3_key, local_file_path)
@@ -90,58 +95,9 @@ class DocumentFormatReviewer:
             raise
 
     def convert_to_pdf(self) -> str:
-        """Convert document to PDF using Microsoft Office COM automation"""
-        output_dir = os.path.dirname(self.file_path)
-        pdf_file = os.path.join(output_dir, os.path.splitext(os.path.basename(self.file_path))[0] + '.pdf')
-        try:
-            try:
-                pythoncom.CoInitialize()
-                word = win32com.client.Dispatch("Word.Application")
-                word.Visible = False
-                doc = word.Documents.Open(self.file_path)
-                doc.SaveAs(pdf_file, FileFormat=17)  # 17 represents PDF format
-                return pdf_file
-            except Exception as e:
-                logger.error(f"COM automation failed: {str(e)}")
-                try:
-                    convert(self.file_path, pdf_file)
-                    return pdf_file
-                except ImportError:
-                    soffice_paths = [
-                        r"C:\Program Files\Microsoft Office\root\Office16\WINWORD.EXE",
-                        r"C:\Program Files (x86)\Microsoft Office\root\Office16\WINWORD.EXE",
-                    ]
-                    for soffice_path in soffice_paths:
-                        if os.path.exists(soffice_path):
-                            command = [
-                                soffice_path,
-                                "/q",
-                                "/n",
-                                "/f",
-                                "/c",
-                                f"SaveAs.PDF({pdf_file})",
-                                self.file_path
-                            ]
-                            subprocess.run(command, check=True)
-                            return pdf_file
-                    raise Exception("No viable PDF conversion method found")
-        except Exception as e:
-            logger.error(f"PDF conversion failed: {str(e)}")
-            raise
-        finally:
-            try:
-                if doc:
-                    doc.Close()
-                    del doc
-            except Exception as e:
-                logger.error(str('Error deleting doc ') + '[convert to pdf] [scripts\\margin_check.py:137]')
-            try:
-                if word:
-                    word.Quit()
-                    del word
-            except Exception as e:
-                logger.error(str('Error deleting word app ') + '[convert to pdf] [scripts\\margin_check.py:143]')
-            pythoncom.CoUninitialize()
+        """Convert document to PDF (cached by content) with the office backend, warm LibreOffice workers by default"""
+        output_dir = self.workspace.path if self.workspace is not None else os.path.dirname(self.file_path)
+        return convert_to_pdf(self.file_path, output_dir)
 
     def preprocess_pdf_text(self, text):
         """
@@ -173,7 +129,7 @@ class DocumentFormatReviewer:
             pdf_path = self.convert_to_pdf()
             if not os.path.exists(pdf_path):
                 raise FileNotFoundError(f"PDF file not found at {pdf_path}")
-            pdf_reviewer = PDFFormatReviewer(pdf_path, self.margin_dict)
+            pdf_reviewer = PDFFormatReviewer(pdf_path, self.margin_dict, self.workspace)
             a, b = pdf_reviewer.check_page_margins()
             result = {
                 'pdf_path': a,
@@ -216,14 +172,86 @@ class DocumentFormatReviewer:
             raise
 
 
+def find_items_outside_margins(doc, start: int, stop: int, margins_pt: Tuple[float, float, float, float]) -> List[list]:
+    """
+    Find the text blocks, images (figures) and vector drawings (tables) of
+    pages start..stop-1 that lie outside the margins, given in points as
+    (top, bottom, left, right) with 5pt of slack. Returns one list per page of
+    (x0, y0, x1, y1, text) boxes, text being None for images and drawings.
+    Module-level so that shard workers can run it (see common/pdf_sharding.py).
+    """
+    n_top_margin, n_bottom_margin, n_left_margin, n_right_margin = margins_pt
+    pages = []
+    for page_no in range(start, stop):
+        page = doc[page_no]
+        page_rect = page.rect  # Get full page dimensions
+
+        # Define a valid content area within margins
+        valid_margin = fitz.Rect(
+            n_left_margin-5, 
+            n_top_margin-5, 
+            page_rect.width - n_right_margin + 5, 
+            page_rect.height - n_bottom_margin + 5
+        )
+
+        outside_items = []
+
+        # 📝 Detect text outside the margin box
+        for block in page.get_text("blocks"):
+            x0, y0, x1, y1, text, *_ = block
+            if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
+                y0 < valid_margin.y0 or y1 > valid_margin.y1) and text.strip():
+                outside_items.append((x0, y0, x1, y1, text))
+
+        # 🖼️ Detect images (figures) outside the margin box
+        for img in page.get_images(full=True):
+            xref = img[0]
+            img_rects = page.get_image_rects(xref)
+            if not img_rects:
+                continue
+            img_rect = img_rects[0]
+            if img_rect.width < 15 or img_rect.height<15:
+                continue
+            x0, y0, x1, y1 = img_rect
+            if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
+                y0 < valid_margin.y0 or y1 > valid_margin.y1):
+                outside_items.append((x0, y0, x1, y1, None))
+
+        # 📊 Detect tables (vector drawings) outside the margin box
+        for drawing in page.get_drawings():
+            for path in drawing["items"]:
+                if path[0] == "re":  # Rectangle
+                    if isinstance(path[1], fitz.Rect):  
+                        rect = path[1]
+                        x0, y0, x1, y1 = rect.x0, rect.y0, rect.x1, rect.y1
+                        if rect.width < 15 or rect.height<15:
+                            continue
+                    elif len(path) == 5:
+                        x0, y0, w, h = path[1:]
+                        x1, y1 = x0 + w, y0 + h
+                        if w < 15 or h < 15:
+                            continue
+                    else:
+                        continue
+
+                    if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
+                        y0 < valid_margin.y0 or y1 > valid_margin.y1):
+                        outside_items.append((x0, y0, x1, y1, None))
+
+        pages.append(outside_items)
+    return pages
+
+
 class PDFFormatReviewer:
-    def __init__(self, pdf_path: str, margin_dict: Dict[str, Union[float, int]]):
+    def __init__(self, pdf_path: str, margin_dict: Dict[str, Union[float, int]], workspace: ScratchWorkspace = None):
         """
         Initialize the PDFFormatReviewer with a path to a PDF document
-        and a dictionary for margin specifications.
+        and a dictionary for margin specifications. Downloads and the annotated
+        PDF go into workspace when one is given, otherwise TMP_DIR.
         """
         try:
             logger.info(f"Opening PDF: {pdf_path}")
+            self.workspace = workspace
             if pdf_path.startswith('s3://'):
                 pdf_path = self.download_s3_file(pdf_path)
             # self.pdf_reader = PdfReader(pdf_path)
@@ -235,10 +263,14 @@ class PDFFormatReviewer:
             logger.error(f"Failed to open PDF: {str(e)}")
             raise Exception(f"Failed to open PDF: {str(e)}")
 
+    def scratch_dir(self) -> str:
+        """Directory for downloaded and generated files"""
+        return self.workspace.path if self.workspace is not None else str(TMP_DIR)
+
     def download_s3_file(self, file_path: str) -> str:
         """
         Download a PDF from S3 using the provided file path.
-        The file is downloaded to TMP_DIR with a unique timestamp appended.
+        The file is downloaded to scratch_dir() with a unique timestamp appended.
         """
         try:
             from common.s3_operations import S3Helper
@@ -249,7 +281,7 @@ class PDFFormatReviewer:
             local_key = list(s3_key.split('.'))
             local_key[0] += f'_{ts}'
             local_key = '.'.join(local_key)
-            local_file_path = os.path.join(TMP_DIR, os.path.basename(local_key))
+            local_file_path = os.path.join(self.scratch_dir(), os.path.basename(local_key))
             logger.info("Downloading S3 file: " + file_path + " to local path: " + local_file_path +
                         " [__init__ S3] [ds-nn-m9\\scripts\\template_extract.py:150]")
             s3_helper.download_file_from_s3(s3_key, local_file_path)
@@ -289,7 +321,18 @@ class PDFFormatReviewer:
             n_right_margin = right_margin * 72
 
 
-            for page_no in range(len(doc)):
+            margins_pt = (n_top_margin, n_bottom_margin, n_left_margin, n_right_margin)
+            # Finding what lies outside the margins is the slow part; large PDFs
+            # are scanned in page ranges by worker processes, and the boxes are
+            # drawn here afterwards.
+            if should_shard(len(doc)):
+                shards = run_sharded(self.pdf_path, find_items_outside_margins, margins_pt,
+                                     page_count=len(doc), name='margin-check')
+                outside_pages = [page for shard in shards for page in shard['result']]
+            else:
+                outside_pages = find_items_outside_margins(doc, 0, len(doc), margins_pt)
+
+            for page_no, outside_items in enumerate(outside_pages):
                 page = doc[page_no]
                 page_rect = page.rect  # Get full page dimensions
 
@@ -301,69 +344,17 @@ class PDFFormatReviewer:
                     page_rect.height - n_bottom_margin + 5
                 )
 
-                outside_items = []
-
-                
-
-                # 📝 Detect text outside the margin box
-                for block in page.get_text("blocks"):
-                    x0, y0, x1, y1, text, *_ = block
-                    if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
-                        y0 < valid_margin.y0 or y1 > valid_margin.y1) and text.strip():
-                        # outside_items.append(ItemCoordinate(x0, y0, x1, y1, "Text", text=text))
-                        result.add(page_no+1)
-                        shape = page.new_shape()
+                # Red box for text, images (figures) and tables (vector drawings) outside
+                for x0, y0, x1, y1, text in outside_items:
+                    result.add(page_no+1)
+                    shape = page.new_shape()
+                    if text is not None:
                         logger.info(str(f'Block for {text} - {x0} {y0} {x1} {y1}')+'[methodName] [scripts\margin_check.py:322]')
-                        shape.draw_rect(fitz.Rect(x0, y0, x1, y1))
-                        shape.finish(color=(1, 0, 0), width=0.5)  # Red box for text outside
-                        shape.commit()
-
-                # 🖼️ Detect images (figures) outside the margin box
-                for img in page.get_images(full=True):
-                    xref = img[0]
-                    img_rects = page.get_image_rects(xref)
-                    if not img_rects:
-                        continue
-                    img_rect = img_rects[0]
-                    if img_rect.width < 15 or img_rect.height<15:
-                        continue
-                    x0, y0, x1, y1 = img_rect
-                    if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
-                        y0 < valid_margin.y0 or y1 > valid_margin.y1):
-                        # outside_items.append(ItemCoordinate(x0, y0, x1, y1, "Figure"))
-                        result.add(page_no+1)
-                        shape = page.new_shape()
+                    else:
                         logger.info(str(f'{x0} {y0} {x1} {y1}')+'[methodName] [scripts\margin_check.py:322]')
-                        shape.draw_rect(fitz.Rect(x0, y0, x1, y1))
-                        shape.finish(color=(1, 0, 0), width=0.5)  # Red box for images
-                        shape.commit()
-
-                # 📊 Detect tables (vector drawings) outside the margin box
-                for drawing in page.get_drawings():
-                    for path in drawing["items"]:
-                        if path[0] == "re":  # Rectangle
-                            if isinstance(path[1], fitz.Rect):  
-                                rect = path[1]
-                                x0, y0, x1, y1 = rect.x0, rect.y0, rect.x1, rect.y1
-                                if rect.width < 15 or rect.height<15:
-                                    continue
-                            elif len(path) == 5:
-                                x0, y0, w, h = path[1:]
-                                x1, y1 = x0 + w, y0 + h
-                                if w < 15 or h < 15:
-                                    continue
-                            else:
-                                continue
-
-                            if (x0 < valid_margin.x0 or x1 > valid_margin.x1 or
-                                y0 < valid_margin.y0 or y1 > valid_margin.y1):
-                                # outside_items.append(ItemCoordinate(x0, y0, x1, y1, "Drawing"))
-                                result.add(page_no+1)
-                                shape = page.new_shape()
-                                logger.info(str(f'{x0} {y0} {x1} {y1}')+' [methodName] [scripts\margin_check.py:322]')
-                                shape.draw_rect(fitz.Rect(x0, y0, x1, y1))
-                                shape.finish(color=(1, 0, 0), width=0.5)  # Red box for drawings
-                                shape.commit()
+                    shape.draw_rect(fitz.Rect(x0, y0, x1, y1))
+                    shape.finish(color=(1, 0, 0), width=0.5)
+                    shape.commit()
                 
                 logger.info(str(f'Drawing box for page - {page_no}')+ '[methodName] [scripts\margin_check.py:312]')
                 logger.info(str(f'Top - {top_margin-5}\nBottom - {page_rect.height - bottom_margin + 5}\nLeft - {left_margin-5}\nRight - {page_rect.width - right_margin + 5}')+'[methodName] [scripts\margin_check.py:307]')
@@ -383,7 +374,7 @@ class PDFFormatReviewer:
 
             # Save the modified PDF
             
-            new_pdf_path = f"{TMP_DIR}/{os.path.basename(self.pdf_path).split('.')[0] + '_modified.pdf'}"
+            new_pdf_path = f"{self.scratch_dir()}/{os.path.basename(self.pdf_path).split('.')[0] + '_modified.pdf'}"
             new_pdf_path = os.path.normpath(os.path.abspath(new_pdf_path))
             print(new_pdf_path)
             doc.save(new_pdf_path)
@@ -393,7 +384,8 @@ class PDFFormatReviewer:
             
             logger.info(str(f"New PDF with margin annotations saved as: {new_pdf_path}")+'[methodName] [scripts\margin_check.py:363]')
             logger.info(str('Uploading File to s3 ')+'[get_table_details] [scripts\sql_queries.py:136]')
-            s3_helper.upload_file_to_s3(file_name=f'{TMP_DIR}/{file_name}', object_name=f'{file_name}')
+            # The name carries the download's timestamp, so no earlier upload is under it to compare with
+            s3_helper.upload_file_to_s3(file_name=new_pdf_path, object_name=f'{file_name}', skip_unchanged=False)
 
             s3_path = f"s3://{bucket_name}/{file_name}"
             result_dict = []
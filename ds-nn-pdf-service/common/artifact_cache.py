@@ -0,0 +1,273 @@
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import zlib
+from typing import Any, Callable
+from common.download_cache import FileLock
+from common.logs import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+artifact_cache_enabled = os.getenv('artifact_cache_enabled', 'true').lower() in ('1', 'true', 'yes')
+artifact_cache_dir = os.getenv('artifact_cache_dir', os.path.join(tempfile.gettempdir(), 'nn_artifact_cache'))
+artifact_cache_max_bytes = int(os.getenv('artifact_cache_max_bytes', 1024 * 1024 * 1024))
+artifact_cache_compression = int(os.getenv('artifact_cache_compression', 3))
+
+# First bytes of every object entry, so that a truncated or foreign file is
+# rejected before it is unpickled.
+MAGIC = b'NNAC1\n'
+HASH_CHUNK = 1024 * 1024
+
+
+def content_hash(source) -> str:
+    '''
+    Returns the SHA-256 hex digest of a document given as a path, bytes or a
+    seekable binary file (read from the start and left at the start). A file
+    that identifies its content without being read, such as an S3RangeFile
+    (one S3 object version), provides the digest as content_digest instead.
+    '''
+    if getattr(source, 'content_digest', None):
+        return source.content_digest
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    '''
+    On-disk cache of parse products (DOCX models, PDF layouts, extracted text,
+    converted files) shared by every service on the host, so that checking an
+    unchanged document again skips parsing altogether.
+
+    Entries are keyed by kind, the SHA-256 of the document's bytes and the
+    version of the code that built them:
+
+        {cache_dir}/{kind}/{digest[:2]}/{digest}-{version}{suffix}
+
+    Objects are pickled and zlib-compressed; files are stored as they are.
+    Writing an entry removes the other versions of the same kind and document,
+    and builders bump their version whenever their output changes, so a stale
+    artifact is never served. The total size is kept under max_bytes by
+    evicting the least recently used entries. The cache directory must only be
+    writable by the services, since entries are unpickled.
+    '''
+    LOCK_SUFFIX = '.lock'
+    PART_SUFFIX = '.part'
+    OBJECT_SUFFIX = '.bin'
+
+    def __init__(self, cache_dir: str = artifact_cache_dir, max_bytes: int = artifact_cache_max_bytes,
+                 compression: int = artifact_cache_compression) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def entry_path(self, kind: str, digest: str, version: str, suffix: str = OBJECT_SUFFIX) -> str:
+        version = str(version).replace(os.sep, '_').replace('/', '_')
+        return os.path.join(self.cache_dir, kind, digest[:2], f'{digest}-{version}{suffix}')
+
+    def get(self, kind: str, digest: str, version: str):
+        '''
+        Returns the cached object, or None on a miss. An entry that cannot be
+        read is removed and counts as a miss.
+        '''
+        path = self.entry_path(kind, digest, version)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self._record('misses')
+            return None
+        try:
+            if not data.startswith(MAGIC):
+                raise ValueError('not an artifact cache entry')
+            value = pickle.loads(zlib.decompress(data[len(MAGIC):]))
+        except Exception as e:
+            logger.warning(f"Artifact cache entry {path} is unreadable, removing it: {e}")
+            self._remove(path)
+            self._record('misses')
+            return None
+        self._hit(path)
+        return value
+
+    def put(self, kind: str, digest: str, version: str, value: Any) -> None:
+        '''
+        Stores an object. Failures are logged and otherwise ignored: the cache
+        never fails the check that uses it.
+        '''
+        path = self.entry_path(kind, digest, version)
+        try:
+            data = MAGIC + zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.compression)
+            self._write(path, lambda part_path: _write_bytes(part_path, data))
+        except Exception as e:
+            logger.warning(f"Could not store {kind} artifact {digest}: {e}")
+
+    def get_file(self, kind: str, digest: str, version: str, suffix: str):
+        '''
+        Returns the path of a cached file, or None on a miss. Callers must treat
+        the file as read-only and copy or link it if they need to keep it.
+        '''
+        path = self.entry_path(kind, digest, version, suffix)
+        if os.path.exists(path):
+            self._hit(path)
+            return path
+        self._record('misses')
+        return None
+
+    def put_file(self, kind: str, digest: str, version: str, file_name: str):
+        '''
+        Stores a copy of file_name (its extension is kept) and returns the path
+        of the cached file, or None if it could not be stored.
+        '''
+        suffix = os.path.splitext(file_name)[1].lower()
+        path = self.entry_path(kind, digest, version, suffix)
+        try:
+            self._write(path, lambda part_path: shutil.copyfile(file_name, part_path))
+        except Exception as e:
+            logger.warning(f"Could not store {kind} file {file_name}: {e}")
+            return None
+        return path
+
+    def load(self, kind: str, version: str, source, build: Callable[[], Any], digest: str = None):
+        '''
+        Returns the artifact of kind for source (a path, bytes or seekable binary
+        file), calling build() and storing its result only on a miss.
+        '''
+        digest = digest or content_hash(source)
+        value = self.get(kind, digest, version)
+        if value is None:
+            value = build()
+            self.put(kind, digest, version, value)
+        return value
+
+    def evict(self, keep: str = None) -> None:
+        '''
+        Removes least recently used entries until the cache fits in max_bytes.
+        '''
+        with FileLock(os.path.join(self.cache_dir, '.evict' + self.LOCK_SUFFIX)):
+            entries = []
+            total = 0
+            for root, dirs, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(self.LOCK_SUFFIX) or name.endswith(self.PART_SUFFIX):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep or not self._remove(path):
+                    continue
+                total -= size
+                self._record('evictions')
+            logger.info(f"Artifact cache evicted entries, {total} bytes remain (limit {self.max_bytes})")
+
+    def _write(self, path: str, write: Callable[[str], Any]) -> None:
+        # Write to a .part file and rename it, so that readers never see a
+        # partial entry; then drop other versions and make room.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f'{path}.{os.getpid()}.{threading.get_ident()}{self.PART_SUFFIX}'
+        try:
+            write(part_path)
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        self._invalidate(path)
+        self.evict(keep=path)
+
+    def _invalidate(self, path: str) -> None:
+        # Every other version of this kind and document is stale.
+        digest = os.path.basename(path).split('-', 1)[0]
+        for other in glob.glob(os.path.join(os.path.dirname(path), glob.escape(digest) + '-*')):
+            if other != path and not other.endswith(self.PART_SUFFIX) and self._remove(other):
+                self._record('invalidations')
+                logger.info(f"Artifact cache removed stale entry {other}")
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            # Still open on Windows, or already removed by another process.
+            return False
+
+    def _hit(self, path: str) -> None:
+        # The modification time doubles as the LRU timestamp.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._record('hits')
+        logger.info(f"Artifact cache hit: {path}")
+
+    def _record(self, counter: str) -> None:
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    '''
+    Returns the process-wide ArtifactCache, or None when artifact_cache_enabled is off.
+    '''
+    global _artifact_cache
+    if not artifact_cache_enabled:
+        return None
+    if _artifact_cache is None:
+        with _artifact_cache_lock:
+            if _artifact_cache is None:
+                _artifact_cache = ArtifactCache()
+    return _artifact_cache
+
+
+def cached(kind: str, version: str, source, build: Callable[[], Any]):
+    '''
+    Returns build()'s result for source through the process-wide cache, or just
+    build()'s result when the cache is disabled.
+    '''
+    cache = get_artifact_cache()
+    if cache is None:
+        return build()
+    return cache.load(kind, version, source, build)
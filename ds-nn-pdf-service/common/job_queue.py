@@ -0,0 +1,376 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Callable
+from common.logs import logger
+from dotenv import load_dotenv
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+load_dotenv()
+
+# Keep this on a volume that survives the container, or queued jobs are lost on restart.
+job_queue_db = os.getenv('job_queue_db', os.path.join(os.getcwd(), 'data', 'nn_jobs.sqlite3'))
+job_queue_workers = int(os.getenv('job_queue_workers', 2))
+# Finished jobs are deleted after this many seconds.
+job_queue_retention = float(os.getenv('job_queue_retention', 7 * 24 * 3600))
+# Webhooks are only called on these hosts, so that a client cannot make the
+# service send requests into the network.
+job_callback_hosts = [host.strip() for host in os.getenv('job_callback_hosts', 'localhost,127.0.0.1,::1').split(',') if host.strip()]
+job_callback_timeout = float(os.getenv('job_callback_timeout', 10))
+# Seconds a synchronous request waits for its job before answering with the job
+# id instead of the result; 0 (the default) waits until the job has finished.
+job_wait_timeout = float(os.getenv('job_wait_timeout', 0)) or None
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Identifies this process in the jobs it claims. Unlike host and pid it is never
+# reused, e.g. by the same process restarted in a new container.
+BOOT_ID = uuid.uuid4().hex
+
+# Lock files held by this process, one per database, see _hold_owner_lock().
+_owner_locks = {}
+_owner_locks_lock = threading.Lock()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    callback_url TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue, status, created_at);
+'''
+
+
+class JobQueue:
+    '''
+    A queue of background jobs kept in SQLite, run by a fixed number of worker
+    threads that call handler(payload) -> result (both JSON-serialisable).
+    Submitting returns a job id at once; the job's status is then read with
+    get(), waited for with wait(), or POSTed as JSON to the job's callback URL
+    when it finishes.
+
+        jobs = JobQueue('convert_to_pdf', convert)
+        jobs.start()
+        job_id = jobs.submit({'file_path': path}, callback_url='http://localhost:9000/done')
+        jobs.get(job_id)    # {'id': ..., 'status': 'queued' | 'running' | 'succeeded' | 'failed', ...}
+
+    Queued jobs outlive the process: start() resumes them, and requeues jobs
+    left running by a process that is gone. Several processes may share one
+    database (uvicorn --workers, replicas on one host), since a job is claimed
+    in a single write transaction. Each process holds a lock file named after
+    its BOOT_ID next to the database for as long as it lives, and a running job
+    is requeued only once its owner's lock is free: the kernel releases it when
+    the process dies, however its pid is reused afterwards.
+    '''
+    def __init__(self, name: str, handler: Callable[[dict], object], db_path: str = None, workers: int = None) -> None:
+        self.name = name
+        self.handler = handler
+        self.db_path = db_path or job_queue_db
+        self.workers = max(1, workers or job_queue_workers)
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{BOOT_ID}'
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = False
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    def start(self) -> None:
+        '''
+        Requeues interrupted jobs and starts the workers.
+        '''
+        if self._threads:
+            return
+        _hold_owner_lock(self.db_path)
+        self._requeue_orphans()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'{self.name}-job-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[{self.name}] Job queue started with {self.workers} workers on '{self.db_path}'")
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def submit(self, payload: dict, callback_url: str = None) -> str:
+        '''
+        Queues a job and returns its id. Raises ValueError for a callback URL
+        that is not http(s) on one of job_callback_hosts.
+        '''
+        if callback_url:
+            check_callback_url(callback_url)
+        job_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute('INSERT INTO jobs (id, queue, status, payload, callback_url, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                               (job_id, self.name, QUEUED, json.dumps(payload), callback_url, time.time()))
+        with self._condition:
+            self._condition.notify_all()
+        logger.info(f"[{self.name}] Job {job_id} queued")
+        return job_id
+
+    def get(self, job_id: str):
+        '''
+        Returns the job as a dict (id, status, result, error, callback_url and
+        the times it was created, started and finished), or None if there is no
+        such job.
+        '''
+        with self._connect() as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE id = ? AND queue = ?', (job_id, self.name)).fetchone()
+        return _job(row) if row is not None else None
+
+    def wait(self, job_id: str, timeout: float = None):
+        '''
+        Blocks until the job has finished and returns it, or returns it as it
+        is when timeout seconds passed first. Jobs run by another process are
+        polled.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in (SUCCEEDED, FAILED):
+                return job
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return job
+            with self._condition:
+                self._condition.wait(min(1.0, remaining) if remaining is not None else 1.0)
+
+    async def wait_async(self, job_id: str, timeout: float = None, interval: float = 0.5):
+        '''
+        Like wait(), for coroutines: polls every interval seconds without
+        blocking the event loop.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in (SUCCEEDED, FAILED):
+                return job
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return job
+            await asyncio.sleep(min(interval, remaining) if remaining is not None else interval)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"[{self.name}] Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._purge()
+                with self._condition:
+                    if not self._stopped:
+                        # Also wakes up for jobs submitted by other processes.
+                        self._condition.wait(5.0)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # The job stays marked as running and is requeued after a restart.
+                logger.error(f"[{self.name}] Could not record the end of job {job['id']}: {e}")
+
+    def _run(self, job: dict) -> None:
+        began = time.perf_counter()
+        try:
+            result = self.handler(job['payload'])
+            status, error = SUCCEEDED, None
+        except Exception as e:
+            logger.error(f"[{self.name}] Job {job['id']} failed: {e}")
+            result, status, error = None, FAILED, str(e)
+        with self._connect() as connection:
+            connection.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                               (status, json.dumps(result), error, time.time(), job['id']))
+        logger.info(f"[{self.name}] Job {job['id']} {status} in {time.perf_counter() - began:.2f}s")
+        with self._condition:
+            self._condition.notify_all()
+        if job['callback_url']:
+            self._notify(self.get(job['id']))
+
+    def _claim(self):
+        # The oldest queued job, marked as running by this process.
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT * FROM jobs WHERE queue = ? AND status = ? ORDER BY created_at LIMIT 1',
+                                     (self.name, QUEUED)).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return None
+            started = time.time()
+            connection.execute('UPDATE jobs SET status = ?, owner = ?, started_at = ? WHERE id = ?',
+                               (RUNNING, self.owner, started, row['id']))
+            connection.execute('COMMIT')
+        job = _job(row)
+        job.update(status=RUNNING, started_at=started)
+        return job
+
+    def _requeue_orphans(self) -> None:
+        # Jobs running in a process that is gone were interrupted, e.g. by a
+        # restart; they run again from the start. The owner must still match,
+        # in case another process requeued and claimed the job meanwhile.
+        with self._connect() as connection:
+            rows = connection.execute('SELECT id, owner FROM jobs WHERE queue = ? AND status = ?', (self.name, RUNNING)).fetchall()
+            for row in rows:
+                boot_id = (row['owner'] or '').rpartition(':')[2]
+                if boot_id == BOOT_ID or _owner_alive(self.db_path, boot_id):
+                    continue
+                requeued = connection.execute('UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE id = ? AND status = ? AND owner IS ?',
+                                              (QUEUED, row['id'], RUNNING, row['owner'])).rowcount
+                if requeued:
+                    logger.info(f"[{self.name}] Job {row['id']} was interrupted and is queued again")
+        with self._condition:
+            self._condition.notify_all()
+
+    def _purge(self) -> None:
+        now = time.time()
+        if now - self._last_purge < 600:
+            return
+        self._last_purge = now
+        try:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM jobs WHERE queue = ? AND status IN (?, ?) AND finished_at < ?',
+                                   (self.name, SUCCEEDED, FAILED, now - job_queue_retention))
+        except sqlite3.Error as e:
+            logger.warning(f"[{self.name}] Could not delete old jobs: {e}")
+        try:
+            # Picks up the jobs of a process sharing the database that died since start().
+            self._requeue_orphans()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"[{self.name}] Could not requeue interrupted jobs: {e}")
+
+    def _notify(self, job: dict) -> None:
+        # Best effort: the job's status stays available through get().
+        request = urllib.request.Request(job['callback_url'], data=json.dumps(job).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=job_callback_timeout) as response:
+                logger.info(f"[{self.name}] Callback for job {job['id']} answered {response.status}")
+        except Exception as e:
+            logger.warning(f"[{self.name}] Callback for job {job['id']} to '{job['callback_url']}' failed: {e}")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation, since sqlite3 connections are not shared
+        # between threads. Statements commit on their own (autocommit) unless
+        # run inside an explicit BEGIN, which is rolled back on an error.
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+
+def check_callback_url(url: str) -> None:
+    '''
+    Raises ValueError unless url is http(s) on one of job_callback_hosts.
+    '''
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ('http', 'https') or parsed.hostname not in job_callback_hosts:
+        raise ValueError(f"Callback URL must be http(s) on one of {', '.join(job_callback_hosts)}: '{url}'")
+
+
+def _job(row: sqlite3.Row) -> dict:
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'payload': json.loads(row['payload']),
+        'result': json.loads(row['result']) if row['result'] is not None else None,
+        'error': row['error'],
+        'callback_url': row['callback_url'],
+        'created_at': row['created_at'],
+        'started_at': row['started_at'],
+        'finished_at': row['finished_at'],
+    }
+
+
+def _owner_lock_path(db_path: str, boot_id: str) -> str:
+    return os.path.join(os.path.abspath(db_path) + '.owners', f'{boot_id}.lock')
+
+
+def _try_lock(file) -> bool:
+    # Non-blocking exclusive lock on an open file; False if another process holds it.
+    try:
+        if os.name == 'nt':
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _hold_owner_lock(db_path: str) -> None:
+    # Locks this process's owner file for the database until the process exits.
+    path = _owner_lock_path(db_path, BOOT_ID)
+    with _owner_locks_lock:
+        if path in _owner_locks:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = open(path, 'a+b')
+        if not _try_lock(file):
+            file.close()
+            raise RuntimeError(f"Owner lock '{path}' is held by another process")
+        _owner_locks[path] = file
+    # Removes the lock files that processes which have exited left behind.
+    for name in os.listdir(os.path.dirname(path)):
+        boot_id, extension = os.path.splitext(name)
+        if extension == '.lock' and boot_id != BOOT_ID:
+            _owner_alive(db_path, boot_id)
+
+
+def _owner_alive(db_path: str, boot_id: str) -> bool:
+    # A process holds its owner lock while it lives. A free lock, or none at
+    # all, means the owner is gone; its lock file is removed then.
+    if not boot_id:
+        return False
+    path = _owner_lock_path(db_path, boot_id)
+    try:
+        file = open(path, 'r+b')
+    except FileNotFoundError:
+        return False
+    try:
+        if not _try_lock(file):
+            return True
+    finally:
+        file.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return False
@@ -2,24 +2,67 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from scripts.conversion_pdf import convert_docx_to_pdf
-from scripts.terminate_active_COM import terminate_active_processes
+from common.office_backend import check_office_backend
+from common.job_queue import FAILED, SUCCEEDED, JobQueue, job_wait_timeout
 from common.logs import logger
-from typing import Dict, Union
+from common.workspace import ScratchWorkspace
+from typing import Dict, Optional, Union
 
 class DocFormatCheck(BaseModel):
     file_path: str
 
+class ConversionJob(BaseModel):
+    file_path: str
+    # Local URL that receives the finished job as JSON (see common/job_queue.py)
+    callback_url: Optional[str] = None
+
 app = FastAPI()
 
+
+def run_conversion(payload: dict) -> dict:
+    """Job handler: converts the DOCX at payload['file_path'] and uploads the PDF"""
+    # The downloaded DOCX and converted PDF are removed once uploaded
+    with ScratchWorkspace('pdf-service') as workspace:
+        return {'s3_path': convert_docx_to_pdf(payload['file_path'], workspace)}
+
+
+# Fails the start when the office backend cannot convert on this host.
+check_office_backend()
+
+# Conversions run on job_queue_workers threads; queued jobs survive a restart.
+conversion_jobs = JobQueue('convert_to_pdf', run_conversion)
+conversion_jobs.start()
+
+
+def job_data(job: dict) -> list:
+    data = [{"type": "Job_Id", "value": job['id']}, {"type": "Status", "value": job['status']}]
+    if job['status'] == SUCCEEDED:
+        data.append({"type": "S3_Path", "value": job['result']['s3_path']})
+    elif job['status'] == FAILED:
+        data.append({"type": "Error", "value": job['error']})
+    return data
+
+
 @app.post('/convert_to_pdf')
 async def convert_docx(request: DocFormatCheck):
     try:
         logger.info(str(f'Starting conversion ')+'[convert_docx] [controllers/module_controller.py:16]')
-        terminate_active_processes()
         document = request.file_path
         
         if document.endswith('.docx'):
-            path = convert_docx_to_pdf(document)
+            # Runs as a job and waits for it, so that conversions stay bounded by the job workers
+            job_id = conversion_jobs.submit({'file_path': document})
+            job = await conversion_jobs.wait_async(job_id, job_wait_timeout)
+            if job['status'] not in (SUCCEEDED, FAILED):
+                # Only with job_wait_timeout set: the job goes on and its result is read from /convert_to_pdf/jobs/{job_id}
+                logger.warning(f'Conversion job {job_id} still {job["status"]} after {job_wait_timeout:g}s [convert_docx] [controllers/module_controller.py]')
+                return JSONResponse({
+                    "message": f"Conversion is taking longer than {job_wait_timeout:g}s, check the job for its result.",
+                    "data": job_data(job),
+                }, status_code=202)
+            if job['status'] == FAILED:
+                raise Exception(job['error'])
+            path = job['result']['s3_path']
         else:
             raise Exception("File type not supported.")
         
@@ -37,4 +80,38 @@ async def convert_docx(request: DocFormatCheck):
         return JSONResponse({
             "message": f"Document conversion failed - {str(e)}.",
             "data": []
-        }, status_code=500)
\ No newline at end of file
+        }, status_code=500)
+
+
+@app.post('/convert_to_pdf/jobs')
+async def submit_conversion(request: ConversionJob):
+    try:
+        if not request.file_path.endswith('.docx'):
+            raise ValueError("File type not supported.")
+        job_id = conversion_jobs.submit({'file_path': request.file_path}, request.callback_url)
+    except ValueError as e:
+        logger.error(str(f'{e}')+' [submit_conversion] [controllers/module_controller.py]')
+        return JSONResponse({
+            "message": f"Conversion job rejected - {str(e)}.",
+            "data": []
+        }, status_code=400)
+
+    return JSONResponse({
+        "message": "Conversion job queued.",
+        "data": job_data(conversion_jobs.get(job_id)),
+    }, status_code=202)
+
+
+@app.get('/convert_to_pdf/jobs/{job_id}')
+async def conversion_status(job_id: str):
+    job = conversion_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "message": f"Conversion job {job_id} not found.",
+            "data": []
+        }, status_code=404)
+
+    return JSONResponse({
+        "message": f"Conversion job {job['status']}.",
+        "data": job_data(job),
+    }, status_code=200)
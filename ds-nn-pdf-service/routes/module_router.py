@@ -1,6 +1,8 @@
 from fastapi import APIRouter
-from controllers.module_controller import convert_docx
+from controllers.module_controller import convert_docx, conversion_status, submit_conversion
 
 router = APIRouter()
 
-router.post("/convert_to_pdf")(convert_docx)
\ No newline at end of file
+router.post("/convert_to_pdf")(convert_docx)
+router.post("/convert_to_pdf/jobs")(submit_conversion)
+router.get("/convert_to_pdf/jobs/{job_id}")(conversion_status)
\ No newline at end of file